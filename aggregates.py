@@ -0,0 +1,228 @@
+# Materialized coverage aggregates
+#
+# Due and given dose counts per due day, per (residence, due day) and per
+# (vaccine, dose, due day), kept in step with the doses table by triggers, so
+# registration, tracking and migrations maintain them without extra code.
+# Counts are keyed by due date, which makes "overdue as of today" a sum over
+# past days (due - given) instead of a scan over every dose. Bulk writers use
+# paused_row_trigger() and add one grouped delta per batch instead.
+#
+#   python aggregates.py --rebuild    # backfill from the doses table
+#   python aggregates.py --check      # compare with a full recomputation
+
+import argparse
+from contextlib import contextmanager
+from datetime import date, timedelta
+
+from profiling import timed
+
+# (table, key columns, key expressions); {d} is the dose row, {residence} the
+# child's residence
+TABLES = (
+    ("coverage_daily", ("day",), ("{d}.due_date",)),
+    ("coverage_residence", ("residence", "day"), ("{residence}", "{d}.due_date")),
+    ("coverage_vaccine", ("vaccine", "dose_label", "day"), ("{d}.vaccine", "{d}.dose_label", "{d}.due_date")),
+)
+
+UPSERT = "ON CONFLICT ({keys}) DO UPDATE SET due = due + excluded.due, given = given + excluded.given"
+
+
+def _row_delta(ref, sign):
+    # Statements adding (sign=1) or removing (sign=-1) one dose row, for triggers
+    residence = f"COALESCE((SELECT residence FROM members WHERE id = {ref}.member_id), '')"
+    statements = []
+    for table, keys, exprs in TABLES:
+        values = ", ".join(e.format(d=ref, residence=residence) for e in exprs)
+        statements.append(
+            f"INSERT INTO {table} ({', '.join(keys)}, due, given) "
+            f"VALUES ({values}, {sign}, {sign} * ({ref}.given_date IS NOT NULL)) "
+            + UPSERT.format(keys=", ".join(keys)) + ";"
+        )
+    return "\n".join(statements)
+
+
+def _set_delta(where, sign=1, tables=TABLES, residence="COALESCE(m.residence, '')"):
+    # Statements applying the grouped counts of every dose matching where
+    statements = []
+    for table, keys, exprs in tables:
+        group = ", ".join(e.format(d="d", residence=residence) for e in exprs)
+        statements.append(
+            f"INSERT INTO {table} ({', '.join(keys)}, due, given) "
+            f"SELECT {group}, {sign} * COUNT(*), {sign} * COUNT(d.given_date) "
+            f"FROM doses d LEFT JOIN members m ON m.id = d.member_id "
+            f"WHERE {where} GROUP BY {group} "
+            + UPSERT.format(keys=", ".join(keys))
+        )
+    return statements
+
+
+def _schema():
+    tables = [
+        f"CREATE TABLE IF NOT EXISTS {table} ("
+        + "".join(f"{k} TEXT NOT NULL, " for k in keys)
+        + "due INTEGER NOT NULL DEFAULT 0, given INTEGER NOT NULL DEFAULT 0, "
+        + f"PRIMARY KEY ({', '.join(keys)})) WITHOUT ROWID"
+        for table, keys, _ in TABLES
+    ]
+    residence_table = [t for t in TABLES if t[0] == "coverage_residence"]
+    move_old = ";\n".join(_set_delta("d.member_id = old.id", -1, residence_table, "COALESCE(old.residence, '')"))
+    move_new = ";\n".join(_set_delta("d.member_id = new.id", 1, residence_table, "COALESCE(new.residence, '')"))
+    triggers = [
+        f"CREATE TRIGGER IF NOT EXISTS coverage_ai AFTER INSERT ON doses BEGIN\n{_row_delta('new', 1)}\nEND",
+        f"CREATE TRIGGER IF NOT EXISTS coverage_ad AFTER DELETE ON doses BEGIN\n{_row_delta('old', -1)}\nEND",
+        "CREATE TRIGGER IF NOT EXISTS coverage_au AFTER UPDATE OF due_date, given_date ON doses "
+        "WHEN old.due_date IS NOT new.due_date OR (old.given_date IS NULL) != (new.given_date IS NULL) BEGIN\n"
+        f"{_row_delta('old', -1)}\n{_row_delta('new', 1)}\nEND",
+        "CREATE TRIGGER IF NOT EXISTS coverage_member_au AFTER UPDATE OF residence ON members "
+        "WHEN old.residence IS NOT new.residence BEGIN\n"
+        f"{move_old};\n{move_new};\nEND",
+    ]
+    return tables, triggers
+
+
+COVERAGE_TABLES, COVERAGE_TRIGGERS = _schema()
+
+
+def create_coverage_tables(conn):
+    # Returns True when the tables were just created (and backfilled)
+    exists = conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'coverage_daily'"
+    ).fetchone()
+    for ddl in COVERAGE_TABLES + COVERAGE_TRIGGERS:
+        conn.execute(ddl)
+    if exists:
+        return False
+    rebuild(conn)
+    return True
+
+
+def rebuild(conn):
+    for table, _, _ in TABLES:
+        conn.execute(f"DELETE FROM {table}")
+    for sql in _set_delta("1"):
+        conn.execute(sql)
+
+
+@contextmanager
+def paused_row_trigger(conn):
+    # For bulk dose inserts: the per-row insert trigger is dropped and the
+    # caller adds the batch's grouped counts with add_counts() instead. Like
+    # search.deferred_fts, it must run inside the caller's transaction.
+    conn.execute("DROP TRIGGER IF EXISTS coverage_ai")
+    yield
+    conn.execute(COVERAGE_TRIGGERS[0])
+
+
+def add_counts(conn, table, rows):
+    # rows: (*keys, due, given) deltas for one of TABLES
+    keys = next(k for t, k, _ in TABLES if t == table)
+    conn.executemany(
+        f"INSERT INTO {table} ({', '.join(keys)}, due, given) VALUES ({', '.join('?' * (len(keys) + 2))}) "
+        + UPSERT.format(keys=", ".join(keys)),
+        rows,
+    )
+
+
+# ============================
+# Reads
+# ============================
+@timed("query")
+def coverage_counts(conn, today=None):
+    # Same figures as doses.dose_counts(), from the per-day aggregate
+    today = today or date.today()
+    t, w = today.isoformat(), (today + timedelta(days=7)).isoformat()
+    row = conn.execute('''
+        SELECT COALESCE(SUM(CASE WHEN day = ? THEN due END), 0),
+               COALESCE(SUM(CASE WHEN day > ? AND day <= ? THEN due END), 0),
+               COALESCE(SUM(CASE WHEN day < ? THEN due - given END), 0),
+               COALESCE(SUM(given), 0)
+        FROM coverage_daily
+    ''', (t, t, w, t)).fetchone()
+    return dict(zip(("due_today", "next_7_days", "overdue", "completed"), row))
+
+
+@timed("query")
+def coverage_by(conn, group, today=None):
+    # Doses due so far, given and overdue per residence or per vaccine dose;
+    # returns (columns, rows)
+    today = (today or date.today()).isoformat()
+    keys = {"residence": ("residence",), "vaccine": ("vaccine", "dose_label")}[group]
+    cols = ", ".join(keys)
+    cur = conn.execute(f'''
+        SELECT {cols},
+               SUM(CASE WHEN day <= ? THEN due ELSE 0 END) AS due_to_date,
+               SUM(given) AS given,
+               SUM(CASE WHEN day < ? THEN due - given ELSE 0 END) AS overdue
+        FROM coverage_{group}
+        GROUP BY {cols}
+        HAVING SUM(due) > 0
+        ORDER BY {cols}
+    ''', (today, today))
+    return [c[0] for c in cur.description], cur.fetchall()
+
+
+@timed("query")
+def monthly_coverage(conn):
+    # (month, due, given) by due month, for the trends chart
+    return conn.execute('''
+        SELECT substr(day, 1, 7) AS month, SUM(due), SUM(given)
+        FROM coverage_daily GROUP BY month HAVING SUM(due) > 0 ORDER BY month
+    ''').fetchall()
+
+
+# ============================
+# Consistency Check
+# ============================
+def check_consistency(conn):
+    # Compares every aggregate with a recomputation from doses; returns a list
+    # of (table, key, stored (due, given), expected (due, given)) mismatches
+    mismatches = []
+    for table, keys, exprs in TABLES:
+        group = ", ".join(e.format(d="d", residence="COALESCE(m.residence, '')") for e in exprs)
+        expected = {
+            tuple(r[:-2]): tuple(r[-2:]) for r in conn.execute(
+                f"SELECT {group}, COUNT(*), COUNT(d.given_date) "
+                f"FROM doses d LEFT JOIN members m ON m.id = d.member_id GROUP BY {group}"
+            )
+        }
+        stored = {
+            tuple(r[:-2]): tuple(r[-2:]) for r in conn.execute(
+                f"SELECT {', '.join(keys)}, due, given FROM {table} WHERE due != 0 OR given != 0"
+            )
+        }
+        for key in expected.keys() | stored.keys():
+            if expected.get(key) != stored.get(key):
+                mismatches.append((table, key, stored.get(key), expected.get(key)))
+    return mismatches
+
+
+def main():
+    from db import connect, init_schema
+    from schedule import load_schedule
+
+    parser = argparse.ArgumentParser(description="Maintain the coverage aggregate tables.")
+    parser.add_argument("--db", default="members.db")
+    parser.add_argument("--schedule", default="kepi_schedule.json")
+    action = parser.add_mutually_exclusive_group(required=True)
+    action.add_argument("--rebuild", action="store_true", help="recompute every aggregate from doses")
+    action.add_argument("--check", action="store_true", help="compare aggregates with a full recomputation")
+    args = parser.parse_args()
+
+    conn = connect(args.db)
+    init_schema(conn, lambda: load_schedule(args.schedule).compiled())
+    if args.rebuild:
+        rebuild(conn)
+        conn.commit()
+        print("✅ Coverage aggregates rebuilt")
+        return
+    conn.commit()
+    mismatches = check_consistency(conn)
+    for table, key, stored, expected in mismatches[:20]:
+        print(f"❌ {table} {key}: stored {stored}, expected {expected}")
+    if mismatches:
+        raise SystemExit(f"{len(mismatches)} mismatch(es); run with --rebuild")
+    print("✅ Coverage aggregates match the doses table")
+
+
+if __name__ == "__main__":
+    main()
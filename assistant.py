@@ -0,0 +1,243 @@
+# Vaccine assistant engine
+#
+# vaccine_info.json is tokenized once into an inverted index over vaccine
+# names, synonyms, "Protects Against", side effects and special
+# considerations. Questions are ranked with BM25 (field-weighted term
+# frequencies), unknown words are matched to the vocabulary within one edit
+# (symmetric-delete lookup), and each vaccine's answer sections are rendered to
+# markdown ahead of time. get_engine() keeps one engine per file and rebuilds
+# it only when the JSON changes on disk.
+
+import json
+import math
+import os
+import re
+import threading
+from collections import Counter, defaultdict
+
+from profiling import timed
+
+SYNONYMS = {
+    "BCG": ["bacille calmette guerin", "tuberculosis", "tb"],
+    "OPV": ["oral polio", "polio drops", "polio"],
+    "Rotavirus": ["rota", "diarrhea", "diarrhoea"],
+    "Pneumo_conj": ["pneumococcal", "pneumonia", "pcv", "pneumo"],
+    "DTwPHibHepB": ["pentavalent", "penta", "dtp", "diphtheria", "tetanus", "pertussis",
+                    "whooping cough", "hib", "hepatitis b", "hepb"],
+    "IPV": ["inactivated polio", "polio injection"],
+    "Yellow Fever": ["yf"],
+    "Measles": ["mr", "mmr", "rubella", "mumps"],
+    "HPV": ["human papillomavirus", "papilloma", "cervical cancer"],
+}
+
+# Field weights: a hit in the name counts far more than one in the notes
+FIELDS = (
+    ("name", 4.0),
+    ("synonyms", 3.0),
+    ("Protects Against", 1.5),
+    ("Common Side Effects", 1.0),
+    ("Special Considerations", 1.0),
+    ("Type", 0.5),
+    ("Route", 0.5),
+)
+
+# Words that pick the section of the answer to show
+INTENTS = (
+    ("side_effects", {"side", "effect", "reaction", "swelling", "safe"}),
+    ("protects", {"protect", "prevent", "against", "cause", "disease"}),
+    ("schedule", {"when", "age", "schedule", "dose", "week", "month", "year", "old", "time"}),
+    ("route", {"route", "how", "given", "injection", "administered"}),
+    ("considerations", {"contraindicated", "avoid", "note", "consideration", "precaution", "who", "not"}),
+)
+
+STOPWORDS = {
+    "a", "an", "the", "me", "about", "tell", "what", "does", "do", "is", "are", "of", "to", "in",
+    "and", "or", "it", "i", "my", "can", "should", "vaccine", "vaccines", "vaccination", "please",
+    "info", "information", "give", "which", "with", "on", "at", "be", "child", "baby", "kid",
+    # question words that only select the answer section (see INTENTS)
+    "when", "how", "who", "where", "why", "given", "get", "not", "for", "need", "old", "age",
+}
+
+K1, B = 1.2, 0.75
+MIN_SCORE = 0.5
+
+_TOKEN_RE = re.compile(r"[a-z0-9]+")
+_SUFFIXES = ("ations", "ation", "ions", "ion", "ings", "ing", "ed", "s")
+
+
+def stem(token):
+    # Deliberately crude: enough to fold "protects/protection", "cause/causes"
+    for suffix in _SUFFIXES:
+        if len(token) - len(suffix) >= 4 and token.endswith(suffix):
+            token = token[: -len(suffix)]
+            break
+    if len(token) > 4 and token.endswith("e"):
+        token = token[:-1]
+    return token
+
+
+def tokenize(text, keep_stopwords=False):
+    text = re.sub(r"([a-z])([A-Z])", r"\1 \2", str(text)).replace("_", " ").lower()
+    return [stem(t) for t in _TOKEN_RE.findall(text) if keep_stopwords or t not in STOPWORDS]
+
+
+def _deletes(term):
+    return {term[:i] + term[i + 1:] for i in range(len(term))}
+
+
+def _within_one_edit(a, b):
+    # Levenshtein distance <= 1, plus adjacent transpositions
+    if a == b:
+        return True
+    la, lb = len(a), len(b)
+    if abs(la - lb) > 1:
+        return False
+    if la == lb:
+        diff = [i for i in range(la) if a[i] != b[i]]
+        return len(diff) == 1 or (len(diff) == 2 and diff[1] == diff[0] + 1
+                                  and a[diff[0]] == b[diff[1]] and a[diff[1]] == b[diff[0]])
+    if la > lb:
+        a, b = b, a
+    return any(a == b[:i] + b[i + 1:] for i in range(len(b)))
+
+
+def _as_list(value):
+    if value is None:
+        return []
+    return value if isinstance(value, list) else [value]
+
+
+# ============================
+# Answer Fragments
+# ============================
+def render_sections(name, data):
+    def bullets(items, empty):
+        items = _as_list(items)
+        return "\n".join(f"- {i}" for i in items) if items else empty
+
+    protection = data.get("Protects Against", "N/A")
+    protects = (f"🛡 **Protects Against:**\n{bullets(protection, 'N/A')}" if isinstance(protection, list)
+                else f"🛡 **Protects Against:** {protection}")
+    side_effects = data.get("Common Side Effects", [])
+    notes = data.get("Special Considerations", [])
+    sections = {
+        "schedule": f"📅 **Scheduled Age**: {data.get('Scheduled Age', 'N/A')}",
+        "protects": protects,
+        "type": f"🧬 **Type**: {data.get('Type', 'N/A')}",
+        "route": f"💉 **Route**: {data.get('Route', 'N/A')}",
+        "side_effects": (f"💊 **Common Side Effects:**\n{bullets(side_effects, '')}" if side_effects
+                         else "💊 No side effects listed."),
+        "considerations": (f"⚠️ **Special Considerations:**\n{bullets(notes, '')}" if notes
+                           else "⚠️ No special considerations."),
+    }
+    sections["full"] = "\n\n".join(sections[k] for k in
+                                   ("schedule", "protects", "type", "route", "side_effects", "considerations"))
+    return sections
+
+
+# ============================
+# Engine
+# ============================
+class AssistantEngine:
+    def __init__(self, vaccine_data, mtime=None):
+        self.mtime = mtime
+        self.names = list(vaccine_data)
+        self.sections = {name: render_sections(name, data) for name, data in vaccine_data.items()}
+        self.intents = [(section, {stem(c) for c in cues}) for section, cues in INTENTS]
+
+        postings = defaultdict(dict)   # term -> {doc: weighted tf}
+        lengths = []
+        for doc, name in enumerate(self.names):
+            data = vaccine_data[name]
+            tf = Counter()
+            for field, weight in FIELDS:
+                if field == "name":
+                    text = [name, name.replace("_", " ")]
+                elif field == "synonyms":
+                    text = SYNONYMS.get(name, [])
+                else:
+                    text = _as_list(data.get(field))
+                for token in tokenize(" ".join(map(str, text))):
+                    tf[token] += weight
+            for term, freq in tf.items():
+                postings[term][doc] = freq
+            lengths.append(sum(tf.values()))
+
+        n = len(self.names)
+        avg = (sum(lengths) / n) if n else 1.0
+        self.idf = {t: math.log(1 + (n - len(p) + 0.5) / (len(p) + 0.5)) for t, p in postings.items()}
+        self.postings = dict(postings)
+        self.norm = [K1 * (1 - B + B * length / avg) for length in lengths]
+
+        self.delete_index = defaultdict(set)
+        for term in self.postings:
+            self.delete_index[term].add(term)
+            for d in _deletes(term):
+                self.delete_index[d].add(term)
+
+    def expand(self, token):
+        # [(term, weight)]: the token itself, or vocabulary terms one edit away
+        if token in self.postings:
+            return [(token, 1.0)]
+        candidates = set(self.delete_index.get(token, ()))
+        for d in _deletes(token):
+            candidates |= self.delete_index.get(d, set())
+        if len(token) < 3:
+            return []
+        return [(t, 0.7) for t in candidates if _within_one_edit(token, t)]
+
+    def rank(self, question):
+        scores = defaultdict(float)
+        for token in tokenize(question):
+            for term, weight in self.expand(token):
+                idf = self.idf[term]
+                for doc, tf in self.postings[term].items():
+                    scores[doc] += weight * idf * tf * (K1 + 1) / (tf + self.norm[doc])
+        return sorted(((self.names[d], s) for d, s in scores.items()), key=lambda x: -x[1])
+
+    def intent(self, question):
+        words = set(tokenize(question, keep_stopwords=True))
+        for section, cues in self.intents:
+            if words & cues:
+                return section
+        return "full"
+
+    def answer(self, question):
+        # (vaccine, section, markdown) for the best match, or None
+        ranked = self.rank(question)
+        if not ranked or ranked[0][1] < MIN_SCORE:
+            return None
+        name = ranked[0][0]
+        section = self.intent(question)
+        return name, section, self.sections[name][section]
+
+
+# ============================
+# Loading
+# ============================
+_cache = {}
+_lock = threading.Lock()
+
+
+@timed("deserialize")
+def load_vaccine_info(path):
+    with open(path, "r") as f:
+        data = json.load(f)
+    if isinstance(data, list):
+        data = {v["name"]: v for v in data if isinstance(v, dict) and "name" in v}
+    if not isinstance(data, dict):
+        raise ValueError("vaccine_info.json must be a list of vaccine dicts or a dict.")
+    return data
+
+
+def get_engine(path="vaccine_info.json"):
+    # One engine per file for the life of the process, rebuilt on change
+    mtime = os.path.getmtime(path)
+    engine = _cache.get(path)
+    if engine is not None and engine.mtime == mtime:
+        return engine
+    with _lock:
+        engine = _cache.get(path)
+        if engine is None or engine.mtime != mtime:
+            engine = _cache[path] = AssistantEngine(load_vaccine_info(path), mtime)
+        return engine
@@ -0,0 +1,316 @@
+# PIN authentication
+#
+# PINs are stored as salted scrypt hashes ("scrypt$n$r$p$salt$hash") whose
+# cost is tunable and benchmarked in benchmarks/bench_auth.py; PBKDF2 hashes
+# are accepted too, and legacy unsalted SHA-256 hex digests are verified once
+# and upgraded on the next successful login. Only a bounded number of KDF
+# computations run at once, so a burst of logins queues instead of starving
+# the CPU. Failed attempts are throttled per email and per client IP in the
+# login_attempts table. Logged-in sessions live in an in-memory SessionCache
+# (no DB access on reruns), and "Remember Me" uses HMAC-signed tokens that
+# stop working when the PIN changes or the user logs out.
+
+import base64
+import hashlib
+import hmac
+import os
+import secrets
+import sqlite3
+import threading
+import time
+
+AUTH_SCHEMA = [
+    '''
+    CREATE TABLE IF NOT EXISTS login_attempts (
+        key TEXT PRIMARY KEY,
+        failures INTEGER NOT NULL,
+        first_failure REAL NOT NULL,
+        locked_until REAL NOT NULL DEFAULT 0
+    )
+    ''',
+    '''
+    CREATE TABLE IF NOT EXISTS secrets (
+        name TEXT PRIMARY KEY,
+        value TEXT NOT NULL
+    )
+    ''',
+    # Per-user nonce signed into remember-me tokens; deleting the row revokes
+    # every token issued to that user
+    '''
+    CREATE TABLE IF NOT EXISTS remember_nonces (
+        email TEXT PRIMARY KEY,
+        nonce TEXT NOT NULL
+    )
+    ''',
+]
+
+# scrypt N=2^14, r=8 needs 16 MB and ~50 ms per hash on a laptop
+SCRYPT_N, SCRYPT_R, SCRYPT_P = 2 ** 14, 8, 1
+PBKDF2_ITERATIONS = 600_000
+KDF_SLOTS = os.cpu_count() or 1
+
+MAX_FAILURES = 5            # per email or IP within the window
+FAILURE_WINDOW = 15 * 60    # seconds
+LOCKOUT = 15 * 60           # seconds
+
+SESSION_TTL = 12 * 3600
+REMEMBER_TTL = 30 * 24 * 3600
+SESSION_PURGE_EVERY = 600  # seconds between sweeps of expired sessions
+
+_kdf_slots = threading.BoundedSemaphore(KDF_SLOTS)
+
+
+def create_auth_tables(conn):
+    for ddl in AUTH_SCHEMA:
+        conn.execute(ddl)
+
+
+def normalize_email(email):
+    # Lookups are case-insensitive (COLLATE NOCASE) so older mixed-case
+    # registrations still match
+    return (email or "").strip().lower()
+
+
+def _b64(data):
+    return base64.urlsafe_b64encode(data).decode().rstrip("=")
+
+
+def _unb64(text):
+    return base64.urlsafe_b64decode(text + "=" * (-len(text) % 4))
+
+
+# ============================
+# Hashing
+# ============================
+def hash_pin(pin, n=SCRYPT_N, r=SCRYPT_R, p=SCRYPT_P):
+    salt = os.urandom(16)
+    with _kdf_slots:
+        digest = hashlib.scrypt(pin.encode(), salt=salt, n=n, r=r, p=p, maxmem=256 * r * n + 2 ** 20)
+    return f"scrypt${n}${r}${p}${_b64(salt)}${_b64(digest)}"
+
+
+def hash_pin_pbkdf2(pin, iterations=PBKDF2_ITERATIONS):
+    salt = os.urandom(16)
+    with _kdf_slots:
+        digest = hashlib.pbkdf2_hmac("sha256", pin.encode(), salt, iterations)
+    return f"pbkdf2_sha256${iterations}${_b64(salt)}${_b64(digest)}"
+
+
+def verify_pin(pin, stored):
+    # (ok, needs_rehash); comparisons are constant-time
+    pin = pin.encode()
+    scheme = stored.split("$", 1)[0]
+    if scheme == "scrypt":
+        _, n, r, p, salt, digest = stored.split("$")
+        n, r, p = int(n), int(r), int(p)
+        with _kdf_slots:
+            actual = hashlib.scrypt(pin, salt=_unb64(salt), n=n, r=r, p=p, maxmem=256 * r * n + 2 ** 20)
+        ok = hmac.compare_digest(actual, _unb64(digest))
+        return ok, ok and (n, r, p) != (SCRYPT_N, SCRYPT_R, SCRYPT_P)
+    if scheme == "pbkdf2_sha256":
+        _, iterations, salt, digest = stored.split("$")
+        with _kdf_slots:
+            actual = hashlib.pbkdf2_hmac("sha256", pin, _unb64(salt), int(iterations))
+        ok = hmac.compare_digest(actual, _unb64(digest))
+        return ok, ok
+    # Legacy: unsalted SHA-256 hex digest
+    ok = hmac.compare_digest(hashlib.sha256(pin).hexdigest(), stored)
+    return ok, ok
+
+
+# Verified against when the email is unknown, so a miss costs the same as a
+# wrong PIN and response times do not reveal which emails are registered
+_DUMMY_HASH = None
+
+
+def _dummy_hash():
+    global _DUMMY_HASH
+    if _DUMMY_HASH is None:
+        _DUMMY_HASH = hash_pin(secrets.token_hex(8))
+    return _DUMMY_HASH
+
+
+# ============================
+# Throttling
+# ============================
+def _throttle_keys(email, ip):
+    keys = [f"email:{email}"]
+    if ip:
+        keys.append(f"ip:{ip}")
+    return keys
+
+
+def locked_for(conn, keys, now=None):
+    # Seconds until every key may try again (0 when none is locked)
+    now = now or time.time()
+    row = conn.execute(
+        f"SELECT MAX(locked_until) FROM login_attempts WHERE key IN ({', '.join('?' * len(keys))})", keys
+    ).fetchone()
+    return max(0.0, (row[0] or 0) - now)
+
+
+def record_failure(conn, keys, now=None):
+    # A failure outside the window starts a new one; the MAX_FAILURES-th
+    # failure inside it locks the key for LOCKOUT seconds
+    now = now or time.time()
+    conn.executemany('''
+        INSERT INTO login_attempts (key, failures, first_failure) VALUES (?, 1, ?)
+        ON CONFLICT(key) DO UPDATE SET
+            failures = CASE WHEN first_failure < ? THEN 1 ELSE failures + 1 END,
+            first_failure = CASE WHEN first_failure < ? THEN excluded.first_failure ELSE first_failure END
+    ''', [(k, now, now - FAILURE_WINDOW, now - FAILURE_WINDOW) for k in keys])
+    conn.execute(
+        f"UPDATE login_attempts SET locked_until = ?, failures = 0 "
+        f"WHERE key IN ({', '.join('?' * len(keys))}) AND failures >= ?",
+        [now + LOCKOUT, *keys, MAX_FAILURES],
+    )
+    # Expired entries are dropped so guessed emails do not pile up
+    conn.execute("DELETE FROM login_attempts WHERE first_failure < ? AND locked_until < ?",
+                 (now - FAILURE_WINDOW, now))
+
+
+def clear_failures(conn, email):
+    # Only the email's counter: other users behind the same IP keep theirs
+    conn.execute("DELETE FROM login_attempts WHERE key = ?", (f"email:{email}",))
+
+
+# ============================
+# Login & Registration
+# ============================
+class LoginThrottled(Exception):
+    def __init__(self, seconds):
+        super().__init__(f"Too many failed attempts, try again in {int(seconds // 60) + 1} min")
+        self.seconds = seconds
+
+
+def register_user(conn, email, pin):
+    # Raises sqlite3.IntegrityError when the email is taken
+    email = normalize_email(email)
+    if conn.execute("SELECT 1 FROM users WHERE email = ? COLLATE NOCASE", (email,)).fetchone():
+        raise sqlite3.IntegrityError("email already registered")
+    conn.execute("INSERT INTO users (email, pin) VALUES (?, ?)", (email, hash_pin(pin)))
+
+
+def authenticate(conn, email, pin, ip=None):
+    # True/False, or raises LoginThrottled without running the KDF. Commits
+    # nothing itself: the caller's transaction records the outcome.
+    email = normalize_email(email)
+    keys = _throttle_keys(email, ip)
+    wait = locked_for(conn, keys)
+    if wait:
+        raise LoginThrottled(wait)
+
+    row = conn.execute("SELECT id, pin FROM users WHERE email = ? COLLATE NOCASE", (email,)).fetchone()
+    ok, rehash = verify_pin(pin, row[1] if row else _dummy_hash())
+    ok = ok and row is not None
+    if not ok:
+        record_failure(conn, keys)
+        return False
+    # Hash before writing, so the write lock is never held across the KDF
+    new_hash = hash_pin(pin) if rehash else None
+    clear_failures(conn, email)
+    if new_hash:
+        conn.execute("UPDATE users SET pin = ? WHERE id = ?", (new_hash, row[0]))
+    return True
+
+
+# ============================
+# Sessions & Remember Me
+# ============================
+class SessionCache:
+    # token -> (email, expires); one per process, shared by all sessions
+    def __init__(self, ttl=SESSION_TTL):
+        self.ttl = ttl
+        self._sessions = {}
+        self._lock = threading.Lock()
+        self._purged = time.time()
+
+    def create(self, email):
+        # Sessions that expire unseen are only dropped here, at most every
+        # SESSION_PURGE_EVERY seconds
+        if time.time() - self._purged > SESSION_PURGE_EVERY:
+            self.purge()
+        token = secrets.token_urlsafe(32)
+        with self._lock:
+            self._sessions[token] = (email, time.time() + self.ttl)
+        return token
+
+    def get(self, token):
+        # email for a live token, else None
+        if not token:
+            return None
+        entry = self._sessions.get(token)
+        if entry is None:
+            return None
+        if entry[1] < time.time():
+            self.revoke(token)
+            return None
+        return entry[0]
+
+    def revoke(self, token):
+        with self._lock:
+            self._sessions.pop(token, None)
+
+    def purge(self):
+        now = time.time()
+        with self._lock:
+            self._purged = now
+            for token in [t for t, (_, exp) in self._sessions.items() if exp < now]:
+                del self._sessions[token]
+
+
+def signing_key(conn):
+    # AUTH_SECRET from the environment, else a random key kept in the DB so
+    # remember-me tokens survive restarts
+    env = os.environ.get("AUTH_SECRET")
+    if env:
+        return env.encode()
+    conn.execute("INSERT OR IGNORE INTO secrets (name, value) VALUES ('remember_me', ?)", (secrets.token_hex(32),))
+    return conn.execute("SELECT value FROM secrets WHERE name = 'remember_me'").fetchone()[0].encode()
+
+
+def _signature(key, email, expires, pin_hash, nonce):
+    # The stored PIN hash and the user's nonce are part of the message:
+    # changing the PIN (or the rehash on upgrade) or logging out invalidates
+    # outstanding tokens
+    message = f"{email}|{expires}|{pin_hash}|{nonce}".encode()
+    return _b64(hmac.new(key, message, hashlib.sha256).digest())
+
+
+def _remember_nonce(conn, email):
+    row = conn.execute("SELECT nonce FROM remember_nonces WHERE email = ?", (email,)).fetchone()
+    return row[0] if row else None
+
+
+def remember_token(conn, email, ttl=REMEMBER_TTL):
+    email = normalize_email(email)
+    pin_hash = conn.execute("SELECT pin FROM users WHERE email = ? COLLATE NOCASE", (email,)).fetchone()[0]
+    conn.execute("INSERT OR IGNORE INTO remember_nonces (email, nonce) VALUES (?, ?)",
+                 (email, secrets.token_hex(16)))
+    nonce = _remember_nonce(conn, email)
+    expires = int(time.time() + ttl)
+    return f"{_b64(email.encode())}.{expires}.{_signature(signing_key(conn), email, expires, pin_hash, nonce)}"
+
+
+def revoke_remember_tokens(conn, email):
+    # Every remember-me token of the user stops working, on all devices; the
+    # next "Remember Me" login starts a new nonce
+    conn.execute("DELETE FROM remember_nonces WHERE email = ?", (normalize_email(email),))
+
+
+def verify_remember_token(conn, token):
+    # The token's email if the signature, expiry, current PIN and nonce all
+    # match
+    try:
+        email_b64, expires, signature = token.split(".")
+        email, expires = _unb64(email_b64).decode(), int(expires)
+    except (ValueError, UnicodeDecodeError):
+        return None
+    if expires < time.time():
+        return None
+    row = conn.execute("SELECT pin FROM users WHERE email = ? COLLATE NOCASE", (email,)).fetchone()
+    nonce = _remember_nonce(conn, email)
+    if row is None or nonce is None:
+        return None
+    expected = _signature(signing_key(conn), email, expires, row[0], nonce)
+    return email if hmac.compare_digest(expected, signature) else None
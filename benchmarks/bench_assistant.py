@@ -0,0 +1,93 @@
+# Benchmark: vaccine assistant latency and accuracy over sample questions
+#
+#   python benchmarks/bench_assistant.py --repeat 200
+
+import argparse
+import json
+import os
+import statistics
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from assistant import AssistantEngine, get_engine
+
+VACCINE_INFO = os.path.join(ROOT, "vaccine_info.json")
+
+# (question, expected vaccine)
+QUESTIONS = [
+    ("Tell me about BCG", "BCG"),
+    ("What does HPV protect against?", "HPV"),
+    ("yellow fevr", "Yellow Fever"),
+    ("what causes tb protection", "BCG"),
+    ("side effects of measles", "Measles"),
+    ("mesles vaccine age", "Measles"),
+    ("when is the pentavalent given", "DTwPHibHepB"),
+    ("whooping cough shot", "DTwPHibHepB"),
+    ("hepatitis b", "DTwPHibHepB"),
+    ("pnemococcal vaccine", "Pneumo_conj"),
+    ("pneumonia protection", "Pneumo_conj"),
+    ("rotavirus diarrhoea", "Rotavirus"),
+    ("rota virus side effects", "Rotavirus"),
+    ("oral polio drops", "OPV"),
+    ("how is ipv administered", "IPV"),
+    ("inactivated polio injection", "IPV"),
+    ("who should not get yellow fever", "Yellow Fever"),
+    ("cervical cancer vaccine for girls", "HPV"),
+    ("human papilloma virus", "HPV"),
+    ("mmr rubella", "Measles"),
+    ("tuberclosis", "BCG"),
+    ("Tell me about Yellow Fever", "Yellow Fever"),
+]
+
+
+def legacy_answer(question):
+    # The original page: reread the JSON and substring-match names
+    with open(VACCINE_INFO, "r") as f:
+        vaccine_data = json.load(f)
+    for vax_name in vaccine_data:
+        if vax_name.lower() in question.lower():
+            return vax_name
+    return None
+
+
+def timed(fn, repeat):
+    times = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        for q, _ in QUESTIONS:
+            fn(q)
+        times.append((time.perf_counter() - t0) / len(QUESTIONS) * 1e6)
+    return statistics.median(times), max(times)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--repeat", type=int, default=200)
+    args = parser.parse_args()
+
+    with open(VACCINE_INFO) as f:
+        data = json.load(f)
+    t0 = time.perf_counter()
+    AssistantEngine(data)
+    build_ms = (time.perf_counter() - t0) * 1000
+
+    engine = get_engine(VACCINE_INFO)
+    new_hits = sum((engine.answer(q) or (None,))[0] == want for q, want in QUESTIONS)
+    old_hits = sum(legacy_answer(q) == want for q, want in QUESTIONS)
+    new_med, new_max = timed(lambda q: get_engine(VACCINE_INFO).answer(q), args.repeat)
+    old_med, old_max = timed(legacy_answer, args.repeat)
+
+    print(f"index build: {build_ms:.2f} ms  questions: {len(QUESTIONS)}")
+    print(f"engine: {new_med:7.1f} us/question (worst batch {new_max:.1f})  accuracy {new_hits}/{len(QUESTIONS)}")
+    print(f"legacy: {old_med:7.1f} us/question (worst batch {old_max:.1f})  accuracy {old_hits}/{len(QUESTIONS)}")
+    for q, want in QUESTIONS:
+        got = (engine.answer(q) or (None,))[0]
+        if got != want:
+            print(f"  miss: {q!r} -> {got} (expected {want})")
+
+
+if __name__ == "__main__":
+    main()
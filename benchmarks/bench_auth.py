@@ -0,0 +1,88 @@
+# Benchmark: PIN hashing cost and login latency under a burst
+#
+# Times one hash + verify for a few scrypt (n, r) and PBKDF2 settings, so the
+# defaults in auth.py can be picked per deployment, then fires --burst
+# concurrent logins at a temporary database and reports p50/p95 latency.
+#
+#   python benchmarks/bench_auth.py --burst 50
+
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import auth
+from db import connect, init_schema
+
+SCRYPT_SETTINGS = [(2 ** 13, 8), (2 ** 14, 8), (2 ** 15, 8)]
+PBKDF2_SETTINGS = [100_000, 300_000, 600_000]
+
+
+def timed(fn):
+    t0 = time.perf_counter()
+    fn()
+    return (time.perf_counter() - t0) * 1000
+
+
+def bench_hashing():
+    for n, r in SCRYPT_SETTINGS:
+        stored = auth.hash_pin("123456", n=n, r=r)
+        hashing = timed(lambda: auth.hash_pin("123456", n=n, r=r))
+        verify = timed(lambda: auth.verify_pin("123456", stored))
+        print(f"  scrypt n=2^{n.bit_length() - 1} r={r}:   hash {hashing:6.1f} ms   verify {verify:6.1f} ms")
+    for iterations in PBKDF2_SETTINGS:
+        stored = auth.hash_pin_pbkdf2("123456", iterations)
+        hashing = timed(lambda: auth.hash_pin_pbkdf2("123456", iterations))
+        verify = timed(lambda: auth.verify_pin("123456", stored))
+        print(f"  pbkdf2 {iterations:>7} iter: hash {hashing:6.1f} ms   verify {verify:6.1f} ms")
+
+
+def bench_burst(burst, users):
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, "members.db")
+        conn = connect(db_path)
+        init_schema(conn, lambda: None)
+        for i in range(users):
+            auth.register_user(conn, f"user{i}@example.com", "123456")
+        conn.commit()
+        conn.close()
+
+        def login(i):
+            conn = connect(db_path)
+            t0 = time.perf_counter()
+            with conn:
+                ok = auth.authenticate(conn, f"user{i % users}@example.com", "123456", ip=f"10.0.0.{i % 250}")
+            elapsed = (time.perf_counter() - t0) * 1000
+            conn.close()
+            assert ok
+            return elapsed
+
+        t0 = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=burst) as pool:
+            latencies = sorted(pool.map(login, range(burst)))
+        wall = time.perf_counter() - t0
+
+    p95 = latencies[max(0, int(len(latencies) * 0.95) - 1)]
+    print(f"  {burst} concurrent logins ({auth.KDF_SLOTS} KDF slots): "
+          f"p50 {statistics.median(latencies):6.0f} ms   p95 {p95:6.0f} ms   total {wall:.2f} s")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--burst", type=int, default=50)
+    parser.add_argument("--users", type=int, default=20)
+    args = parser.parse_args()
+    print("PIN hashing:")
+    bench_hashing()
+    print("Login burst:")
+    bench_burst(args.burst, args.users)
+
+
+if __name__ == "__main__":
+    main()
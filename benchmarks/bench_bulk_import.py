@@ -0,0 +1,69 @@
+# Benchmark: bulk CSV import throughput (target: 50k rows/s on a laptop)
+#
+# Every imported child also writes one pending row per scheduled dose, so the
+# dose insert rate is reported as well; it is usually the bottleneck.
+#
+#   python benchmarks/bench_bulk_import.py --rows 200000
+
+import argparse
+import os
+import random
+import sys
+import tempfile
+from datetime import date, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bench_search import FIRST, LAST, PLACES
+from bulk_import import import_members
+from db import connect, init_schema
+from schedule import load_schedule
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+TARGET = 50_000
+
+
+def write_registry(path, n, bad_rate=0.01, seed=7):
+    # A county-style registry with a sprinkling of bad rows
+    rng = random.Random(seed)
+    start = date.today() - timedelta(days=5 * 365)
+    with open(path, "w") as f:
+        f.write("Name,DOB,Gender,Residence,Phone\n")
+        for i in range(n):
+            dob = (start + timedelta(days=rng.randrange(5 * 365))).isoformat()
+            phone = f"07{rng.randrange(10**8):08d}"
+            if rng.random() < bad_rate:
+                dob, phone = rng.choice([("31/02/2020", phone), (dob, "12345"), ("2999-01-01", phone)])
+            f.write(f"{rng.choice(FIRST)} {rng.choice(LAST)} {i},{dob},{rng.choice('MF')},"
+                    f"{rng.choice(PLACES)},{phone}\n")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=200_000)
+    parser.add_argument("--chunk-size", type=int, default=50_000)
+    args = parser.parse_args()
+
+    compiled = load_schedule(os.path.join(ROOT, "kepi_schedule.json")).compiled()
+    with tempfile.TemporaryDirectory() as tmp:
+        csv_path = os.path.join(tmp, "registry.csv")
+        db_path = os.path.join(tmp, "members.db")
+        write_registry(csv_path, args.rows)
+        conn = connect(db_path)
+        init_schema(conn, compiled)
+        conn.commit()
+        conn.close()
+
+        result = import_members(db_path, csv_path, compiled, os.path.join(tmp, "rejects.csv"), args.chunk_size)
+
+    doses = result["inserted"] * len(compiled.keys)
+    total = result["inserted"] + result["rejected"]
+    rate = total / result["seconds"]
+    print(f"rows: {total}  imported: {result['inserted']}  rejected: {result['rejected']}")
+    print(f"time: {result['seconds']:.2f} s  throughput: {rate:,.0f} rows/s  "
+          f"({'meets' if rate >= TARGET else 'below'} {TARGET:,} rows/s target)")
+    print(f"dose rows: {doses}  ({doses / result['seconds']:,.0f} dose rows/s)")
+
+
+if __name__ == "__main__":
+    main()
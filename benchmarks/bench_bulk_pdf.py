@@ -0,0 +1,62 @@
+# Benchmark: bulk child-record PDF export throughput (documents per second)
+#
+#   python benchmarks/bench_bulk_pdf.py --members 2000 --workers 1 4
+
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+import zipfile
+from datetime import date, timedelta
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from db import connect, init_schema
+from doses import insert_doses
+from due_dates import compile_schedule
+from pdf_reports import bulk_export
+
+
+def build(path, n, seed=11):
+    rng = random.Random(seed)
+    with open(os.path.join(ROOT, "kepi_schedule.json")) as f:
+        compiled = compile_schedule(json.load(f))
+    conn = connect(path)
+    init_schema(conn, compiled)
+    today = date.today()
+    rows = [(f"Child {i}", (today - timedelta(days=rng.randint(0, 1800))).isoformat(), "Female", "Kibera", "0700000000")
+            for i in range(n)]
+    conn.executemany("INSERT INTO members (name, dob, gender, residence, phone) VALUES (?, ?, ?, ?, ?)", rows)
+    ids, dobs = zip(*conn.execute("SELECT id, dob FROM members ORDER BY id").fetchall())
+    insert_doses(conn, compiled, ids, dobs)
+    conn.commit()
+    conn.close()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--members", type=int, default=2000)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, os.cpu_count() or 1])
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, "bench.db")
+        build(db_path, args.members)
+        for workers in args.workers:
+            zip_path = os.path.join(tmp, f"records_{workers}.zip")
+            t0 = time.perf_counter()
+            written, _ = bulk_export(db_path, zip_path, residence="Kibera", workers=workers)
+            elapsed = time.perf_counter() - t0
+            with zipfile.ZipFile(zip_path) as zf:
+                assert len(zf.namelist()) == written == args.members
+            size_mb = os.path.getsize(zip_path) / 1e6
+            print(f"workers={workers:2d}  {written} docs in {elapsed:6.2f} s  "
+                  f"{written / elapsed:8.1f} docs/s  zip={size_mb:.1f} MB")
+
+
+if __name__ == "__main__":
+    main()
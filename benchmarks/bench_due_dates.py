@@ -0,0 +1,97 @@
+# Benchmark: vectorized due-date engine vs. the legacy per-row relativedelta loop
+#
+#   python benchmarks/bench_due_dates.py --children 100000
+
+import argparse
+import os
+import random
+import sys
+import time
+from datetime import date, datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from dateutil.relativedelta import relativedelta
+
+from due_dates import compile_schedule, dashboard_counts, due_date_matrix, taken_matrix
+
+KEPI_SCHEDULE = {
+    "BCG": ["0 weeks"],
+    "OPV": ["0 weeks", "6 weeks", "10 weeks", "14 weeks"],
+    "Rotavirus": ["6 weeks", "10 weeks"],
+    "Pneumo_conj": ["6 weeks", "10 weeks", "14 weeks"],
+    "DTwPHibHepB": ["6 weeks", "10 weeks", "14 weeks"],
+    "IPV": ["14 weeks"],
+    "Yellow Fever": ["9 months"],
+    "Measles": ["9 months", "18 months"],
+    # The legacy loop reads only the first token and matches "month" before
+    # "year", so it misparses "10 years 6 months" as 10 months. That dose is
+    # left out here so the comparison measures the engine, not the old bug.
+    "HPV": ["10 years"],
+}
+
+
+def synthetic_cohort(n, today, seed=42):
+    rng = random.Random(seed)
+    keys = [f"{v} - {t}" for v, times in KEPI_SCHEDULE.items() for t in times]
+    dobs, statuses = [], []
+    for _ in range(n):
+        dob = today - timedelta(days=rng.randint(0, 5 * 365))
+        dobs.append(dob.isoformat())
+        statuses.append({k: rng.random() < 0.6 for k in keys})
+    return dobs, statuses
+
+
+def legacy_counts(dobs, statuses, today):
+    upcoming7 = overdue = due_today = completed = 0
+    for dob_s, status in zip(dobs, statuses):
+        dob = datetime.strptime(dob_s, "%Y-%m-%d")
+        for v, times in KEPI_SCHEDULE.items():
+            for t in times:
+                due = dob + (
+                    relativedelta(weeks=int(t.split()[0])) if "week" in t else
+                    relativedelta(months=int(t.split()[0])) if "month" in t else
+                    relativedelta(years=int(t.split()[0]))
+                )
+                key = f"{v} - {t}"
+                if due.date() == today:
+                    due_today += 1
+                elif due.date() < today and not status.get(key):
+                    overdue += 1
+                elif today <= due.date() <= today + timedelta(days=7):
+                    upcoming7 += 1
+        completed += sum(1 for v in status.values() if v)
+    return {"due_today": due_today, "next_7_days": upcoming7, "overdue": overdue, "completed": completed}
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--children", type=int, default=100_000)
+    args = parser.parse_args()
+
+    today = date.today()
+    dobs, statuses = synthetic_cohort(args.children, today)
+
+    t0 = time.perf_counter()
+    expected = legacy_counts(dobs, statuses, today)
+    legacy_s = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    compiled = compile_schedule(KEPI_SCHEDULE)
+    due = due_date_matrix(dobs, compiled)
+    taken = taken_matrix(statuses, compiled)
+    t1 = time.perf_counter()
+    actual = dashboard_counts(due, taken, today)
+    vector_s = time.perf_counter() - t0
+
+    print(f"children:   {args.children}")
+    print(f"legacy:     {legacy_s:8.3f} s  {expected}")
+    print(f"vectorized: {vector_s:8.3f} s  {actual}  (counts only: {time.perf_counter() - t1:.4f} s)")
+    print(f"speedup:    {legacy_s / vector_s:8.1f}x")
+    if actual != expected:
+        sys.exit("❌ Counts differ from the legacy implementation")
+    print("✅ Counts match")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,53 @@
+# Benchmark: cold-start import cost of the login screen vs. the old eager imports
+#
+#   python benchmarks/bench_import.py --repeat 5
+
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# What mycode.py imports before check_pin() renders
+LOGIN = "import streamlit, sqlite3, json, os, re; import db, search, doses, auth, aggregates, reports"
+# What it used to import (and construct) before the login screen
+EAGER = (LOGIN + "; import pandas, numpy, plotly.express, fpdf, dateutil.relativedelta; "
+         "from twilio.rest import Client; Client('ACx', 'token')")
+# Each page's first-visit cost on top of the login set
+PAGES = {
+    "dashboard": "import pandas, numpy",
+    "trends": "import pandas, plotly.express",
+    "export": "import pdf_reports",
+    "members": "import pandas",
+}
+
+TIMER = "import time; t0 = time.perf_counter(); {0}; print(time.perf_counter() - t0)"
+
+
+def measure(code, repeat):
+    times = []
+    for _ in range(repeat):
+        out = subprocess.run([sys.executable, "-c", TIMER.format(code)], cwd=ROOT,
+                             capture_output=True, text=True, check=True)
+        times.append(float(out.stdout.strip().splitlines()[-1]) * 1000)
+    return statistics.median(times)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    login = measure(LOGIN, args.repeat)
+    eager = measure(EAGER, args.repeat)
+    print(f"login screen imports: {login:8.1f} ms")
+    print(f"old eager imports:    {eager:8.1f} ms  ({eager - login:.1f} ms saved at cold start)")
+    for page, code in PAGES.items():
+        page_ms = measure(f"{LOGIN}; {code}", args.repeat) - login
+        print(f"  first visit '{page}': +{page_ms:7.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,109 @@
+# Benchmark: View Members render time at 10k and 100k children
+#
+# Runs the real page with Streamlit's AppTest against a generated database in
+# a temporary copy of the app, timing the first render, a deep page reached
+# through the keyset cursor and a filtered, re-sorted view. Also times the
+# underlying member_page() query at page 1 and at the last page.
+#
+#   python benchmarks/bench_member_view.py --members 10000 100000
+
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+import warnings
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from auth import register_user
+from bench_bulk_import import write_registry
+from bulk_import import import_members
+from db import connect, init_schema
+from schedule import load_schedule
+from search import member_page
+
+APP_FILES = ("mycode.py", "kepi_schedule.json", "vaccine_info.json")
+BENCH_USER, BENCH_PIN = "bench@example.com", "123456"
+
+
+def make_app(tmp, n):
+    for name in os.listdir(ROOT):
+        if name.endswith(".py") or name in APP_FILES:
+            shutil.copy(os.path.join(ROOT, name), tmp)
+    compiled = load_schedule(os.path.join(ROOT, "kepi_schedule.json")).compiled()
+    db_path = os.path.join(tmp, "members.db")
+    conn = connect(db_path)
+    init_schema(conn, compiled)
+    register_user(conn, BENCH_USER, BENCH_PIN)
+    conn.commit()
+    conn.close()
+    csv_path = os.path.join(tmp, "registry.csv")
+    write_registry(csv_path, n, bad_rate=0)
+    import_members(db_path, csv_path, compiled)
+    return db_path
+
+
+def timed(fn):
+    t0 = time.perf_counter()
+    fn()
+    return (time.perf_counter() - t0) * 1000
+
+
+def bench(n):
+    from streamlit.testing.v1 import AppTest
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = make_app(tmp, n)
+
+        conn = connect(db_path)
+        first = timed(lambda: member_page(conn, page_size=50))
+        cursor, pages = None, 0
+        while True:
+            rows, next_cursor = member_page(conn, after=cursor, page_size=50)
+            pages += 1
+            if next_cursor is None:
+                break
+            last_cursor, cursor = cursor, next_cursor
+        last = timed(lambda: member_page(conn, after=last_cursor, page_size=50))
+        conn.close()
+
+        cwd = os.getcwd()
+        os.chdir(tmp)
+        try:
+            at = AppTest.from_file(os.path.join(tmp, "mycode.py"), default_timeout=120)
+            at.run()
+            at.sidebar.text_input[0].input(BENCH_USER)
+            at.sidebar.text_input[1].input(BENCH_PIN)
+            next(b for b in at.sidebar.button if "Login" in b.label).click().run()
+            at.run()
+            at.sidebar.radio[0].set_value("👥 View Members")
+            render = timed(at.run)
+            at.button(key="members_next").click()
+            deep = timed(at.run)
+            at.text_input(key="members_query").input("Kisumu")
+            at.selectbox(key="members_sort").set_value("dob")
+            filtered = timed(at.run)
+            assert not at.exception, at.exception
+        finally:
+            os.chdir(cwd)
+
+    print(f"members: {n:>7}  pages of 50: {pages}")
+    print(f"  member_page(): first {first:6.2f} ms   last {last:6.2f} ms")
+    print(f"  page render:   first {render:6.0f} ms   after Next {deep:6.0f} ms   filtered+sorted {filtered:6.0f} ms")
+
+
+def main():
+    warnings.filterwarnings("ignore")
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--members", type=int, nargs="+", default=[10_000, 100_000])
+    args = parser.parse_args()
+    for n in args.members:
+        bench(n)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+# Benchmark: SMS reminder job against the local fake Twilio endpoint
+#
+#   python benchmarks/bench_reminders.py --children 100000 --rate 5000
+
+import argparse
+import asyncio
+import json
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+from datetime import date, timedelta
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from db import connect, init_schema
+from doses import insert_doses
+from due_dates import compile_schedule
+from reminders import run_reminders, twilio_client, twilio_sender
+import fake_twilio
+
+
+def build(path, n):
+    # Every child is exactly 6 weeks old in two days: four doses, one message
+    with open(os.path.join(ROOT, "kepi_schedule.json")) as f:
+        compiled = compile_schedule(json.load(f))
+    conn = connect(path)
+    init_schema(conn, compiled)
+    dob = (date.today() + timedelta(days=2) - timedelta(weeks=6)).isoformat()
+    conn.executemany(
+        "INSERT INTO members (name, dob, gender, residence, phone) VALUES (?, ?, ?, ?, ?)",
+        ((f"Child {i}", dob, "Male", "Kisumu", f"07{i:08d}") for i in range(n)),
+    )
+    ids = [r[0] for r in conn.execute("SELECT id FROM members ORDER BY id")]
+    insert_doses(conn, compiled, ids, [dob] * len(ids))
+    conn.commit()
+    conn.close()
+
+
+async def bench(db_path, args):
+    app, runner = await fake_twilio.start(args.port, args.fail_rate, seed=1)
+    client = twilio_client("ACbench", "token", f"http://127.0.0.1:{args.port}")
+    try:
+        t0 = time.perf_counter()
+        summary = await run_reminders(db_path, days=3, send=twilio_sender(client, "+15550000000"),
+                                      rate=args.rate, workers=args.workers, base_delay=0.01)
+        elapsed = time.perf_counter() - t0
+        # A second run must not text anyone again
+        repeat = await run_reminders(db_path, days=3, send=twilio_sender(client, "+15550000000"),
+                                     rate=args.rate, workers=args.workers, base_delay=0.01)
+    finally:
+        await client.http_client.close()
+        await runner.cleanup()
+    return summary, repeat, elapsed, len(app["received"])
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--children", type=int, default=10_000)
+    parser.add_argument("--rate", type=float, default=5000)
+    parser.add_argument("--workers", type=int, default=64)
+    parser.add_argument("--fail-rate", type=float, default=0.02)
+    parser.add_argument("--port", type=int, default=8099)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, "bench.db")
+        build(db_path, args.children)
+        summary, repeat, elapsed, received = asyncio.run(bench(db_path, args))
+        conn = sqlite3.connect(db_path)
+        statuses = dict(conn.execute("SELECT status, COUNT(*) FROM reminders GROUP BY status").fetchall())
+        conn.close()
+
+    print(f"children: {args.children}  sent: {summary['sent']}  failed: {summary['failed']}  "
+          f"in {elapsed:.1f} s ({summary['sent'] / elapsed:.0f} msg/s)")
+    print(f"fake endpoint received: {received}  dose rows by status: {statuses}")
+    print(f"second run: {repeat}")
+    if repeat["sent"] or received != summary["sent"]:
+        sys.exit("❌ Guardians were texted more than once")
+    print("✅ No duplicate messages")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,62 @@
+# Benchmark: indexed child lookup (FTS5 trigram + prefix indexes)
+#
+#   python benchmarks/bench_search.py --members 100000
+
+import argparse
+import os
+import random
+import sqlite3
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from db import SCHEMA
+from search import create_search_index, search_members
+
+FIRST = ["Amani", "Baraka", "Chacha", "Wanjiru", "Akinyi", "Otieno", "Njeri", "Kiprop", "Auma", "Mwangi",
+         "Zawadi", "Imani", "Juma", "Achieng", "Kamau", "Nafula", "Wekesa", "Chebet", "Muthoni", "Odhiambo"]
+LAST = ["Kariuki", "Omondi", "Mutua", "Wambui", "Kiptoo", "Nyambura", "Ochieng", "Cherono", "Maina", "Were"]
+PLACES = ["Githunguri", "Kibera", "Kisumu", "Eldoret", "Nakuru", "Thika", "Machakos", "Kakamega", "Nyeri", "Kitui"]
+
+
+def build(n, seed=7):
+    rng = random.Random(seed)
+    conn = sqlite3.connect(":memory:")
+    for ddl in SCHEMA:
+        conn.execute(ddl)
+    conn.executemany(
+        "INSERT INTO members (name, dob, gender, residence, phone) VALUES (?, ?, ?, ?, ?)",
+        (
+            (f"{rng.choice(FIRST)} {rng.choice(LAST)} {i}", "2024-01-01", "Female",
+             rng.choice(PLACES), f"07{rng.randrange(10**8):08d}")
+            for i in range(n)
+        ),
+    )
+    t0 = time.perf_counter()
+    create_search_index(conn)
+    return conn, time.perf_counter() - t0
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--members", type=int, default=100_000)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    conn, build_s = build(args.members)
+    print(f"members: {args.members}  index build: {build_s:.2f} s")
+
+    queries = ["", "ch", "07", "Chacha Omondi 12", "Omondi 4711", "kisum", "0712", "nonexistent name"]
+    for q in queries:
+        times = []
+        for _ in range(args.repeat):
+            t0 = time.perf_counter()
+            rows, total = search_members(conn, q, page=0)
+            times.append((time.perf_counter() - t0) * 1000)
+        print(f"{q!r:22} total={total:7d}  median={statistics.median(times):7.2f} ms  max={max(times):7.2f} ms")
+
+
+if __name__ == "__main__":
+    main()
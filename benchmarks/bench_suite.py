@@ -0,0 +1,339 @@
+# Benchmark suite: the app's hot paths against synthetic cohorts
+#
+# Runs each microbenchmark against the deterministic cohort from cohort.py
+# (generated once per size and cached) and writes the timings to
+# benchmarks/results/ as JSON, so runs before and after a change can be
+# compared. Nothing here needs the network or a running Streamlit server.
+#
+#   python benchmarks/bench_suite.py --size 10k 100k
+#   python benchmarks/bench_suite.py --size 100k --only dashboard pdf
+#   python benchmarks/bench_suite.py --size 100k --compare benchmarks/results/<earlier run>.json
+
+import argparse
+import json
+import os
+import platform
+import random
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from contextlib import closing
+from datetime import datetime
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from cohort import GENERATOR_VERSION, SEED, TODAY, cohort_db, parse_size
+from db import connect
+
+RESULTS_DIR = os.path.join(ROOT, "benchmarks", "results")
+SUITE_VERSION = 1
+SLOWER = 1.2   # --compare flags benchmarks this much slower than the baseline
+
+SEARCHES = ["Amani", "Kisumu", "0712", "Wanjiru Kariuki", "Nyeri", "Otieno 4"]
+QUESTIONS = ["Tell me about BCG", "What does HPV protect against?", "side effects of yellow fevr",
+             "when is measles given", "rotavirus route", "is OPV safe for newborns"]
+
+
+# ============================
+# Microbenchmarks
+# ============================
+# Each takes the shared context and returns a zero-argument callable that
+# runs one sample; "calls" is how many operations one sample performs.
+BENCHMARKS = {}
+
+
+def benchmark(name, group, calls=1):
+    def register(setup):
+        BENCHMARKS[name] = (group, calls, setup)
+        return setup
+    return register
+
+
+@benchmark("dashboard.summary", "dashboard")
+def _dashboard_summary(ctx):
+    from reports import dashboard_summary
+    return lambda: dashboard_summary(ctx["conn"], TODAY)
+
+
+@benchmark("dashboard.coverage_tables", "dashboard")
+def _coverage_tables(ctx):
+    from aggregates import coverage_by
+    return lambda: (coverage_by(ctx["conn"], "vaccine", TODAY), coverage_by(ctx["conn"], "residence", TODAY))
+
+
+@benchmark("dashboard.overdue_one_dose", "dashboard")
+def _overdue_one_dose(ctx):
+    from doses import overdue_members
+    return lambda: overdue_members(ctx["conn"], "OPV", "6 weeks", TODAY)
+
+
+@benchmark("dashboard.counts_from_doses", "dashboard")
+def _counts_from_doses(ctx):
+    # The unaggregated scan the coverage tables replaced, kept for reference
+    from doses import dose_counts
+    return lambda: dose_counts(ctx["conn"], TODAY)
+
+
+@benchmark("dashboard.counts_from_store", "dashboard")
+def _store_counts(ctx):
+    # The same figures from the in-memory cohort store (built in setup)
+    from cohort_store import CohortStore
+    store = CohortStore()
+    store.counts(ctx["conn"], ctx["compiled"], TODAY)
+    return lambda: store.counts(ctx["conn"], ctx["compiled"], TODAY)
+
+
+@benchmark("dashboard.overdue_from_store", "dashboard")
+def _store_overdue_one_dose(ctx):
+    # What the dashboard's Overdue by Dose list runs
+    from cohort_store import CohortStore
+    store = CohortStore()
+    return lambda: store.overdue_members(ctx["conn"], ctx["compiled"], "OPV - 6 weeks", TODAY)
+
+
+@benchmark("dashboard.outreach_week", "dashboard")
+def _outreach_week(ctx):
+    # Children whose next dose is due in the coming week, first page + count
+    from datetime import timedelta
+    from next_due import count_between, due_between
+    end = TODAY + timedelta(days=7)
+    return lambda: (count_between(ctx["conn"], TODAY, end), due_between(ctx["conn"], TODAY, end))
+
+
+@benchmark("dashboard.overdue_residence", "dashboard")
+def _overdue_residence(ctx):
+    from next_due import overdue_children
+    return lambda: overdue_children(ctx["conn"], TODAY, "Kisumu")
+
+
+@benchmark("tracker.search_child", "tracker", calls=len(SEARCHES))
+def _search_child(ctx):
+    from search import search_members
+    return lambda: [search_members(ctx["conn"], q, 0, 25) for q in SEARCHES]
+
+
+@benchmark("tracker.child_doses", "tracker", calls=100)
+def _child_doses(ctx):
+    # The Vaccination Status checklist for 100 children: dose rows + labels
+    from doses import member_doses
+
+    def run():
+        for member_id in ctx["sample_ids"]:
+            [f"{v} ({t}) - Due {due}" for _, v, t, due, _, _ in member_doses(ctx["conn"], member_id)]
+    return run
+
+
+@benchmark("tracker.due_date_matrix", "tracker")
+def _due_date_matrix(ctx):
+    from due_dates import due_date_matrix
+    return lambda: due_date_matrix(ctx["dobs"], ctx["compiled"])
+
+
+@benchmark("tracker.mixed_due_dates", "tracker")
+def _mixed_due_dates(ctx):
+    # The same cohort split over two schedules (the second drops every other
+    # dose), through the union table and the per-DOB dedupe
+    import numpy as np
+    from due_dates import as_tables, mixed_due_date_matrix
+
+    tables = as_tables(ctx["compiled"])
+    keep = np.arange(len(ctx["compiled"].keys)) % 2 == 0
+    tables = tables._replace(names=("kepi", "half"), member=np.vstack([tables.member, keep]))
+    index = np.arange(len(ctx["dobs"])) % 2
+    return lambda: mixed_due_date_matrix(ctx["dobs"], index, tables)
+
+
+@benchmark("members.cohort_store_build", "members")
+def _cohort_store_build(ctx):
+    from cohort_store import CohortStore
+    return lambda: CohortStore().counts(ctx["conn"], ctx["compiled"], TODAY)
+
+
+@benchmark("members.first_page", "members")
+def _first_page(ctx):
+    from search import member_page
+    return lambda: member_page(ctx["conn"], sort="name", page_size=50)
+
+
+@benchmark("members.deep_page_filtered", "members")
+def _deep_page(ctx):
+    # Page 20 of one residence sorted by date of birth, via the keyset cursor
+    from search import member_page
+    after = None
+    for _ in range(19):
+        _, cursor = member_page(ctx["conn"], residence="Kisumu", sort="dob", after=after, page_size=50)
+        after = cursor or after
+    return lambda: member_page(ctx["conn"], residence="Kisumu", sort="dob", after=after, page_size=50)
+
+
+@benchmark("pdf.child_record", "pdf", calls=20)
+def _child_record(ctx):
+    from doses import dose_status
+    from pdf_reports import child_record_pdf
+    from search import member_by_id
+
+    def run():
+        for member_id in ctx["sample_ids"][:20]:
+            child_record_pdf(member_by_id(ctx["conn"], member_id), dose_status(ctx["conn"], member_id))
+    return run
+
+
+@benchmark("pdf.bulk_500", "pdf", calls=500)
+def _bulk_pdf(ctx):
+    from pdf_reports import export_shard
+    zip_path = os.path.join(ctx["tmp"], "records.zip")
+    return lambda: export_shard(ctx["db_path"], zip_path, (0, 500))
+
+
+@benchmark("assistant.answer", "assistant", calls=len(QUESTIONS))
+def _assistant_answer(ctx):
+    from assistant import get_engine
+    engine = get_engine(os.path.join(ROOT, "vaccine_info.json"))
+    return lambda: [engine.answer(q) for q in QUESTIONS]
+
+
+@benchmark("assistant.build_index", "assistant")
+def _assistant_build(ctx):
+    from assistant import AssistantEngine, load_vaccine_info
+    data = load_vaccine_info(os.path.join(ROOT, "vaccine_info.json"))
+    return lambda: AssistantEngine(data)
+
+
+@benchmark("reactions.rates", "reactions", calls=3)
+def _reaction_rates(ctx):
+    from reactions import RATE_GROUPS, reaction_rates
+    return lambda: [reaction_rates(ctx["conn"], g) for g in RATE_GROUPS]
+
+
+# ============================
+# Runner
+# ============================
+def measure(fn, repeat, min_time=0.2):
+    # Warm once, then at least `repeat` samples (more while under min_time)
+    fn()
+    samples = []
+    started = time.perf_counter()
+    while len(samples) < repeat or (time.perf_counter() - started < min_time and len(samples) < 100):
+        t0 = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - t0) * 1000)
+    return samples
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_size(children, names, repeat):
+    from schedule import load_schedule
+
+    t0 = time.perf_counter()
+    cached = cohort_db(children, progress=lambda done, total: print(
+        f"\r   generating cohort: {done}/{total} children", end="", file=sys.stderr))
+    print(f"\r   cohort ready in {time.perf_counter() - t0:.1f} s".ljust(60), file=sys.stderr)
+
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        # Benchmarks run on a copy, so the cached cohort is never modified
+        db_path = os.path.join(tmp, "members.db")
+        shutil.copy(cached, db_path)
+        with closing(connect(db_path)) as conn:
+            rng = random.Random(SEED)
+            ctx = {
+                "conn": conn, "db_path": db_path, "tmp": tmp,
+                "compiled": load_schedule(os.path.join(ROOT, "kepi_schedule.json")).compiled(),
+                "dobs": [r[0] for r in conn.execute("SELECT dob FROM members ORDER BY id")],
+                "sample_ids": rng.sample(range(1, children + 1), min(100, children)),
+            }
+            for name in names:
+                group, calls, setup = BENCHMARKS[name]
+                samples = measure(setup(ctx), repeat)
+                median = statistics.median(samples)
+                results[name] = {
+                    "group": group, "calls": calls, "samples": len(samples),
+                    "median_ms": round(median, 3), "min_ms": round(min(samples), 3),
+                    "max_ms": round(max(samples), 3), "per_call_ms": round(median / calls, 4),
+                }
+                print(f"   {name:<30} median {median:10.2f} ms   min {min(samples):10.2f} ms"
+                      f"   ({len(samples)} samples)")
+    return results
+
+
+def compare(results, baseline_path):
+    with open(baseline_path) as f:
+        baseline = json.load(f)
+    print(f"\nCompared with {baseline_path} ({baseline.get('git_commit')}, {baseline.get('timestamp')}):")
+    if baseline.get("generator_version") != GENERATOR_VERSION:
+        print("   ⚠️ the baseline used a different cohort generator; timings may not be comparable")
+    matched = 0
+    for size, benches in results.items():
+        old = baseline.get("sizes", {}).get(size, {})
+        for name, now in benches.items():
+            if name not in old:
+                continue
+            matched += 1
+            ratio = now["median_ms"] / old[name]["median_ms"] if old[name]["median_ms"] else float("inf")
+            flag = "⚠️ slower" if ratio >= SLOWER else ("✅ faster" if ratio <= 1 / SLOWER else "")
+            print(f"   {size:>8} {name:<30} {old[name]['median_ms']:10.2f} -> {now['median_ms']:10.2f} ms"
+                  f"   x{ratio:5.2f} {flag}")
+    if not matched:
+        print("   no benchmark ran at the same size in both runs")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the app's hot paths on synthetic cohorts.")
+    parser.add_argument("--size", nargs="+", default=["10k"], help="10k, 100k, 1m or a number of children")
+    parser.add_argument("--only", nargs="+", help="benchmark names or groups (e.g. dashboard pdf)")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--out", help="results file (default: benchmarks/results/<time>-<commit>.json)")
+    parser.add_argument("--compare", help="earlier results file to compare against")
+    parser.add_argument("--list", action="store_true", help="list the benchmarks and exit")
+    args = parser.parse_args()
+
+    if args.list:
+        for name, (group, _, _) in BENCHMARKS.items():
+            print(f"{group:<10} {name}")
+        return
+    names = [n for n, (group, _, _) in BENCHMARKS.items()
+             if not args.only or n in args.only or group in args.only]
+
+    results = {}
+    for size in args.size:
+        children = parse_size(size)
+        print(f"👶 {children} children", file=sys.stderr)
+        results[str(children)] = run_size(children, names, args.repeat)
+
+    commit = git_commit()
+    report = {
+        "suite_version": SUITE_VERSION,
+        "generator_version": GENERATOR_VERSION,
+        "seed": SEED,
+        "as_of": TODAY.isoformat(),
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "git_commit": commit,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "sizes": results,
+    }
+    out = args.out or os.path.join(RESULTS_DIR, f"{datetime.now():%Y%m%d-%H%M%S}-{commit or 'nogit'}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(out)), exist_ok=True)
+    with open(out, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"✅ Results written to {out}")
+
+    if args.compare:
+        compare(results, args.compare)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,194 @@
+# Deterministic synthetic cohort for benchmarks
+#
+# Builds a members.db with children, one dose row per scheduled dose and a
+# sprinkling of reactions. The same (children, seed) always yields the same
+# database: everything is drawn from one seeded NumPy generator and dated
+# relative to a fixed TODAY instead of the clock.
+#
+#   - Dates of birth: most children are under five, weighted towards infants
+#     (registries enrol at birth); about 12% are 5-12 years old, the HPV age.
+#   - Dose states: each child has a completion propensity; doses due before
+#     TODAY are given with that probability, less often for later doses, a
+#     few days to weeks after the due date.
+#   - Reactions: ~4 per 1,000 given doses, logged with the vaccine name
+#     spelled the way clinics type it.
+#
+# Databases are cached under benchmarks/.cache, so only the first run at a
+# size pays for generation (about 45 s for 100k children, several minutes
+# for 1M).
+#
+#   python benchmarks/cohort.py --children 100000 --out cohort_100k.db
+
+import argparse
+import os
+import shutil
+import sys
+import time
+from datetime import date
+
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from aggregates import paused_row_trigger, rebuild
+from bench_search import FIRST, LAST, PLACES
+from db import connect, init_schema
+from doses import INSERT_DOSE
+from due_dates import due_date_matrix
+from next_due import paused_insert_trigger, refresh as refresh_next_due
+from reactions import normalize_reactions, vaccine_lookup
+from schedule import load_schedule
+from search import deferred_fts
+
+GENERATOR_VERSION = 3
+SEED = 2024
+TODAY = date(2025, 1, 1)
+SIZES = {"10k": 10_000, "100k": 100_000, "1m": 1_000_000}
+CACHE_DIR = os.path.join(ROOT, "benchmarks", ".cache")
+CHUNK = 50_000
+
+REACTION_RATE = 0.004
+REACTION_NOTES = ["Mild fever", "Swelling at injection site", "Irritable for a day", "Rash", "Loss of appetite"]
+# Spellings seen in reaction logs, per schedule vaccine
+SPELLINGS = {
+    "BCG": ["BCG", "bcg"],
+    "OPV": ["OPV", "opv", "Polio", "oral polio"],
+    "Rotavirus": ["Rotavirus", "rota", "Rotarix"],
+    "Pneumo_conj": ["PCV10", "pcv", "Pneumococcal"],
+    "DTwPHibHepB": ["Penta", "pentavalent", "DPT"],
+    "IPV": ["IPV", "ipv"],
+    "Yellow Fever": ["Yellow Fever", "yellow fever", "YF"],
+    "Measles": ["Measles", "MR", "measles rubella"],
+    "HPV": ["HPV", "hpv"],
+}
+
+
+def birth_ages(rng, n):
+    # Age in days on TODAY
+    kind = rng.random(n)
+    infants = rng.triangular(0, 0, 5 * 365, n)
+    under_five = rng.uniform(0, 5 * 365, n)
+    older = rng.uniform(5 * 365, 12 * 365, n)
+    return np.where(kind < 0.60, infants, np.where(kind < 0.88, under_five, older)).astype(np.int64)
+
+
+def _chunk_rows(rng, compiled, first_id, n):
+    # (member rows, dose rows, reaction rows) for children first_id..first_id+n-1
+    today = np.datetime64(TODAY.isoformat(), "D")
+    dobs = today - birth_ages(rng, n).astype("timedelta64[D]")
+    ids = np.arange(first_id, first_id + n)
+
+    first = rng.integers(0, len(FIRST), n)
+    last = rng.integers(0, len(LAST), n)
+    place = rng.integers(0, len(PLACES), n)
+    gender = rng.integers(0, 2, n)
+    phone = rng.integers(0, 10 ** 8, n)
+    dob_text = dobs.astype(str)
+    members = [
+        (int(ids[i]), f"{FIRST[first[i]]} {LAST[last[i]]} {ids[i]}", dob_text[i], "MF"[gender[i]],
+         PLACES[place[i]], f"07{phone[i]:08d}")
+        for i in range(n)
+    ]
+
+    due = due_date_matrix(dobs, compiled)
+    # Later doses (by age) are missed more often
+    order = np.argsort(np.argsort(compiled.months * 31 + compiled.days))
+    propensity = rng.beta(8, 1.5, n)[:, None] * (1 - 0.015 * order)[None, :]
+    delay = rng.exponential(10, due.shape).astype(np.int64).astype("timedelta64[D]")
+    given_on = np.minimum(due + delay, today)
+    given = (due < today) & (rng.random(due.shape) < propensity)
+
+    due_text = due.astype(str)
+    given_text = given_on.astype(str)
+    doses = [
+        (int(ids[i]), compiled.vaccines[j], compiled.labels[j], due_text[i, j],
+         given_text[i, j] if given[i, j] else None)
+        for i in range(n) for j in range(len(compiled.keys))
+    ]
+
+    rows, cols = np.nonzero(given & (rng.random(due.shape) < REACTION_RATE))
+    after = rng.integers(0, 3, len(rows)).astype("timedelta64[D]")
+    reaction_dates = (given_on[rows, cols] + after).astype(str)
+    reactions = []
+    for k, (i, j) in enumerate(zip(rows, cols)):
+        spellings = SPELLINGS.get(compiled.vaccines[j], [compiled.vaccines[j]])
+        reactions.append((int(ids[i]), spellings[rng.integers(0, len(spellings))], reaction_dates[k],
+                          REACTION_NOTES[rng.integers(0, len(REACTION_NOTES))]))
+    return members, doses, reactions
+
+
+def generate(db_path, children, seed=SEED, progress=None):
+    schedule = load_schedule(os.path.join(ROOT, "kepi_schedule.json"))
+    compiled = schedule.compiled()
+    rng = np.random.default_rng(seed)
+
+    conn = connect(db_path)
+    init_schema(conn, compiled)
+    conn.commit()
+    conn.isolation_level = None
+    conn.execute("PRAGMA cache_size=-256000")
+    try:
+        for start in range(0, children, CHUNK):
+            members, doses, reactions = _chunk_rows(rng, compiled, start + 1, min(CHUNK, children - start))
+            conn.execute("BEGIN IMMEDIATE")
+            with deferred_fts(conn):
+                conn.executemany(
+                    "INSERT INTO members (id, name, dob, gender, residence, phone) VALUES (?, ?, ?, ?, ?, ?)", members
+                )
+            with paused_row_trigger(conn), paused_insert_trigger(conn):
+                conn.executemany(INSERT_DOSE, doses)
+                refresh_next_due(conn, start, start + len(members))
+            conn.executemany("INSERT INTO reactions (member_id, vaccine, date, notes) VALUES (?, ?, ?, ?)", reactions)
+            conn.execute("COMMIT")
+            if progress:
+                progress(start + len(members), children)
+
+        conn.execute("BEGIN IMMEDIATE")
+        rebuild(conn)
+        normalize_reactions(conn, vaccine_lookup(schedule.as_dict()))
+        conn.execute("COMMIT")
+        conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+    finally:
+        conn.close()
+
+
+def cohort_db(children, seed=SEED, cache_dir=CACHE_DIR, progress=None):
+    # Path of the cached cohort database, generating it on first use. Callers
+    # that write to it should work on a copy.
+    os.makedirs(cache_dir, exist_ok=True)
+    path = os.path.join(cache_dir, f"cohort_v{GENERATOR_VERSION}_{children}_{seed}.db")
+    if not os.path.exists(path):
+        tmp_path = f"{path}.part"
+        for suffix in ("", "-wal", "-shm"):
+            if os.path.exists(tmp_path + suffix):
+                os.remove(tmp_path + suffix)
+        generate(tmp_path, children, seed, progress)
+        os.replace(tmp_path, path)
+    return path
+
+
+def parse_size(text):
+    return SIZES.get(text.lower()) or int(text)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate a deterministic synthetic members.db.")
+    parser.add_argument("--children", default="10k", help="10k, 100k, 1m or a number")
+    parser.add_argument("--seed", type=int, default=SEED)
+    parser.add_argument("--out", help="copy the database here (default: only cache it)")
+    args = parser.parse_args()
+
+    t0 = time.perf_counter()
+    path = cohort_db(parse_size(args.children), args.seed,
+                     progress=lambda done, total: print(f"\r⏳ {done}/{total} children", end="", file=sys.stderr))
+    print(file=sys.stderr)
+    if args.out:
+        shutil.copy(path, args.out)
+        path = args.out
+    print(f"✅ {path} ({time.perf_counter() - t0:.1f} s)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,57 @@
+# Local stand-in for the Twilio Messages API
+#
+#   python benchmarks/fake_twilio.py --port 8099 --fail-rate 0.05
+#   python reminders.py --base-url http://127.0.0.1:8099
+
+import argparse
+import random
+import uuid
+
+from aiohttp import web
+
+
+def make_app(fail_rate=0.0, seed=None):
+    rng = random.Random(seed)
+    app = web.Application()
+    app["received"] = []
+
+    async def create_message(request):
+        form = await request.post()
+        roll = rng.random()
+        if roll < fail_rate / 2:
+            return web.json_response({"code": 20429, "message": "Too Many Requests", "status": 429}, status=429)
+        if roll < fail_rate:
+            return web.json_response({"code": 20500, "message": "Internal Server Error", "status": 500}, status=500)
+        app["received"].append((form.get("To"), form.get("Body")))
+        sid = "SM" + uuid.uuid4().hex
+        return web.json_response({
+            "sid": sid,
+            "account_sid": request.match_info["account"],
+            "to": form.get("To"),
+            "from": form.get("From"),
+            "body": form.get("Body"),
+            "status": "queued",
+        }, status=201)
+
+    app.router.add_post("/2010-04-01/Accounts/{account}/Messages.json", create_message)
+    return app
+
+
+async def start(port=8099, fail_rate=0.0, seed=None):
+    app = make_app(fail_rate, seed)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, "127.0.0.1", port).start()
+    return app, runner
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--port", type=int, default=8099)
+    parser.add_argument("--fail-rate", type=float, default=0.0)
+    args = parser.parse_args()
+    web.run_app(make_app(args.fail_rate), host="127.0.0.1", port=args.port, access_log=None)
+
+
+if __name__ == "__main__":
+    main()
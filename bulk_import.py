@@ -0,0 +1,234 @@
+# Bulk child import from CSV / Excel registries
+#
+# The file is read in chunks and each chunk is validated with vectorized
+# pandas operations (required name, parseable DOB that is neither in the
+# future nor implausibly old, phone format, duplicates within the file and
+# against the database). Valid rows are inserted with executemany inside one
+# transaction per chunk, together with their pending dose rows, whose due
+# dates come from the compiled schedule in a single vectorized pass. An
+# optional schedule column assigns children to registry schedules (blank is
+# the default); mixed schedules still take one pass over the union table.
+# Rejected rows go to a CSV with the original line number and a reason.
+#
+#   python bulk_import.py county_registry.csv --rejects rejects.csv
+
+import argparse
+import importlib.util
+import os
+import time
+from datetime import date
+
+import numpy as np
+import pandas as pd
+
+from aggregates import add_counts, paused_row_trigger
+from db import bump_data_version, connect
+from due_dates import as_tables, mixed_due_date_matrix
+from next_due import paused_insert_trigger, refresh as refresh_next_due
+from search import deferred_fts
+
+COLUMNS = ["name", "dob", "gender", "residence", "phone", "schedule"]
+MAX_AGE_YEARS = 18
+GENDERS = {"m": "Male", "male": "Male", "boy": "Male",
+           "f": "Female", "female": "Female", "girl": "Female",
+           "o": "Other", "other": "Other"}
+# Kenyan mobile numbers: 07xx / 01xx locally, or with the 254 prefix
+PHONE_RE = r"^(?:254|0)?([17]\d{8})$"
+
+
+def read_chunks(source, chunk_size):
+    # Yields DataFrames of raw string columns with a 'line' column that points
+    # back into the source file (header is line 1)
+    name = str(getattr(source, "name", source)).lower()
+    if name.endswith(".xls"):
+        raise ValueError("Old .xls workbooks are not supported; save the sheet as .xlsx or CSV")
+    if name.endswith(".xlsx"):
+        if importlib.util.find_spec("openpyxl") is None:
+            raise ValueError("Excel imports need openpyxl (pip install openpyxl); or save the sheet as CSV")
+        # Excel has no streaming reader; it is split after loading
+        frame = pd.read_excel(source, dtype=str, engine="openpyxl")
+        chunks = (frame.iloc[i:i + chunk_size] for i in range(0, len(frame), chunk_size))
+    else:
+        chunks = pd.read_csv(source, dtype=str, chunksize=chunk_size, keep_default_na=False)
+    offset = 2
+    for chunk in chunks:
+        chunk = chunk.rename(columns=lambda c: str(c).strip().lower())
+        missing = {"name", "dob"} - set(chunk.columns)
+        if missing:
+            raise ValueError(f"Missing required column(s): {', '.join(sorted(missing))}")
+        for column in COLUMNS:
+            if column not in chunk.columns:
+                chunk[column] = ""
+        chunk = chunk[COLUMNS].fillna("").astype(str)
+        chunk.insert(0, "line", np.arange(offset, offset + len(chunk)))
+        offset += len(chunk)
+        yield chunk
+
+
+# ============================
+# Validation
+# ============================
+def validate(chunk, existing_keys, seen_keys, today=None, schedules=("kepi",)):
+    # Returns (valid rows, rejected rows with a 'reason' column); a blank
+    # schedule is the first (default) of schedules
+    today = pd.Timestamp(today or date.today())
+    frame = chunk.copy()
+    frame["name"] = frame["name"].str.strip()
+    frame["residence"] = frame["residence"].str.strip()
+    frame["schedule"] = frame["schedule"].str.strip().replace("", schedules[0])
+
+    dob = pd.to_datetime(frame["dob"].str.strip(), errors="coerce", format="ISO8601")
+    frame["dob"] = dob.dt.strftime("%Y-%m-%d")
+
+    digits = frame["phone"].str.replace(r"[\s\-()+]", "", regex=True)
+    local = digits.str.extract(PHONE_RE, expand=False)
+    frame["phone"] = ("0" + local).where(local.notna(), "")
+
+    gender = frame["gender"].str.strip().str.lower()
+    frame["gender"] = gender.map(GENDERS)
+
+    key = frame["name"].str.lower() + "|" + frame["dob"].fillna("") + "|" + frame["phone"]
+
+    reason = pd.Series("", index=frame.index)
+
+    def reject(mask, why):
+        reason.loc[mask & (reason == "")] = why
+
+    reject(frame["name"] == "", "missing name")
+    reject(dob.isna(), "invalid date of birth")
+    reject(dob > today, "date of birth in the future")
+    reject(dob < today - pd.DateOffset(years=MAX_AGE_YEARS), f"older than {MAX_AGE_YEARS} years")
+    reject((digits != "") & local.isna(), "invalid phone number")
+    reject((gender != "") & frame["gender"].isna(), "unknown gender")
+    reject(~frame["schedule"].isin(schedules), "unknown schedule")
+    reject(key.isin(existing_keys), "already registered")
+    reject(key.duplicated() | key.isin(seen_keys), "duplicate in file")
+
+    ok = reason == ""
+    seen_keys.update(key[ok])
+    rejected = chunk[~ok].assign(reason=reason[~ok])
+    return frame[ok], rejected
+
+
+def existing_member_keys(conn):
+    rows = conn.execute("SELECT lower(name) || '|' || dob || '|' || COALESCE(phone, '') FROM members")
+    return {r[0] for r in rows}
+
+
+# ============================
+# Insert
+# ============================
+def insert_chunk(conn, valid, tables):
+    # Members and their dose rows in one transaction; the write lock taken by
+    # BEGIN IMMEDIATE guarantees the new ids are exactly those above max(id)
+    if valid.empty:
+        return 0
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        last_id = conn.execute("SELECT COALESCE(MAX(id), 0) FROM members").fetchone()[0]
+        with deferred_fts(conn):
+            conn.executemany(
+                "INSERT INTO members (name, dob, gender, residence, phone, schedule) VALUES (?, ?, ?, ?, ?, ?)",
+                valid[["name", "dob", "gender", "residence", "phone", "schedule"]].itertuples(index=False, name=None),
+            )
+        ids = np.array([r[0] for r in conn.execute(
+            "SELECT id FROM members WHERE id > ? ORDER BY id", (last_id,))], dtype=np.int64)
+
+        # Default dose state for every child at once: one due-date matrix over
+        # the union of schedules, then the (child, dose) cells each child's
+        # schedule includes, in child order
+        n = len(ids)
+        index = valid["schedule"].map({name: i for i, name in enumerate(tables.names)}).to_numpy()
+        due = mixed_due_date_matrix(valid["dob"].to_numpy(), index, tables)
+        rows, cols = np.nonzero(tables.member[index])
+        due = due[rows, cols].astype(str)
+        vaccines = np.array(tables.union.vaccines, dtype=object)[cols].tolist()
+        labels = np.array(tables.union.labels, dtype=object)[cols].tolist()
+        with paused_row_trigger(conn), paused_insert_trigger(conn):
+            conn.executemany(
+                "INSERT INTO doses (member_id, vaccine, dose_label, due_date) VALUES (?, ?, ?, ?)",
+                zip(ids[rows].tolist(), vaccines, labels, due.tolist()),
+            )
+            add_coverage(conn, pd.DataFrame({
+                "day": due, "vaccine": vaccines, "dose_label": labels,
+                "residence": valid["residence"].to_numpy()[rows],
+            }))
+            refresh_next_due(conn, last_id, int(ids[-1]))
+        bump_data_version(conn)
+        conn.execute("COMMIT")
+    except BaseException:
+        conn.execute("ROLLBACK")
+        raise
+    return n
+
+
+def add_coverage(conn, doses):
+    # The new doses are all pending, so each group adds to 'due' only
+    for table, keys in (("coverage_daily", ["day"]),
+                        ("coverage_residence", ["residence", "day"]),
+                        ("coverage_vaccine", ["vaccine", "dose_label", "day"])):
+        counts = doses.groupby(keys, sort=False).size()
+        add_counts(conn, table, (
+            (*(key if isinstance(key, tuple) else (key,)), int(count), 0) for key, count in counts.items()
+        ))
+
+
+def import_members(db_path, source, compiled, rejects_path=None, chunk_size=50_000, progress=None):
+    # Returns {"inserted", "rejected", "seconds"}; progress(inserted, rejected)
+    # is called after every chunk. compiled is a CompiledSchedule (everyone on
+    # that schedule) or a registry's ScheduleTables.
+    t0 = time.perf_counter()
+    tables = as_tables(compiled)
+    conn = connect(db_path)
+    conn.isolation_level = None  # transactions are managed explicitly above
+    conn.execute("PRAGMA cache_size=-256000")  # keep the dose indexes' hot pages in memory
+    inserted = rejected = 0
+    existing = existing_member_keys(conn)
+    seen = set()
+    if rejects_path and os.path.exists(rejects_path):
+        os.remove(rejects_path)
+    try:
+        for chunk in read_chunks(source, chunk_size):
+            valid, bad = validate(chunk, existing, seen, schedules=tables.names)
+            inserted += insert_chunk(conn, valid, tables)
+            if len(bad) and rejects_path:
+                bad.to_csv(rejects_path, mode="a", index=False, header=not os.path.exists(rejects_path))
+            rejected += len(bad)
+            if progress:
+                progress(inserted, rejected)
+    finally:
+        conn.close()
+    return {"inserted": inserted, "rejected": rejected, "seconds": time.perf_counter() - t0}
+
+
+def main():
+    from db import init_schema
+    from schedule import SCHEDULE_DIR, ScheduleRegistry
+
+    parser = argparse.ArgumentParser(description="Import children from a CSV or Excel registry.")
+    parser.add_argument("source")
+    parser.add_argument("--db", default="members.db")
+    parser.add_argument("--schedule", default="kepi_schedule.json")
+    parser.add_argument("--schedule-dir", default=SCHEDULE_DIR)
+    parser.add_argument("--rejects", default="rejects.csv")
+    parser.add_argument("--chunk-size", type=int, default=50_000)
+    args = parser.parse_args()
+
+    registry = ScheduleRegistry(args.schedule, args.schedule_dir)
+    # A fresh or unmigrated database gets the doses, coverage and next-due tables
+    conn = connect(args.db)
+    init_schema(conn, registry.get().compiled)
+    conn.commit()
+    conn.close()
+
+    result = import_members(args.db, args.source, registry.tables(), args.rejects, args.chunk_size,
+                            progress=lambda i, r: print(f"... {i} imported, {r} rejected"))
+    rate = (result["inserted"] + result["rejected"]) / max(result["seconds"], 1e-9)
+    print(f"✅ {result['inserted']} imported, {result['rejected']} rejected "
+          f"in {result['seconds']:.1f} s ({rate:,.0f} rows/s)")
+    if result["rejected"]:
+        print(f"⚠️ Rejected rows written to {args.rejects}")
+
+
+if __name__ == "__main__":
+    main()
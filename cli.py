@@ -0,0 +1,194 @@
+# Headless batch runner for nightly jobs
+#
+# Runs the same reports as the app without a browser session:
+#
+#   python cli.py summary                          # dashboard figures
+#   python cli.py coverage --out coverage.json     # coverage by vaccine / residence
+#   python cli.py reactions --by dose              # adverse-event rates
+#   python cli.py overdue --out overdue.csv        # every overdue dose
+#   python cli.py overdue --vaccine BCG --dose Birth --out bcg_overdue.csv
+#   python cli.py outreach --to 2025-02-01 --residence Kisumu --out calls.csv
+#   python cli.py pdfs --out-dir exports/records   # one ZIP of PDFs per shard
+#   python cli.py record 42 --out child_42.pdf     # one child's record
+#   python cli.py export doses --format parquet    # analytics dataset
+#
+# Overdue lists and PDFs split the member table into --shards id ranges and
+# process them on --workers CPU cores (both default to the core count).
+
+import argparse
+import json
+import os
+import sys
+import time
+from contextlib import closing
+from datetime import date, timedelta
+
+from db import connect, init_schema
+import reports
+
+
+def _open(args):
+    from schedule import load_schedule
+
+    conn = connect(args.db)
+    # Legacy databases are migrated on first use, like the app does
+    init_schema(conn, lambda: load_schedule(args.schedule).compiled())
+    conn.commit()
+    return conn
+
+
+def _today(args):
+    return date.fromisoformat(args.today) if args.today else None
+
+
+def cmd_summary(args):
+    with closing(_open(args)) as conn:
+        print(json.dumps(reports.dashboard_summary(conn, _today(args)), indent=2))
+
+
+def cmd_coverage(args):
+    with closing(_open(args)) as conn:
+        report = reports.coverage_report(conn, _today(args))
+    text = json.dumps(report, indent=2)
+    if args.out:
+        with open(args.out, "w") as f:
+            f.write(text)
+        print(f"✅ Coverage report written to {args.out}")
+    else:
+        print(text)
+
+
+def cmd_reactions(args):
+    from reactions import normalize_reactions, vaccine_lookup
+    from schedule import ScheduleRegistry
+
+    with closing(_open(args)) as conn:
+        if args.renormalize:
+            lookup = vaccine_lookup(ScheduleRegistry(args.schedule, args.schedule_dir).tables().union.vaccines)
+            print(f"🔁 {normalize_reactions(conn, lookup, renormalize=True)} reactions re-matched", file=sys.stderr)
+            conn.commit()
+        report = reports.reaction_report(conn, args.by)
+    print(json.dumps(report, indent=2))
+
+
+def cmd_overdue(args):
+    _open(args).close()
+    count = reports.overdue_csv(args.db, args.out, args.vaccine, args.dose, _today(args),
+                                args.shards, args.workers)
+    print(f"✅ {count} overdue doses written to {args.out}")
+
+
+def cmd_outreach(args):
+    # Children whose next dose is due between --from (default today, or
+    # open with --overdue) and --to (default a week later)
+    today = _today(args) or date.today()
+    start = None if args.overdue else (date.fromisoformat(args.start) if args.start else today)
+    end = date.fromisoformat(args.end) if args.end else today + timedelta(days=7)
+    with closing(_open(args)) as conn, open(args.out, "w", newline="", encoding="utf-8") as f:
+        count = reports.write_outreach(conn, f, start, end, args.residence)
+    print(f"✅ {count} children written to {args.out}")
+
+
+def cmd_pdfs(args):
+    _open(args).close()
+    written = reports.export_pdfs(args.db, args.out_dir, args.residence, args.shards, args.workers)
+    for path, count, _ in written:
+        print(f"   {path}: {count} records")
+    print(f"✅ {sum(c for _, c, _ in written)} records in {len(written)} ZIP file(s)")
+    for member_id, name in (s for _, _, skipped in written for s in skipped):
+        print(f"⚠️ Skipped #{member_id} {name}: needs a Unicode font (set PDF_FONT)")
+
+
+def cmd_record(args):
+    from pdf_reports import FPDFUnicodeEncodingException, child_record_pdf, record_filename
+
+    with closing(_open(args)) as conn:
+        report = reports.child_report(conn, args.member_id)
+    if report is None:
+        sys.exit(f"❌ No child with id {args.member_id}")
+    child, status = report
+    out = args.out or record_filename(child)
+    try:
+        data = child_record_pdf(child, status)
+    except FPDFUnicodeEncodingException:
+        sys.exit(f"❌ {child['name']} needs a Unicode font for the PDF (set PDF_FONT)")
+    with open(out, "wb") as f:
+        f.write(data)
+    print(f"✅ Record written to {out}")
+
+
+def cmd_export(args):
+    from exports import FORMATS, dose_keys, write_export
+    from schedule import ScheduleRegistry
+
+    out = args.out or f"{args.dataset}{FORMATS[args.format]}"
+    # One column per dose of any schedule
+    keys = dose_keys(ScheduleRegistry(args.schedule, args.schedule_dir).tables().union)
+    with closing(_open(args)) as conn:
+        rows = write_export(conn, args.dataset, args.format, out, keys, args.chunk_size)
+    print(f"✅ {rows} rows written to {out}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run vaccination reports without the web app.")
+    parser.add_argument("--db", default="members.db")
+    parser.add_argument("--schedule", default="kepi_schedule.json")
+    parser.add_argument("--schedule-dir", default="schedules", help="additional schedules, one JSON per schedule")
+    parser.add_argument("--today", help="report as of this date (YYYY-MM-DD)")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    commands.add_parser("summary", help="dashboard figures as JSON").set_defaults(run=cmd_summary)
+
+    p = commands.add_parser("coverage", help="coverage by vaccine and residence as JSON")
+    p.add_argument("--out")
+    p.set_defaults(run=cmd_coverage)
+
+    p = commands.add_parser("reactions", help="adverse-event rates per 1,000 administered doses as JSON")
+    p.add_argument("--by", action="append", choices=["vaccine", "dose", "residence"])
+    p.add_argument("--renormalize", action="store_true",
+                   help="match every reaction to the schedule again (after a schedule change)")
+    p.set_defaults(run=cmd_reactions)
+
+    p = commands.add_parser("overdue", help="CSV of overdue doses")
+    p.add_argument("--out", default="overdue.csv")
+    p.add_argument("--vaccine")
+    p.add_argument("--dose", help="dose label, e.g. '6 weeks'")
+    p.set_defaults(run=cmd_overdue)
+
+    p = commands.add_parser("outreach", help="CSV of children whose next dose is due in a date window")
+    p.add_argument("--from", dest="start", help="first due date (default: today)")
+    p.add_argument("--to", dest="end", help="last due date (default: a week from today)")
+    p.add_argument("--overdue", action="store_true", help="include children already overdue")
+    p.add_argument("--residence")
+    p.add_argument("--out", default="outreach.csv")
+    p.set_defaults(run=cmd_outreach)
+
+    p = commands.add_parser("pdfs", help="child record PDFs, one ZIP per shard")
+    p.add_argument("--out-dir", default=os.path.join("exports", "records"))
+    p.add_argument("--residence")
+    p.set_defaults(run=cmd_pdfs)
+
+    for p in (commands.choices["overdue"], commands.choices["pdfs"]):
+        p.add_argument("--shards", type=int, help="id-range shards (default: one per worker)")
+        p.add_argument("--workers", type=int, help="worker processes (default: CPU count)")
+
+    p = commands.add_parser("record", help="one child's record PDF")
+    p.add_argument("member_id", type=int)
+    p.add_argument("--out")
+    p.set_defaults(run=cmd_record)
+
+    p = commands.add_parser("export", help="members / doses / reactions as Parquet, Arrow or CSV")
+    p.add_argument("dataset", choices=["members", "doses", "reactions"])
+    p.add_argument("--format", choices=["parquet", "arrow", "csv"], default="parquet")
+    p.add_argument("--out")
+    p.add_argument("--chunk-size", type=int, default=50_000)
+    p.set_defaults(run=cmd_export)
+
+    args = parser.parse_args(argv)
+    t0 = time.perf_counter()
+    args.run(args)
+    print(f"⏱️ {time.perf_counter() - t0:.1f} s", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,273 @@
+# Compact in-memory cohort for dashboard counts and overdue lists
+#
+# Per child: the id and date of birth (int32, days since 1970-01-01) and two
+# bitsets with one bit per compiled schedule dose: the doses that have a row
+# in the doses table and the doses given. With the KEPI schedule's 19 doses
+# that is 16 bytes a child, about 16 MB for a million. Children on different
+# schedules share one store built over the registry's union of doses: the
+# "has a row" bits already say which doses each child's schedule includes.
+#
+# Due dates are never stored. A dose's due date only grows with the date of
+# birth, so "due before D" is "born before the first DOB whose due date is D
+# or later": one threshold per dose, found by a binary search over a few
+# thousand candidate birth dates. Counts and overdue lists are then
+# comparisons and bit tests over the arrays.
+#
+# One store lives per process and each read first checks the meta counters:
+# new children are appended by id, children listed in dose_log since the last
+# read are re-read, and a member_epoch bump, a schedule change or a trimmed
+# log rebuilds the store.
+#
+#   python cohort_store.py --check    # build, report size, compare with SQL
+
+import argparse
+import threading
+import time
+from datetime import date, timedelta
+
+import numpy as np
+
+from db import read_versions
+from due_dates import due_date_matrix
+from profiling import timed
+
+REFRESH_BATCH = 500        # children per IN (...) query when re-reading changes
+MAX_CHANGED = 50_000       # beyond this many changed children, rebuild instead
+OVERDUE_COLUMNS = ("id", "name", "residence", "phone", "vaccine", "dose_label", "due_date")
+
+
+def _day_numbers(dobs):
+    return np.asarray(dobs, dtype="datetime64[D]").astype(np.int32)
+
+
+def _bits_sql(compiled, where):
+    # (member_id, scheduled bits, given bits) per child; the bit of each dose
+    # row comes from a CASE over the compiled keys, grouped in SQL
+    by_vaccine, params = {}, []
+    for j, (vaccine, label) in enumerate(zip(compiled.vaccines, compiled.labels)):
+        by_vaccine.setdefault(vaccine, []).append((label, 1 << j))
+    branches = []
+    for vaccine, labels in by_vaccine.items():
+        params.append(vaccine)
+        params.extend(label for label, _ in labels)
+        inner = " ".join(f"WHEN ? THEN {bit}" for _, bit in labels)
+        branches.append(f"WHEN ? THEN CASE dose_label {inner} ELSE 0 END")
+    sql = f'''
+        SELECT member_id, SUM(bit), SUM(CASE WHEN given_date IS NULL THEN 0 ELSE bit END)
+        FROM (SELECT member_id, given_date, CASE vaccine {" ".join(branches)} ELSE 0 END AS bit
+              FROM doses WHERE {where})
+        GROUP BY member_id
+    '''
+    return sql, params
+
+
+class CohortStore:
+    def __init__(self):
+        self.keys = None
+        self.ids = np.zeros(0, dtype=np.int32)
+        self.dobs = np.zeros(0, dtype=np.int32)
+        self.scheduled = np.zeros(0, dtype=np.uint32)
+        self.given = np.zeros(0, dtype=np.uint32)
+        self.version = None
+        self.epoch = None
+        self.seq = 0
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.ids)
+
+    @property
+    def nbytes(self):
+        return self.ids.nbytes + self.dobs.nbytes + self.scheduled.nbytes + self.given.nbytes
+
+    # ============================
+    # Loading
+    # ============================
+    def _refresh(self, conn, compiled):
+        version, epoch = read_versions(conn)
+        if self.keys != compiled.keys or epoch != self.epoch:
+            self._rebuild(conn, compiled)
+        elif version != self.version and not self._update(conn, compiled):
+            self._rebuild(conn, compiled)
+        self.version, self.epoch = version, epoch
+
+    def _log_position(self, conn):
+        return conn.execute("SELECT COALESCE(MAX(seq), 0) FROM dose_log").fetchone()[0]
+
+    def _read_bits(self, conn, compiled, where, params=()):
+        sql, case_params = _bits_sql(compiled, where)
+        rows = conn.execute(sql, case_params + list(params)).fetchall()
+        if not rows:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=self.given.dtype), np.zeros(0, dtype=self.given.dtype)
+        member_ids, scheduled, given = np.array(rows, dtype=np.int64).T
+        return member_ids, scheduled.astype(self.given.dtype), given.astype(self.given.dtype)
+
+    def _place(self, ids, member_ids, scheduled, given, out_scheduled, out_given):
+        # Writes bit rows into the arrays at the positions of member_ids;
+        # dose rows of children not in ids (deleted members) are ignored
+        pos = np.searchsorted(ids, member_ids)
+        found = (pos < len(ids)) & (ids[np.minimum(pos, len(ids) - 1)] == member_ids) if len(ids) else pos < 0
+        out_scheduled[pos[found]] = scheduled[found]
+        out_given[pos[found]] = given[found]
+
+    @timed("deserialize")
+    def _rebuild(self, conn, compiled):
+        if len(compiled.keys) > 63:
+            raise ValueError("the cohort store holds at most 63 doses per child")
+        dtype = np.uint32 if len(compiled.keys) <= 32 else np.uint64
+        self.keys = compiled.keys
+        self.given = np.zeros(0, dtype=dtype)
+        # The log position is read first, so a change made while loading is
+        # applied again on the next read instead of being missed
+        seq = self._log_position(conn)
+        members = conn.execute("SELECT id, dob FROM members ORDER BY id").fetchall()
+        self.ids = np.array([r[0] for r in members], dtype=np.int32)
+        self.dobs = _day_numbers([r[1] for r in members])
+        self.scheduled = np.zeros(len(members), dtype=dtype)
+        self.given = np.zeros(len(members), dtype=dtype)
+        self._place(self.ids, *self._read_bits(conn, compiled, "1"), self.scheduled, self.given)
+        self.seq = seq
+
+    @timed("deserialize")
+    def _update(self, conn, compiled):
+        # Returns False when a rebuild is needed instead
+        seq = self._log_position(conn)
+        first = conn.execute("SELECT MIN(seq) FROM dose_log").fetchone()[0]
+        if first is not None and first > self.seq + 1 and seq > self.seq:
+            return False
+        changed = [r[0] for r in conn.execute(
+            "SELECT DISTINCT member_id FROM dose_log WHERE seq > ?", (self.seq,))]
+        if len(changed) > MAX_CHANGED:
+            return False
+
+        max_id = int(self.ids[-1]) if len(self.ids) else 0
+        new = conn.execute("SELECT id, dob FROM members WHERE id > ? ORDER BY id", (max_id,)).fetchall()
+        if new:
+            new_ids = np.array([r[0] for r in new], dtype=np.int32)
+            new_scheduled = np.zeros(len(new), dtype=self.given.dtype)
+            new_given = np.zeros(len(new), dtype=self.given.dtype)
+            self._place(new_ids, *self._read_bits(conn, compiled, "member_id > ?", (max_id,)),
+                        new_scheduled, new_given)
+            self.ids = np.concatenate([self.ids, new_ids])
+            self.dobs = np.concatenate([self.dobs, _day_numbers([r[1] for r in new])])
+            self.scheduled = np.concatenate([self.scheduled, new_scheduled])
+            self.given = np.concatenate([self.given, new_given])
+
+        changed = [m for m in changed if m <= max_id]
+        for start in range(0, len(changed), REFRESH_BATCH):
+            batch = changed[start:start + REFRESH_BATCH]
+            member_ids = np.array(batch, dtype=np.int64)
+            # Children left without dose rows are cleared
+            self._place(self.ids, member_ids, np.zeros(len(batch), dtype=self.given.dtype),
+                        np.zeros(len(batch), dtype=self.given.dtype), self.scheduled, self.given)
+            self._place(self.ids, *self._read_bits(
+                conn, compiled, f"member_id IN ({', '.join('?' * len(batch))})", batch), self.scheduled, self.given)
+        self.seq = seq
+        return True
+
+    # ============================
+    # Queries
+    # ============================
+    def _thresholds(self, compiled, day):
+        # Per dose, the first DOB (day number) whose due date is on or after
+        # `day`. Adding m months moves a date by 28m-31m days, less at most 3
+        # when the day is clipped, so the candidates below always bracket it.
+        months, days = compiled.months.astype(np.int64), compiled.days.astype(np.int64)
+        target = np.datetime64(day, "D").astype(np.int64)
+        lo = int((target - days - 31 * months).min()) - 4
+        hi = int((target - days - 28 * months).max()) + 4
+        candidates = np.arange(lo, hi + 1)
+        due = due_date_matrix(candidates.astype("datetime64[D]"), compiled).astype(np.int64)
+        first = [np.searchsorted(due[:, j], target) for j in range(len(compiled.keys))]
+        return candidates[first]
+
+    @timed("schedule")
+    def counts(self, conn, compiled, today=None):
+        # Same figures as aggregates.coverage_counts, plus "registered"
+        today = today or date.today()
+        with self._lock:
+            self._refresh(conn, compiled)
+            t_today = self._thresholds(compiled, today)
+            t_tomorrow = self._thresholds(compiled, today + timedelta(days=1))
+            t_week = self._thresholds(compiled, today + timedelta(days=8))
+            result = {"registered": len(self.ids), "due_today": 0, "next_7_days": 0, "overdue": 0, "completed": 0}
+            for j in range(len(compiled.keys)):
+                has = (self.scheduled >> j) & 1 == 1
+                given = (self.given >> j) & 1 == 1
+                result["due_today"] += int(np.count_nonzero(has & (self.dobs >= t_today[j]) & (self.dobs < t_tomorrow[j])))
+                result["next_7_days"] += int(np.count_nonzero(has & (self.dobs >= t_tomorrow[j]) & (self.dobs < t_week[j])))
+                result["overdue"] += int(np.count_nonzero(has & ~given & (self.dobs < t_today[j])))
+                result["completed"] += int(np.count_nonzero(given))
+        return result
+
+    @timed("schedule")
+    def overdue(self, conn, compiled, key=None, today=None):
+        # (member ids, dose indices, due dates) of overdue doses, in (due
+        # date, id) order; key="<vaccine> - <age>" restricts to one dose
+        today = today or date.today()
+        doses = [compiled.keys.index(key)] if key else range(len(compiled.keys))
+        with self._lock:
+            self._refresh(conn, compiled)
+            cutoff = self._thresholds(compiled, today)
+            ids, dose, due = [], [], []
+            for j in doses:
+                pending = ((self.scheduled & ~self.given) >> j) & 1 == 1
+                rows = np.flatnonzero(pending & (self.dobs < cutoff[j]))
+                one = compiled._replace(months=compiled.months[j:j + 1], days=compiled.days[j:j + 1])
+                ids.append(self.ids[rows])
+                dose.append(np.full(len(rows), j, dtype=np.int32))
+                due.append(due_date_matrix(self.dobs[rows].astype("datetime64[D]"), one)[:, 0])
+        ids, dose, due = np.concatenate(ids), np.concatenate(dose), np.concatenate(due)
+        order = np.lexsort((ids, due))
+        return ids[order], dose[order], due[order]
+
+    def overdue_members(self, conn, compiled, key=None, today=None, limit=1000):
+        # (columns, rows for the first `limit` overdue doses, total) with the
+        # same columns as doses.overdue_members
+        ids, dose, due = self.overdue(conn, compiled, key, today)
+        shown = ids[:limit].tolist()
+        members = {}
+        for start in range(0, len(shown), REFRESH_BATCH):
+            batch = shown[start:start + REFRESH_BATCH]
+            members.update((r[0], r[1:]) for r in conn.execute(
+                f"SELECT id, name, residence, phone FROM members WHERE id IN ({', '.join('?' * len(batch))})", batch))
+        rows = []
+        for member_id, j, day in zip(shown, dose[:limit].tolist(), due[:limit].astype(str)):
+            name, residence, phone = members.get(member_id, (None, None, None))
+            rows.append((member_id, name, residence, phone, compiled.vaccines[j], compiled.labels[j], day))
+        return list(OVERDUE_COLUMNS), rows, len(ids)
+
+
+def main():
+    from db import connect, init_schema
+    from doses import dose_counts
+    from schedule import SCHEDULE_DIR, ScheduleRegistry
+
+    parser = argparse.ArgumentParser(description="Build the in-memory cohort store and compare it with SQL.")
+    parser.add_argument("--db", default="members.db")
+    parser.add_argument("--schedule", default="kepi_schedule.json")
+    parser.add_argument("--schedule-dir", default=SCHEDULE_DIR)
+    parser.add_argument("--check", action="store_true", help="compare the counts with the doses table")
+    args = parser.parse_args()
+
+    registry = ScheduleRegistry(args.schedule, args.schedule_dir)
+    compiled = registry.tables().union
+    conn = connect(args.db)
+    init_schema(conn, registry.get().compiled)
+    conn.commit()
+    store = CohortStore()
+    t0 = time.perf_counter()
+    counts = store.counts(conn, compiled)
+    print(f"✅ {len(store)} children in {store.nbytes / 1e6:.1f} MB, built in {time.perf_counter() - t0:.1f} s")
+    if args.check:
+        expected = {"registered": len(store), **dose_counts(conn)}
+        for key in counts:
+            if counts[key] != expected[key]:
+                print(f"❌ {key}: store {counts[key]}, doses table {expected[key]}")
+        print("✅ Counts match the doses table" if counts == expected else
+              "Counts differ (dose rows whose due date no longer follows the schedule?)")
+    conn.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,184 @@
+# Data-access layer
+#
+# A small process-wide pool of SQLite connections in WAL mode. The Streamlit
+# app keeps one pool in st.cache_resource, so schema setup runs once per
+# process and page functions borrow a connection instead of reconnecting on
+# every rerun. Headless scripts can use the pool (or connect()) directly.
+
+import queue
+import sqlite3
+import threading
+from contextlib import contextmanager
+
+from aggregates import create_coverage_tables
+from auth import create_auth_tables
+from doses import create_doses_table, migrate_json_blobs
+from jobs import create_jobs_table
+from next_due import create_next_due_table
+from profiling import timed
+from reactions import create_reaction_indexes
+from schedule import DEFAULT_SCHEDULE
+from search import create_search_index
+
+PRAGMAS = (
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA synchronous=NORMAL",      # safe with WAL, avoids an fsync per commit
+    "PRAGMA busy_timeout=5000",       # wait for writers instead of failing
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA cache_size=-32000",       # ~32 MB page cache per connection
+    "PRAGMA mmap_size=268435456",
+)
+
+SCHEMA = [
+    '''
+    CREATE TABLE IF NOT EXISTS members (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        name TEXT NOT NULL,
+        dob TEXT NOT NULL,
+        gender TEXT,
+        residence TEXT,
+        phone TEXT,
+        vaccines TEXT,
+        schedule TEXT NOT NULL DEFAULT 'kepi'
+    )
+    ''',
+    '''
+    CREATE TABLE IF NOT EXISTS reactions (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        member_id INTEGER,
+        vaccine TEXT,
+        date TEXT,
+        notes TEXT
+    )
+    ''',
+    '''
+    CREATE TABLE IF NOT EXISTS users (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        email TEXT UNIQUE NOT NULL,
+        pin TEXT NOT NULL
+    )
+    ''',
+    '''
+    CREATE TABLE IF NOT EXISTS meta (
+        key TEXT PRIMARY KEY,
+        value INTEGER NOT NULL
+    )
+    ''',
+]
+
+
+def connect(path, timeout=30):
+    # check_same_thread=False: pooled connections move between script threads,
+    # but the pool hands each one to a single borrower at a time
+    conn = sqlite3.connect(path, timeout=timeout, check_same_thread=False, cached_statements=256)
+    for pragma in PRAGMAS:
+        conn.execute(pragma)
+    return conn
+
+
+def init_schema(conn, compiled):
+    for ddl in SCHEMA:
+        conn.execute(ddl)
+    # Tables created before per-child schedules: everyone stays on the default
+    columns = {row[1] for row in conn.execute("PRAGMA table_info(members)")}
+    if "schedule" not in columns:
+        conn.execute(f"ALTER TABLE members ADD COLUMN schedule TEXT NOT NULL DEFAULT '{DEFAULT_SCHEDULE}'")
+    create_auth_tables(conn)
+    create_jobs_table(conn)
+    create_doses_table(conn)
+    create_coverage_tables(conn)
+    create_next_due_table(conn)
+    create_search_index(conn)
+    migrated = migrate_json_blobs(conn, compiled)
+    if migrated:
+        # Existing children gained dose rows: in-memory readers must reload
+        bump_data_version(conn, rewrite=True)
+    # After the migration, so older reactions can be matched to given doses
+    create_reaction_indexes(conn, compiled)
+    return migrated
+
+
+# ============================
+# Data Version Counters
+# ============================
+# data_version: bumped by every write, so cached readers know to refresh.
+# member_epoch: bumped only when existing rows are rewritten in bulk (the JSON
+#               migration), which makes the cohort store (cohort_store.py)
+#               rebuild instead of appending new ids.
+def read_versions(conn):
+    rows = dict(conn.execute(
+        "SELECT key, value FROM meta WHERE key IN ('data_version', 'member_epoch')"
+    ).fetchall())
+    return rows.get("data_version", 0), rows.get("member_epoch", 0)
+
+
+def bump_data_version(conn, rewrite=False):
+    keys = ("data_version", "member_epoch") if rewrite else ("data_version",)
+    conn.executemany(
+        "INSERT INTO meta (key, value) VALUES (?, 1) ON CONFLICT(key) DO UPDATE SET value = value + 1",
+        [(k,) for k in keys],
+    )
+
+
+# ============================
+# Connection Pool
+# ============================
+class ConnectionPool:
+    def __init__(self, path, size=8):
+        self.path = path
+        self.size = size
+        self._idle = queue.LifoQueue()
+        self._created = 0
+        self._lock = threading.Lock()
+
+    def _acquire(self):
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+        with self._lock:
+            if self._created < self.size:
+                self._created += 1
+                return connect(self.path)
+        return self._idle.get()
+
+    @contextmanager
+    def connection(self):
+        # Commits on success, rolls back on error
+        conn = self._acquire()
+        try:
+            yield conn
+            conn.commit()
+        except BaseException:
+            conn.rollback()
+            raise
+        finally:
+            self._idle.put(conn)
+
+    @timed("query")
+    def query(self, sql, params=()):
+        with self.connection() as conn:
+            return conn.execute(sql, params).fetchall()
+
+    @timed("query")
+    def query_one(self, sql, params=()):
+        with self.connection() as conn:
+            return conn.execute(sql, params).fetchone()
+
+    @timed("query")
+    def execute(self, sql, params=()):
+        with self.connection() as conn:
+            return conn.execute(sql, params).lastrowid
+
+    @timed("query")
+    def executemany(self, sql, rows):
+        with self.connection() as conn:
+            conn.executemany(sql, rows)
+
+    def close(self):
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                break
+        self._created = 0
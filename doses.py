@@ -0,0 +1,247 @@
+# Normalized dose table
+#
+# One row per (child, scheduled dose) replaces the per-child JSON blob in
+# members.vaccines. given_date is NULL until the dose is recorded, so due /
+# overdue questions become indexed range queries instead of json.loads loops.
+
+import json
+from datetime import date, timedelta
+
+from profiling import timed
+
+DOSES_SCHEMA = [
+    '''
+    CREATE TABLE IF NOT EXISTS doses (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        member_id INTEGER NOT NULL,
+        vaccine TEXT NOT NULL,
+        dose_label TEXT NOT NULL,
+        due_date TEXT NOT NULL,
+        given_date TEXT,
+        version INTEGER NOT NULL DEFAULT 0,
+        UNIQUE (member_id, vaccine, dose_label)
+    )
+    ''',
+    "CREATE INDEX IF NOT EXISTS idx_doses_due_given ON doses (due_date, given_date)",
+    # member_id lookups use the UNIQUE index, whose first column is member_id;
+    # a separate member index only slowed down every insert
+    "DROP INDEX IF EXISTS idx_doses_member",
+]
+
+INSERT_DOSE = "INSERT OR IGNORE INTO doses (member_id, vaccine, dose_label, due_date, given_date) VALUES (?, ?, ?, ?, ?)"
+
+# Children whose recorded doses changed, for in-memory readers that refresh
+# incrementally (cohort_store.py). Inserts are not logged: new children are
+# picked up by id. Only the last DOSE_LOG_KEEP entries are kept; a reader
+# that fell further behind rebuilds.
+DOSE_LOG_KEEP = 100_000
+DOSE_LOG_SCHEMA = [
+    "CREATE TABLE IF NOT EXISTS dose_log (seq INTEGER PRIMARY KEY AUTOINCREMENT, member_id INTEGER NOT NULL)",
+    f'''
+    CREATE TRIGGER IF NOT EXISTS dose_log_au AFTER UPDATE OF given_date ON doses
+    WHEN old.given_date IS NOT new.given_date BEGIN
+        INSERT INTO dose_log (member_id) VALUES (new.member_id);
+        DELETE FROM dose_log WHERE seq <= last_insert_rowid() - {DOSE_LOG_KEEP};
+    END
+    ''',
+    f'''
+    CREATE TRIGGER IF NOT EXISTS dose_log_ad AFTER DELETE ON doses BEGIN
+        INSERT INTO dose_log (member_id) VALUES (old.member_id);
+        DELETE FROM dose_log WHERE seq <= last_insert_rowid() - {DOSE_LOG_KEEP};
+    END
+    ''',
+]
+
+
+def create_doses_table(conn):
+    for ddl in DOSES_SCHEMA + DOSE_LOG_SCHEMA:
+        conn.execute(ddl)
+    # Tables created before optimistic locking have no version column
+    columns = {row[1] for row in conn.execute("PRAGMA table_info(doses)")}
+    if "version" not in columns:
+        conn.execute("ALTER TABLE doses ADD COLUMN version INTEGER NOT NULL DEFAULT 0")
+
+
+class DoseConflict(Exception):
+    # Raised when a dose changed since it was read; .dose_ids lists them
+    def __init__(self, dose_ids):
+        super().__init__(f"{len(dose_ids)} dose(s) were changed by someone else")
+        self.dose_ids = dose_ids
+
+
+# ============================
+# Writes
+# ============================
+@timed("schedule")
+def dose_rows(compiled, member_ids, dobs, statuses=None):
+    from due_dates import due_date_matrix  # numpy: only loaded when rows are written
+
+    due = due_date_matrix(dobs, compiled).astype(str)
+    for i, member_id in enumerate(member_ids):
+        status = statuses[i] if statuses else {}
+        for j, key in enumerate(compiled.keys):
+            # The legacy blob only stored a flag, so the due date stands in
+            # for the (unknown) administration date of migrated doses.
+            given = due[i, j] if status.get(key) else None
+            yield (int(member_id), compiled.vaccines[j], compiled.labels[j], due[i, j], given)
+
+
+@timed("query")
+def insert_doses(conn, compiled, member_ids, dobs, statuses=None):
+    conn.executemany(INSERT_DOSE, dose_rows(compiled, member_ids, dobs, statuses))
+
+
+@timed("query")
+def insert_child_doses(conn, registry, member_id, schedule, dob):
+    # One newly registered child; due dates come from the registry's
+    # per-(schedule, DOB) memo
+    conn.executemany(INSERT_DOSE, [
+        (int(member_id), vaccine, label, due, None) for vaccine, label, due in registry.due_dates(schedule, dob)
+    ])
+
+
+@timed("query")
+def assign_schedule(conn, registry, member_id, schedule):
+    # Moves a child to another schedule: pending doses the new schedule does
+    # not have are dropped, given doses stay on record, and missing doses are
+    # added as pending rows
+    member_id = int(member_id)
+    dob = conn.execute("SELECT dob FROM members WHERE id = ?", (member_id,)).fetchone()[0]
+    rows = registry.due_dates(schedule, dob)
+    keep = {(vaccine, label) for vaccine, label, _ in rows}
+    conn.execute("UPDATE members SET schedule = ? WHERE id = ?", (schedule, member_id))
+    conn.executemany("DELETE FROM doses WHERE id = ?", [
+        (dose_id,) for dose_id, v, t, _, given, _ in member_doses(conn, member_id)
+        if given is None and (v, t) not in keep
+    ])
+    conn.executemany(INSERT_DOSE, [(member_id, vaccine, label, due, None) for vaccine, label, due in rows])
+    # dose_log skips inserts (new children are picked up by id), so log this
+    # child for the in-memory readers explicitly
+    conn.execute("INSERT INTO dose_log (member_id) VALUES (?)", (member_id,))
+
+
+@timed("query")
+def apply_dose_changes(conn, changes, given_on=None):
+    # changes: iterable of (dose_id, expected_version, taken) covering only the
+    # doses that were actually toggled, possibly across several children.
+    # Each update only applies if the row still has the version it was read
+    # at; any mismatch raises DoseConflict so the caller's transaction (which
+    # holds every change in the batch) is rolled back as a whole.
+    given_on = (given_on or date.today()).isoformat()
+    conflicts = []
+    for dose_id, version, taken in changes:
+        cur = conn.execute(
+            '''
+            UPDATE doses SET given_date = CASE WHEN ? THEN COALESCE(given_date, ?) ELSE NULL END,
+                             version = version + 1
+            WHERE id = ? AND version = ?
+            ''',
+            (bool(taken), given_on, int(dose_id), int(version)),
+        )
+        if cur.rowcount == 0:
+            conflicts.append(int(dose_id))
+    if conflicts:
+        raise DoseConflict(conflicts)
+
+
+def migrate_json_blobs(conn, compiled, batch_size=5000):
+    # One-shot copy of members.vaccines into doses; members that already have
+    # dose rows are skipped, so it is safe to run again. compiled may be a
+    # zero-argument callable, only invoked when there is something to migrate.
+    rows = conn.execute('''
+        SELECT id, dob, vaccines FROM members m
+        WHERE NOT EXISTS (SELECT 1 FROM doses d WHERE d.member_id = m.id)
+    ''').fetchall()
+    if rows and callable(compiled):
+        compiled = compiled()
+
+    for start in range(0, len(rows), batch_size):
+        batch = rows[start:start + batch_size]
+        statuses = []
+        with timed("deserialize", "doses.migrate_json_blobs"):
+            for _, _, blob in batch:
+                try:
+                    status = json.loads(blob or "{}")
+                except json.JSONDecodeError:
+                    status = {}
+                statuses.append(status if isinstance(status, dict) else {})
+        insert_doses(conn, compiled, [r[0] for r in batch], [r[1] for r in batch], statuses)
+    return len(rows)
+
+
+# ============================
+# Reads
+# ============================
+@timed("query")
+def member_doses(conn, member_id):
+    # (id, vaccine, dose_label, due_date, given_date, version) rows
+    return conn.execute(
+        "SELECT id, vaccine, dose_label, due_date, given_date, version FROM doses WHERE member_id = ? ORDER BY id",
+        (int(member_id),),
+    ).fetchall()
+
+
+@timed("query")
+def dose_status(conn, member_id):
+    return {f"{v} - {t}": given is not None for _, v, t, _, given, _ in member_doses(conn, member_id)}
+
+
+@timed("query")
+def dose_status_many(conn, member_ids):
+    # {member_id: {"<vaccine> - <age>": bool}} for a batch of children
+    ids = [int(i) for i in member_ids]
+    if not ids:
+        return {}
+    result = {i: {} for i in ids}
+    rows = conn.execute(
+        f"SELECT member_id, vaccine, dose_label, given_date FROM doses "
+        f"WHERE member_id IN ({', '.join('?' * len(ids))}) ORDER BY id",
+        ids,
+    )
+    for member_id, v, t, given in rows:
+        result[member_id][f"{v} - {t}"] = given is not None
+    return result
+
+
+@timed("query")
+def dose_counts(conn, today=None):
+    today = today or date.today()
+    week_end = today + timedelta(days=7)
+    t, w = today.isoformat(), week_end.isoformat()
+
+    def count(where, params=()):
+        return conn.execute(f"SELECT COUNT(*) FROM doses WHERE {where}", params).fetchone()[0]
+
+    return {
+        "due_today": count("due_date = ?", (t,)),
+        "next_7_days": count("due_date > ? AND due_date <= ?", (t, w)),
+        "overdue": count("due_date < ? AND given_date IS NULL", (t,)),
+        "completed": count("given_date IS NOT NULL"),
+    }
+
+
+@timed("query")
+def overdue_members(conn, vaccine=None, dose_label=None, today=None, id_range=None):
+    # id_range=(lo, hi) restricts to lo < member_id <= hi (one shard of a
+    # headless run); those rows come back in member order instead of due order
+    today = (today or date.today()).isoformat()
+    where, params = ["d.due_date < ?", "d.given_date IS NULL"], [today]
+    if vaccine:
+        where.append("d.vaccine = ?")
+        params.append(vaccine)
+    if dose_label:
+        where.append("d.dose_label = ?")
+        params.append(dose_label)
+    order = "d.due_date"
+    if id_range:
+        where.append("d.member_id > ? AND d.member_id <= ?")
+        params.extend(id_range)
+        order = "d.member_id, d.due_date"
+    cur = conn.execute(f'''
+        SELECT m.id, m.name, m.residence, m.phone, d.vaccine, d.dose_label, d.due_date
+        FROM doses d JOIN members m ON m.id = d.member_id
+        WHERE {" AND ".join(where)}
+        ORDER BY {order}
+    ''', params)
+    columns = [c[0] for c in cur.description]
+    return columns, cur.fetchall()
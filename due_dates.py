@@ -0,0 +1,129 @@
+# Vectorized due-date engine for the KEPI schedule
+#
+# The schedule is compiled once into numeric offsets (calendar months + days),
+# then due dates for a whole cohort are computed as a NumPy datetime64 matrix
+# of shape (children, doses). Month arithmetic follows dateutil.relativedelta:
+# months are added first and the day is clipped to the target month's length,
+# then the day offset (weeks) is added. Cohorts spread over several schedules
+# use one union table with a per-schedule dose mask (compile_schedules).
+
+from collections import namedtuple
+from datetime import date
+
+import numpy as np
+
+from profiling import timed
+from schedule import parse_offset
+
+CompiledSchedule = namedtuple("CompiledSchedule", ["keys", "vaccines", "labels", "months", "days"])
+# Several schedules at once: union is a CompiledSchedule over every dose of
+# any schedule, member[i, j] says whether schedule names[i] has union dose j
+ScheduleTables = namedtuple("ScheduleTables", ["names", "union", "member"])
+
+
+# ============================
+# Schedule Compilation
+# ============================
+def compile_schedule(schedule):
+    keys, vaccines, labels, months, days = [], [], [], [], []
+    for vaccine, times in schedule.items():
+        for t in times:
+            m, d = parse_offset(t)
+            keys.append(f"{vaccine} - {t}")
+            vaccines.append(vaccine)
+            labels.append(t)
+            months.append(m)
+            days.append(d)
+    return CompiledSchedule(
+        tuple(keys), tuple(vaccines), tuple(labels),
+        np.array(months, dtype=np.int32), np.array(days, dtype=np.int32),
+    )
+
+
+def compile_schedules(schedules):
+    # {name: {vaccine: [ages]}} -> ScheduleTables. Offsets come from the age
+    # label alone, so a (vaccine, age) dose is due at the same offset in every
+    # schedule and one union table serves them all. The first schedule's
+    # doses keep their order, so a single schedule compiles to itself.
+    union = {}
+    for raw in schedules.values():
+        for vaccine, times in raw.items():
+            labels = union.setdefault(vaccine, [])
+            labels.extend(t for t in times if t not in labels)
+    compiled = compile_schedule(union)
+    index = {key: j for j, key in enumerate(compiled.keys)}
+    member = np.zeros((len(schedules), len(compiled.keys)), dtype=bool)
+    for i, raw in enumerate(schedules.values()):
+        for vaccine, times in raw.items():
+            member[i, [index[f"{vaccine} - {t}"] for t in times]] = True
+    return ScheduleTables(tuple(schedules), compiled, member)
+
+
+def as_tables(compiled, name="kepi"):
+    # A single CompiledSchedule as a one-schedule ScheduleTables
+    if isinstance(compiled, ScheduleTables):
+        return compiled
+    return ScheduleTables((name,), compiled, np.ones((1, len(compiled.keys)), dtype=bool))
+
+
+# ============================
+# Due Dates
+# ============================
+def to_day_array(dobs):
+    # Accepts ISO strings, dates or datetime64 values
+    return np.asarray(dobs, dtype="datetime64[D]")
+
+
+@timed("schedule")
+def due_date_matrix(dobs, compiled):
+    dob = to_day_array(dobs)[:, None]
+    month_start = dob.astype("datetime64[M]")
+    day_of_month = (dob - month_start.astype("datetime64[D]")).astype(np.int64)
+
+    target = month_start + compiled.months[None, :].astype("timedelta64[M]")
+    target_start = target.astype("datetime64[D]")
+    month_len = ((target + np.timedelta64(1, "M")).astype("datetime64[D]") - target_start).astype(np.int64)
+
+    clipped = np.minimum(day_of_month, month_len - 1)
+    return target_start + clipped.astype("timedelta64[D]") + compiled.days[None, :].astype("timedelta64[D]")
+
+
+@timed("schedule")
+def mixed_due_date_matrix(dobs, schedule_index, tables):
+    # (children, union doses) due dates for children on different schedules,
+    # NaT where a child's schedule has no such dose. schedule_index holds
+    # each child's row in tables.names. Dates are computed once per distinct
+    # birth date, which cohorts share heavily, then gathered per child.
+    days, inverse = np.unique(to_day_array(dobs), return_inverse=True)
+    due = due_date_matrix(days, tables.union)[inverse.ravel()]
+    return np.where(tables.member[np.asarray(schedule_index, dtype=np.intp)], due, np.datetime64("NaT", "D"))
+
+
+@timed("schedule")
+def taken_matrix(statuses, compiled):
+    # statuses: iterable of {"<vaccine> - <age>": bool} dicts, one per child
+    keys = compiled.keys
+    return np.array(
+        [[bool(s.get(k, False)) for k in keys] for s in statuses],
+        dtype=bool,
+    ).reshape(-1, len(keys))
+
+
+# ============================
+# Dashboard Counts
+# ============================
+@timed("schedule")
+def dashboard_counts(due, taken, today=None):
+    today = np.datetime64(today or date.today(), "D")
+    week_end = today + np.timedelta64(7, "D")
+
+    due_today = due == today
+    overdue = (due < today) & ~taken
+    upcoming = (due > today) & (due <= week_end)
+
+    return {
+        "due_today": int(due_today.sum()),
+        "next_7_days": int(upcoming.sum()),
+        "overdue": int(overdue.sum()),
+        "completed": int(taken.sum()),
+    }
@@ -0,0 +1,173 @@
+# Analytics exports: members, doses and reactions as Parquet, Arrow or CSV
+#
+# Rows are streamed out of SQLite in id-ordered chunks (keyset pagination) and
+# each chunk is appended to the output file, so memory stays bounded by the
+# chunk size whatever the table size. The members export flattens dose status
+# into one given-date column per scheduled dose, pivoted inside SQLite.
+# Parquet/Arrow need pyarrow, which is optional; CSV always works. Files are
+# written next to their final name and renamed when complete.
+#
+#   python cli.py export members --format parquet --out members.parquet
+
+import csv
+import importlib.util
+import os
+
+FORMATS = {"parquet": ".parquet", "arrow": ".arrow", "csv": ".csv"}
+DATASETS = ("members", "doses", "reactions")
+DATE_COLUMNS = {"dob", "due_date", "given_date", "date"}
+
+MEMBER_COLUMNS = ("id", "name", "dob", "gender", "residence", "phone", "schedule")
+DOSE_COLUMNS = ("id", "member_id", "vaccine", "dose_label", "due_date", "given_date")
+REACTION_COLUMNS = ("id", "member_id", "vaccine", "vaccine_key", "dose_label", "date", "notes")
+
+
+def has_pyarrow():
+    return importlib.util.find_spec("pyarrow") is not None
+
+
+def available_formats():
+    return list(FORMATS) if has_pyarrow() else ["csv"]
+
+
+# ============================
+# Chunked Readers
+# ============================
+def _keyset(conn, sql, chunk_size):
+    # sql selects from a table aliased t, with "{where}" where the id filter goes
+    last_id = 0
+    while True:
+        rows = conn.execute(sql.format(where="t.id > ?") + " ORDER BY t.id LIMIT ?", (last_id, chunk_size)).fetchall()
+        if not rows:
+            return
+        yield rows
+        last_id = rows[-1][0]
+
+
+def dataset_columns(dataset, keys=()):
+    if dataset == "members":
+        return MEMBER_COLUMNS + tuple(f"{v} - {label}" for v, label in keys)
+    return {"doses": DOSE_COLUMNS, "reactions": REACTION_COLUMNS}[dataset]
+
+
+def dose_keys(compiled):
+    return list(zip(compiled.vaccines, compiled.labels))
+
+
+def iter_members(conn, keys, chunk_size=50_000):
+    # Members with one given-date column per (vaccine, dose label); NULL means
+    # not given. The pivot runs per chunk over that chunk's dose rows only.
+    pivot = ", ".join(
+        f"MAX(CASE WHEN vaccine = ? AND dose_label = ? THEN given_date END) AS c{i}" for i in range(len(keys))
+    )
+    pivot_params = [v for key in keys for v in key]
+    dose_cols = ", ".join(f"d.c{i}" for i in range(len(keys)))
+
+    last_id = 0
+    while True:
+        bounds = conn.execute(
+            "SELECT MIN(id), MAX(id) FROM (SELECT id FROM members WHERE id > ? ORDER BY id LIMIT ?)",
+            (last_id, chunk_size),
+        ).fetchone()
+        if bounds[0] is None:
+            return
+        lo, hi = last_id, bounds[1]
+        rows = conn.execute(f'''
+            SELECT {", ".join("m." + c for c in MEMBER_COLUMNS)}{", " + dose_cols if keys else ""}
+            FROM members m
+            LEFT JOIN (
+                SELECT member_id{", " + pivot if keys else ""} FROM doses
+                WHERE member_id > ? AND member_id <= ? GROUP BY member_id
+            ) d ON d.member_id = m.id
+            WHERE m.id > ? AND m.id <= ?
+            ORDER BY m.id
+        ''', pivot_params + [lo, hi, lo, hi]).fetchall()
+        yield rows
+        last_id = hi
+
+
+def iter_dataset(conn, dataset, keys=(), chunk_size=50_000):
+    # Lists of row tuples in dataset_columns() order
+    if dataset == "members":
+        return iter_members(conn, keys, chunk_size)
+    if dataset == "doses":
+        return _keyset(conn, f"SELECT {', '.join('t.' + c for c in DOSE_COLUMNS)} FROM doses t WHERE {{where}}",
+                       chunk_size)
+    if dataset == "reactions":
+        return _keyset(conn, f"SELECT {', '.join('t.' + c for c in REACTION_COLUMNS)} FROM reactions t WHERE {{where}}",
+                       chunk_size)
+    raise ValueError(f"Unknown dataset: {dataset!r}")
+
+
+# ============================
+# Writers
+# ============================
+def _arrow_table(columns, rows, dose_columns):
+    import pyarrow as pa
+    import pyarrow.compute as pc
+
+    data = {}
+    for i, name in enumerate(columns):
+        values = [r[i] for r in rows]
+        if name in ("id", "member_id"):
+            # Legacy blob ids are rewritten by init_schema (reactions.py)
+            bad = next((v for v in values if v is not None and not isinstance(v, int)), None)
+            if bad is not None:
+                raise ValueError(f"Non-integer {name} {bad!r}; open the database with init_schema first")
+            data[name] = pa.array(values, type=pa.int64())
+        elif name in DATE_COLUMNS or name in dose_columns:
+            # Malformed legacy dates become nulls rather than failing the export
+            text = pa.array([None if v is None else str(v) for v in values], type=pa.string())
+            data[name] = pc.strptime(text, format="%Y-%m-%d", unit="s", error_is_null=True).cast(pa.date32())
+        else:
+            data[name] = pa.array([None if v is None else str(v) for v in values], type=pa.string())
+    return pa.table(data)
+
+
+def _arrow_writer(fmt, sink, schema):
+    import pyarrow.ipc
+    import pyarrow.parquet as pq
+
+    if fmt == "parquet":
+        return pq.ParquetWriter(sink, schema, compression="zstd")
+    return pyarrow.ipc.new_file(sink, schema)
+
+
+def write_export(conn, dataset, fmt, path, keys=(), chunk_size=50_000, progress=None):
+    # Streams one dataset to path, one chunk (row group / record batch) at a
+    # time; progress(rows written) after every chunk. Returns the row count.
+    if fmt not in FORMATS:
+        raise ValueError(f"Unknown format: {fmt!r}")
+    if fmt != "csv" and not has_pyarrow():
+        raise RuntimeError("Parquet and Arrow exports need pyarrow (pip install pyarrow)")
+
+    columns = dataset_columns(dataset, keys)
+    dose_columns = set(columns[len(MEMBER_COLUMNS):]) if dataset == "members" else set()
+    tmp_path = f"{path}.part"
+    written = 0
+    try:
+        if fmt == "csv":
+            with open(tmp_path, "w", newline="", encoding="utf-8") as f:
+                writer = csv.writer(f)
+                writer.writerow(columns)
+                for rows in iter_dataset(conn, dataset, keys, chunk_size):
+                    writer.writerows(rows)
+                    written += len(rows)
+                    if progress:
+                        progress(written)
+        else:
+            with open(tmp_path, "wb") as sink:
+                writer = _arrow_writer(fmt, sink, _arrow_table(columns, [], dose_columns).schema)
+                try:
+                    for rows in iter_dataset(conn, dataset, keys, chunk_size):
+                        writer.write_table(_arrow_table(columns, rows, dose_columns))
+                        written += len(rows)
+                        if progress:
+                            progress(written)
+                finally:
+                    writer.close()
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+    return written
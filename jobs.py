@@ -0,0 +1,468 @@
+# Background job queue
+#
+# Long tasks (bulk PDFs, data exports, aggregate rebuilds) are submitted as
+# rows of the jobs table and run by a JobRunner: worker threads that claim
+# queued rows one at a time, so a big export neither blocks the Streamlit
+# script thread nor restarts on every rerun. Bulk PDFs render in a separate
+# interpreter that fans out to worker processes (pdf_reports.py). Pages poll
+# the row for progress and offer the result file once it is done.
+#
+# Results are cached on disk. A job's key hashes its kind, its parameters and
+# the data_version at submit time: the same user submitting the same export
+# again while the data is unchanged gets the finished job at once, and a
+# duplicate of their queued or running job joins it instead of starting
+# another. Result files hold member data, so they live under
+# exports/jobs/<random token>/, outside Streamlit's static folder, and
+# result_path() hands them only to the user who submitted the job, for
+# MAX_AGE_DAYS; older jobs are pruned with their files.
+#
+# The app runs a small runner in each Streamlit process (JOB_WORKERS, default
+# 2; 0 leaves the work to a separate process):
+#
+#   python jobs.py --workers 4     # standalone worker process
+#   python jobs.py --once          # run what is queued, then exit
+
+import argparse
+import hashlib
+import json
+import os
+import re
+import secrets
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import traceback
+from contextlib import closing
+
+from exports import FORMATS
+
+RESULT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "exports", "jobs")
+# Where results used to go, served to anyone with the URL
+LEGACY_RESULT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "static", "jobs")
+PDF_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "pdf_reports.py")
+POLL_SECONDS = 1.0
+HEARTBEAT_SECONDS = 10
+STALE_SECONDS = 60        # a running job without a heartbeat for this long is orphaned
+MAX_ATTEMPTS = 3
+PROGRESS_SECONDS = 0.5    # progress is written at most this often
+MAX_AGE_DAYS = 7
+
+JOBS_SCHEMA = [
+    '''
+    CREATE TABLE IF NOT EXISTS jobs (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        kind TEXT NOT NULL,
+        params TEXT NOT NULL,
+        cache_key TEXT NOT NULL,
+        status TEXT NOT NULL DEFAULT 'queued',
+        done INTEGER NOT NULL DEFAULT 0,
+        total INTEGER,
+        message TEXT,
+        result TEXT,
+        summary TEXT,
+        error TEXT,
+        submitted_by TEXT,
+        worker TEXT,
+        attempts INTEGER NOT NULL DEFAULT 0,
+        created_at REAL NOT NULL,
+        started_at REAL,
+        heartbeat_at REAL,
+        finished_at REAL
+    )
+    ''',
+    "CREATE INDEX IF NOT EXISTS idx_jobs_key ON jobs (cache_key, status)",
+    "CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs (status, id)",
+]
+
+JOB_COLUMNS = ("id", "kind", "params", "status", "done", "total", "message", "result", "summary", "error",
+               "submitted_by", "created_at", "started_at", "finished_at")
+
+
+def create_jobs_table(conn):
+    for ddl in JOBS_SCHEMA:
+        conn.execute(ddl)
+    # Results from older versions are deleted rather than left publicly
+    # served; their jobs simply run again when resubmitted
+    shutil.rmtree(LEGACY_RESULT_DIR, ignore_errors=True)
+
+
+class JobCancelled(Exception):
+    pass
+
+
+# ============================
+# Tasks
+# ============================
+# fn(db_path, params, path, progress) -> JSON-able summary. path is where
+# the result file goes (None for tasks without one); progress(done, total,
+# message) may be called as often as convenient.
+TASKS = {}
+
+
+def task(kind, filename=None, cached=True):
+    # filename(params) names the result file; cached=False tasks always run
+    def register(fn):
+        TASKS[kind] = (fn, filename, cached)
+        return fn
+    return register
+
+
+def _slug(text):
+    return re.sub(r"[^A-Za-z0-9_-]+", "_", text)
+
+
+@task("records_zip", lambda p: f"{_slug(p.get('residence') or 'all')}_records.zip")
+def _records_zip(db_path, params, path, progress):
+    # Not a process pool of our own: forked from this threaded server the
+    # workers can deadlock on copied locks, and spawned they would re-run the
+    # Streamlit script, which multiprocessing re-imports as their __main__
+    command = [sys.executable, PDF_SCRIPT, path, "--db", db_path, "--progress"]
+    if params.get("residence"):
+        command += ["--residence", params["residence"]]
+    done, skipped = 0, 0
+    with tempfile.TemporaryFile("w+") as errors:
+        proc = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=errors, text=True)
+        try:
+            for line in proc.stdout:
+                if line.startswith("skipped"):
+                    skipped += 1
+                    continue
+                done, total = map(int, line.split())
+                progress(done, total)
+        except BaseException:
+            proc.kill()
+            raise
+        finally:
+            proc.stdout.close()
+            proc.wait()
+        if proc.returncode:
+            errors.seek(0)
+            lines = errors.read().strip().splitlines()
+            raise RuntimeError(lines[-1] if lines else f"pdf_reports.py exited with {proc.returncode}")
+    # Skipped records (names the PDF font cannot draw) are listed in the ZIP
+    return {"records": done - skipped, "skipped": skipped} if skipped else {"records": done}
+
+
+@task("members_pdf", lambda p: "registered_children.pdf")
+def _members_pdf(db_path, params, path, progress):
+    from db import connect
+    from pdf_reports import members_list_pdf
+
+    with closing(connect(db_path)) as conn:
+        rows = conn.execute("SELECT name, dob, gender, residence FROM members ORDER BY id").fetchall()
+    progress(0, len(rows), "Rendering PDF")
+    with open(path, "wb") as f:
+        f.write(members_list_pdf(rows))
+    return {"children": len(rows)}
+
+
+@task("analytics_export", lambda p: p["dataset"] + FORMATS[p["fmt"]])
+def _analytics_export(db_path, params, path, progress):
+    from db import connect
+    from exports import write_export
+
+    with closing(connect(db_path)) as conn:
+        rows = write_export(conn, params["dataset"], params["fmt"], path, tuple(params.get("keys", ())),
+                            progress=lambda n: progress(n, None, f"{n} rows written"))
+    return {"rows": rows}
+
+
+@task("rebuild_aggregates", cached=False)
+def _rebuild_aggregates(db_path, params, path, progress):
+    import aggregates
+    import next_due
+    from db import connect
+
+    with closing(connect(db_path)) as conn:
+        # Committed step by step: progress updates write to the same database
+        progress(0, 2, "Rebuilding coverage aggregates")
+        aggregates.rebuild(conn)
+        conn.commit()
+        progress(1, 2, "Rebuilding the next-due index")
+        next_due.rebuild(conn)
+        conn.commit()
+    return {}
+
+
+# ============================
+# Submitting & Polling
+# ============================
+def _cache_key(conn, kind, encoded):
+    from db import read_versions
+    version = read_versions(conn)[0]
+    return hashlib.sha256(json.dumps([kind, encoded, version]).encode()).hexdigest()
+
+
+def submit(conn, kind, params=None, submitted_by=None):
+    # Returns (job id, reused): reused is True when the same user already has
+    # an identical job (same parameters, same data) queued, running or done
+    # within MAX_AGE_DAYS. Other users' jobs are never reused, so a result is
+    # only ever served to the user who asked for it.
+    if kind not in TASKS:
+        raise ValueError(f"Unknown job kind: {kind!r}")
+    encoded = json.dumps(params or {}, sort_keys=True)
+    key = _cache_key(conn, kind, encoded)
+    _, filename, cached = TASKS[kind]
+    statuses = ("queued", "running", "done") if cached else ("queued", "running")
+    for job_id, status, result, finished_at in conn.execute(
+        f"SELECT id, status, result, finished_at FROM jobs WHERE cache_key = ? AND submitted_by IS ? "
+        f"AND status IN ({', '.join('?' * len(statuses))}) ORDER BY id DESC", (key, submitted_by, *statuses),
+    ):
+        if status != "done" or filename is None or _servable(result, finished_at):
+            return job_id, True
+    cur = conn.execute(
+        "INSERT INTO jobs (kind, params, cache_key, submitted_by, created_at) VALUES (?, ?, ?, ?, ?)",
+        (kind, encoded, key, submitted_by, time.time()),
+    )
+    return cur.lastrowid, False
+
+
+def _as_dict(row):
+    job = dict(zip(JOB_COLUMNS, row))
+    job["params"] = json.loads(job["params"])
+    job["summary"] = json.loads(job["summary"]) if job["summary"] else None
+    return job
+
+
+def get(conn, job_id):
+    row = conn.execute(f"SELECT {', '.join(JOB_COLUMNS)} FROM jobs WHERE id = ?", (job_id,)).fetchone()
+    return _as_dict(row) if row else None
+
+
+def recent(conn, submitted_by=None, limit=20):
+    where, params = ("submitted_by = ?", [submitted_by]) if submitted_by else ("1", [])
+    return [_as_dict(r) for r in conn.execute(
+        f"SELECT {', '.join(JOB_COLUMNS)} FROM jobs WHERE {where} ORDER BY id DESC LIMIT ?", params + [limit])]
+
+
+def cancel(conn, job_id):
+    # A running job stops at its next progress update
+    return conn.execute(
+        "UPDATE jobs SET status = 'cancelled', finished_at = ? WHERE id = ? AND status IN ('queued', 'running')",
+        (time.time(), job_id),
+    ).rowcount > 0
+
+
+def _expired(finished_at, now=None):
+    return (now or time.time()) - finished_at > MAX_AGE_DAYS * 86400
+
+
+def _servable(result, finished_at, now=None):
+    return bool(result) and not _expired(finished_at, now) and os.path.isfile(os.path.join(RESULT_DIR, result))
+
+
+def result_path(job, user, now=None):
+    # The result file of a finished job, only for the user who submitted it
+    # and only until it expires; None otherwise. Check this before serving.
+    if job["status"] != "done" or user is None or job["submitted_by"] != user:
+        return None
+    if not _servable(job["result"], job["finished_at"], now):
+        return None
+    return os.path.join(RESULT_DIR, job["result"])
+
+
+# ============================
+# Maintenance
+# ============================
+def requeue_stale(conn, now=None):
+    # Jobs whose worker stopped heartbeating go back to the queue, or fail
+    # after MAX_ATTEMPTS
+    now = now or time.time()
+    stale = now - STALE_SECONDS
+    conn.execute('''
+        UPDATE jobs SET status = 'failed', error = 'The worker stopped while running this job', finished_at = ?
+        WHERE status = 'running' AND heartbeat_at < ? AND attempts >= ?
+    ''', (now, stale, MAX_ATTEMPTS))
+    return conn.execute(
+        "UPDATE jobs SET status = 'queued', worker = NULL WHERE status = 'running' AND heartbeat_at < ?", (stale,)
+    ).rowcount
+
+
+def prune(conn, max_age_days=MAX_AGE_DAYS, now=None):
+    # Deletes finished jobs older than max_age_days and their result files
+    cutoff = (now or time.time()) - max_age_days * 86400
+    rows = conn.execute(
+        "SELECT id, result FROM jobs WHERE status IN ('done', 'failed', 'cancelled') AND finished_at < ?", (cutoff,)
+    ).fetchall()
+    for _, result in rows:
+        if result:
+            shutil.rmtree(os.path.join(RESULT_DIR, os.path.dirname(result)), ignore_errors=True)
+    conn.executemany("DELETE FROM jobs WHERE id = ?", [(r[0],) for r in rows])
+    return len(rows)
+
+
+# ============================
+# Worker Pool
+# ============================
+def claim(conn, worker):
+    # Atomically takes the oldest queued job: (id, kind, params) or None
+    now = time.time()
+    row = conn.execute('''
+        UPDATE jobs SET status = 'running', worker = ?, attempts = attempts + 1,
+                        started_at = ?, heartbeat_at = ?, done = 0, total = NULL, message = NULL
+        WHERE id = (SELECT id FROM jobs WHERE status = 'queued' ORDER BY id LIMIT 1)
+        RETURNING id, kind, params
+    ''', (worker, now, now)).fetchall()
+    conn.commit()
+    return row[0] if row else None
+
+
+class _Progress:
+    # The progress callback handed to a task; raises JobCancelled once the
+    # job's row is no longer 'running'
+    def __init__(self, conn, job_id):
+        self.conn = conn
+        self.job_id = job_id
+        self.last = 0.0
+
+    def __call__(self, done, total=None, message=None):
+        now = time.monotonic()
+        if now - self.last < PROGRESS_SECONDS and (total is None or done < total):
+            return
+        self.last = now
+        updated = self.conn.execute('''
+            UPDATE jobs SET done = ?, total = COALESCE(?, total), message = COALESCE(?, message), heartbeat_at = ?
+            WHERE id = ? AND status = 'running'
+        ''', (int(done), total, message, time.time(), self.job_id)).rowcount
+        self.conn.commit()
+        if not updated:
+            raise JobCancelled()
+
+
+class JobRunner:
+    def __init__(self, db_path, workers=2, poll=POLL_SECONDS):
+        self.db_path = db_path
+        self.workers = workers
+        self.poll = poll
+        self.name = f"{socket.gethostname()}:{os.getpid()}:{secrets.token_hex(3)}"
+        self._stop = threading.Event()
+        self._threads = []
+
+    def start(self):
+        from db import connect
+
+        with closing(connect(self.db_path)) as conn:
+            create_jobs_table(conn)
+            requeue_stale(conn)
+            prune(conn)
+            conn.commit()
+        self._threads = [threading.Thread(target=self._work, name=f"jobs-{i}", daemon=True)
+                         for i in range(self.workers)]
+        self._threads.append(threading.Thread(target=self._heartbeat, name="jobs-heartbeat", daemon=True))
+        for thread in self._threads:
+            thread.start()
+        return self
+
+    def stop(self, timeout=None):
+        self._stop.set()
+        for thread in self._threads:
+            thread.join(timeout)
+
+    def run_pending(self):
+        # Runs queued jobs in the calling thread until the queue is empty;
+        # returns how many ran
+        from db import connect
+
+        count = 0
+        with closing(connect(self.db_path)) as conn:
+            while (job := claim(conn, self.name)) is not None:
+                self._run(conn, *job)
+                count += 1
+        return count
+
+    def _work(self):
+        from db import connect
+
+        with closing(connect(self.db_path)) as conn:
+            while not self._stop.is_set():
+                job = claim(conn, self.name)
+                if job is None:
+                    self._stop.wait(self.poll)
+                else:
+                    self._run(conn, *job)
+
+    def _heartbeat(self):
+        from db import connect
+
+        with closing(connect(self.db_path)) as conn:
+            last_prune = time.monotonic()
+            while not self._stop.wait(HEARTBEAT_SECONDS):
+                conn.execute("UPDATE jobs SET heartbeat_at = ? WHERE worker = ? AND status = 'running'",
+                             (time.time(), self.name))
+                requeue_stale(conn)
+                if time.monotonic() - last_prune > 3600:
+                    prune(conn)
+                    last_prune = time.monotonic()
+                conn.commit()
+
+    def _run(self, conn, job_id, kind, params):
+        fn, filename, _ = TASKS[kind]
+        params = json.loads(params)
+        result, directory, path = None, None, None
+        if filename:
+            token = secrets.token_hex(16)
+            directory = os.path.join(RESULT_DIR, token)
+            os.makedirs(directory, exist_ok=True)
+            result = f"{token}/{filename(params)}"
+            path = os.path.join(RESULT_DIR, result)
+        try:
+            summary = fn(self.db_path, params, path, _Progress(conn, job_id))
+        except JobCancelled:
+            conn.rollback()
+            if directory:
+                shutil.rmtree(directory, ignore_errors=True)
+            return
+        except Exception as e:
+            conn.rollback()
+            traceback.print_exc()
+            if directory:
+                shutil.rmtree(directory, ignore_errors=True)
+            conn.execute(
+                "UPDATE jobs SET status = 'failed', error = ?, finished_at = ? WHERE id = ? AND status = 'running'",
+                (f"{type(e).__name__}: {e}", time.time(), job_id),
+            )
+            conn.commit()
+            return
+        finished = conn.execute('''
+            UPDATE jobs SET status = 'done', done = COALESCE(total, done), result = ?, summary = ?, finished_at = ?
+            WHERE id = ? AND status = 'running'
+        ''', (result, json.dumps(summary or {}), time.time(), job_id)).rowcount
+        conn.commit()
+        if not finished and directory:
+            # Cancelled after the last progress update
+            shutil.rmtree(directory, ignore_errors=True)
+
+
+def main():
+    from db import connect, init_schema
+    from schedule import load_schedule
+
+    parser = argparse.ArgumentParser(description="Run background jobs queued by the app.")
+    parser.add_argument("--db", default="members.db")
+    parser.add_argument("--schedule", default="kepi_schedule.json")
+    parser.add_argument("--workers", type=int, default=2)
+    parser.add_argument("--once", action="store_true", help="run the queued jobs, then exit")
+    args = parser.parse_args()
+
+    with closing(connect(args.db)) as conn:
+        init_schema(conn, lambda: load_schedule(args.schedule).compiled())
+        conn.commit()
+    runner = JobRunner(args.db, args.workers)
+    if args.once:
+        print(f"✅ {runner.run_pending()} job(s) run")
+        return
+    runner.start()
+    print(f"👷 {args.workers} worker(s) waiting for jobs (Ctrl+C to stop)")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        runner.stop(timeout=5)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,26 +1,33 @@
 # Child Vaccination Schedule Assistant 
 
 import streamlit as st
-import pandas as pd
 import sqlite3
 import json
-from datetime import datetime, timedelta
-from dateutil.relativedelta import relativedelta
-from fpdf import FPDF
-from io import BytesIO
-import plotly.express as px
-from twilio.rest import Client
-import hashlib
-import base64
-import textwrap
-
-# ============================
-# Twilio Setup (Update credentials before deployment)
-# ============================
-TWILIO_SID = "your_twilio_account_sid"
-TWILIO_AUTH_TOKEN = "your_twilio_auth_token"
-TWILIO_FROM = "+1234567890"  # Twilio phone number
-client = Client(TWILIO_SID, TWILIO_AUTH_TOKEN)
+import os
+import time
+from db import ConnectionPool, init_schema, bump_data_version, read_versions
+from schedule import DEFAULT_SCHEDULE, ScheduleRegistry
+from assistant import get_engine
+from auth import (SessionCache, LoginThrottled, authenticate, register_user, remember_token,
+                  revoke_remember_tokens, verify_remember_token, normalize_email, REMEMBER_TTL)
+from search import (search_members, member_by_id, member_page, count_matching, residences,
+                    COUNT_CAP, PAGE_COLUMNS, SORT_KEYS)
+from doses import (insert_child_doses, assign_schedule, apply_dose_changes, DoseConflict,
+                   member_doses, dose_status)
+from aggregates import coverage_by, monthly_coverage
+from reports import dashboard_summary
+from next_due import OUTREACH_COLUMNS, count_between, due_between
+import jobs
+from reactions import RATE_GROUPS, log_reaction, member_reactions, reaction_rates, vaccine_lookup
+from profiling import (timed, metrics, cprofile, profile_report, profile_bytes, maybe_dump,
+                       WINDOW as PROFILE_WINDOW)
+
+# Heavy modules (pandas, numpy, plotly, fpdf) are imported inside the
+# page functions that need them, so the login screen renders with the
+# minimal set above and each page pays its import cost on first visit only.
+
+# SMS reminders run outside the app (reminders.py), with Twilio credentials
+# from TWILIO_SID / TWILIO_AUTH_TOKEN / TWILIO_FROM
 
 # ============================
 # App Configuration
@@ -31,87 +38,159 @@ st.set_page_config(page_title="Child Vaccination Assistant", layout="wide")
 # Database Setup
 # ============================
 DB_FILE = 'members.db'
+EXPORT_DIR = 'exports'
 
+@st.cache_resource
 def init_db():
-    import os
-    st.write("🔍 Using DB file:", os.path.abspath(DB_FILE))
-
-    conn = sqlite3.connect(DB_FILE)
-    c = conn.cursor()
-    c.execute('''
-        CREATE TABLE IF NOT EXISTS members (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            name TEXT NOT NULL,
-            dob TEXT NOT NULL,
-            gender TEXT,
-            residence TEXT,
-            phone TEXT,
-            vaccines TEXT
-        )
-    ''')
-    c.execute('''
-        CREATE TABLE IF NOT EXISTS reactions (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            member_id INTEGER,
-            vaccine TEXT,
-            date TEXT,
-            notes TEXT
-        )
-    ''')
-    c.execute('''
-        CREATE TABLE IF NOT EXISTS users (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            email TEXT UNIQUE NOT NULL,
-            pin TEXT NOT NULL
-        )
-    ''')
-    conn.commit()
-    conn.close()
+    # Runs once per process; every rerun reuses the same connection pool
+    print("🔍 Using DB file:", os.path.abspath(DB_FILE))
+    pool = ConnectionPool(DB_FILE)
+    with pool.connection() as conn:
+        # The schedule is only compiled if legacy rows still need migrating
+        migrated = init_schema(conn, compiled_schedule)
+    if migrated:
+        print(f"🔁 Migrated vaccine status of {migrated} members to the doses table")
+    return pool
+
+
+@st.cache_resource
+def cohort_store():
+    # Compact per-process arrays for overdue lists (see cohort_store.py)
+    from cohort_store import CohortStore
+    return CohortStore()
 
-init_db()
+
+OVERDUE_SHOWN = 1000
+
+
+def has_members():
+    return bool(db.query_one("SELECT EXISTS (SELECT 1 FROM members)")[0])
 
 # ============================
 # Load KEPI Vaccine Schedule JSON
 # ============================
-with open("vaccine_info.json", "r") as f:
-    vaccine_data = json.load(f)
+@st.cache_data
+def load_vaccine_data():
+    with open("vaccine_info.json", "r") as f, timed("deserialize", "vaccine_info.json"):
+        vaccine_data = json.load(f)
 
-# ✅ Safe conversion from list to dict if necessary
-if isinstance(vaccine_data, list):
-    try:
-        vaccine_data = {v['name']: v for v in vaccine_data if isinstance(v, dict) and 'name' in v}
-    except Exception as e:
-        st.error("❌ Error processing vaccine_info.json. Please check its format.")
+    # ✅ Safe conversion from list to dict if necessary
+    if isinstance(vaccine_data, list):
+        try:
+            vaccine_data = {v['name']: v for v in vaccine_data if isinstance(v, dict) and 'name' in v}
+        except Exception as e:
+            st.error("❌ Error processing vaccine_info.json. Please check its format.")
+            st.stop()
+
+    elif not isinstance(vaccine_data, dict):
+        st.error("❌ vaccine_info.json must be a list of vaccine dicts or a dict.")
         st.stop()
 
-elif not isinstance(vaccine_data, dict):
-    st.error("❌ vaccine_info.json must be a list of vaccine dicts or a dict.")
-    st.stop()
+    return vaccine_data
 
-kepi_schedule = {
-    "BCG": ["0 weeks"],
-    "OPV": ["0 weeks", "6 weeks", "10 weeks", "14 weeks"],
-    "Rotavirus": ["6 weeks", "10 weeks"],
-    "Pneumo_conj": ["6 weeks", "10 weeks", "14 weeks"],
-    "DTwPHibHepB": ["6 weeks", "10 weeks", "14 weeks"],
-    "IPV": ["14 weeks"],
-    "Yellow Fever": ["9 months"],
-    "Measles": ["9 months", "18 months"],
-    "HPV": ["10 years", "10 years 6 months"]
-}
+# ============================
+# Schedules (kepi_schedule.json + schedules/*.json, reloaded when files change)
+# ============================
+SCHEDULE_FILE = "kepi_schedule.json"
+
+
+@st.cache_resource
+def schedule_registry():
+    # One registry, and so one (schedule, DOB) due-date memo, per process
+    return ScheduleRegistry(SCHEDULE_FILE)
+
+
+def compiled_schedule():
+    # The default schedule; legacy JSON rows are migrated against it
+    return schedule_registry().get(DEFAULT_SCHEDULE).compiled()
+
+
+def schedule_tables():
+    # Every schedule's doses in one table, for views across mixed cohorts
+    return schedule_registry().tables()
+
+db = init_db()
+
+
+@st.cache_resource
+def job_runner():
+    # Background workers for this process; JOB_WORKERS=0 leaves the queue to
+    # a separate `python jobs.py` process
+    workers = int(os.environ.get("JOB_WORKERS", "2"))
+    runner = jobs.JobRunner(DB_FILE, workers)
+    return runner.start() if workers else runner
+
+
+job_runner()
 
 # ============================
-# PIN Protection (Email + PIN with Hashing)
+# PIN Protection (Email + PIN, salted KDF, throttled; see auth.py)
 # ============================
-def hash_pin(pin):
-    return hashlib.sha256(pin.encode()).hexdigest()
+@st.cache_resource
+def auth_sessions():
+    # Logged-in sessions of every browser tab served by this process
+    return SessionCache()
+
+
+def client_ip():
+    return getattr(st.context, "ip_address", None)
+
+
+def start_session(email):
+    st.session_state.session_token = auth_sessions().create(email)
+    st.session_state.authenticated = True
+    st.session_state.user_email = email
+
+
+# "Remember Me" token: kept in a cookie, never in the URL, where it would end
+# up in browser history, proxy logs and shared links
+REMEMBER_COOKIE = "remember"
+
+
+def set_remember_cookie(token, max_age=REMEMBER_TTL):
+    # Streamlit has no server-side cookie API, so the browser sets it; the
+    # server reads it back through st.context.cookies on the next visit
+    st.html(
+        f"<script>document.cookie = '{REMEMBER_COOKIE}={token}; max-age={max_age}; path=/; SameSite=Strict';</script>",
+        unsafe_allow_javascript=True,
+    )
+
+
+def logout():
+    auth_sessions().revoke(st.session_state.get("session_token"))
+    # Remember-me tokens are revoked server-side too, so a copied cookie stops
+    # working even though the browser cannot be made to forget it
+    if st.session_state.get("user_email"):
+        with db.connection() as conn:
+            revoke_remember_tokens(conn, st.session_state.user_email)
+    for key in ("session_token", "authenticated", "user_email"):
+        st.session_state.pop(key, None)
+    # This session still sees the cookie it connected with; ignore it and
+    # clear it in the browser from the login screen
+    st.session_state.forget_remembered = True
 
-def check_pin():
-    if "authenticated" not in st.session_state:
-        st.session_state.authenticated = False
 
-    if st.session_state.authenticated:
+def check_pin():
+    # Authenticated reruns only look up the token in memory
+    if auth_sessions().get(st.session_state.get("session_token")):
         return True
+    st.session_state.authenticated = False
+
+    # "Remember Me": a signed token in a cookie restores the session. Links
+    # from older versions carry it in the URL; it is moved to the cookie.
+    from_url = st.query_params.pop("remember", None)
+    remembered = None if st.session_state.get("forget_remembered") else (
+        from_url or st.context.cookies.get(REMEMBER_COOKIE))
+    if remembered:
+        with db.connection() as conn:
+            email = verify_remember_token(conn, remembered)
+        if email:
+            start_session(email)
+            if from_url:
+                set_remember_cookie(from_url)
+            return True
+    if remembered or st.session_state.get("forget_remembered"):
+        set_remember_cookie("", max_age=0)
 
     # 🔐 Main screen introduction
     st.title("🔐 Welcome to the Child Vaccination Assistant")
@@ -132,9 +211,6 @@ def check_pin():
     pin = st.sidebar.text_input("🔑 6-digit PIN", type="password")
     remember = st.sidebar.checkbox("Remember Me")
 
-    conn = sqlite3.connect(DB_FILE)
-    c = conn.cursor()
-
     if auth_mode == "Register":
         pin_confirm = st.sidebar.text_input("🔁 Repeat PIN", type="password")
         if st.sidebar.button("✅ Register"):
@@ -144,27 +220,31 @@ def check_pin():
                 st.sidebar.error("PINs do not match.")
             else:
                 try:
-                    hashed = hash_pin(pin)
-                    c.execute("INSERT INTO users (email, pin) VALUES (?, ?)", (email, hashed))
-                    conn.commit()
+                    with db.connection() as conn:
+                        register_user(conn, email, pin)
                     st.sidebar.success("Registration successful. Please log in.")
                 except sqlite3.IntegrityError:
                     st.sidebar.error("Email already registered.")
 
     elif auth_mode == "Login":
         if st.sidebar.button("🔓 Login"):
-            hashed = hash_pin(pin)
-            c.execute("SELECT * FROM users WHERE email=? AND pin=?", (email, hashed))
-            result = c.fetchone()
-            if result:
-                st.session_state.authenticated = True
-                st.session_state.user_email = email
+            try:
+                with db.connection() as conn:
+                    ok = authenticate(conn, email, pin, client_ip())
+                    token = remember_token(conn, email) if ok and remember else None
+            except LoginThrottled as e:
+                st.sidebar.error(f"⏳ {e}")
+                return False
+            if ok:
+                start_session(normalize_email(email))
+                st.session_state.pop("forget_remembered", None)
+                if token:
+                    set_remember_cookie(token)
                 st.sidebar.success(f"Welcome back, {email.split('@')[0].title()}!")
                 return True
             else:
                 st.sidebar.error("Invalid email or PIN.")
 
-    conn.close()
     return False
 
 # 🔐 Stop page if not logged in
@@ -174,16 +254,65 @@ if not check_pin():
 # ============================
 # Sidebar Menu
 # ============================
-menu = st.sidebar.radio("🌟 Navigate", [
+PAGES = [
     "🏠 Dashboard",
     "➕ Register Child",
     "📚 Vaccine Info",
     "📆 Vaccination Status",
+    "📈 Vaccination Trends",
     "📝 Reaction Logs",
     "🤖 Vaccine Assistant",
     "👥 View Members",
     "📤 Export Report"
-])
+]
+# The Performance page (timing resets, aggregate rebuilds, cProfile dumps) is
+# shown to the ADMIN_EMAILS users (comma-separated), or to everyone with
+# PERFORMANCE_PAGE=1; neither set, nobody sees it
+ADMIN_EMAILS = {e.strip().lower() for e in os.environ.get("ADMIN_EMAILS", "").split(",") if e.strip()}
+if (st.session_state.get("user_email") in ADMIN_EMAILS if ADMIN_EMAILS
+        else os.environ.get("PERFORMANCE_PAGE") == "1"):
+    PAGES.append("🛠️ Performance")
+menu = st.sidebar.radio("🌟 Navigate", PAGES)
+if st.sidebar.button("🚪 Logout"):
+    logout()
+    st.rerun()
+
+
+# ============================
+# Child Lookup (server-side search, paginated, selected by id)
+# ============================
+def select_child(key, label="Select Child", page_size=25):
+    query = st.text_input("🔎 Search by name, residence or phone", key=f"{key}_query")
+
+    # Start from the first page whenever the search text changes
+    page_key = f"{key}_page"
+    if st.session_state.get(f"{key}_last_query") != query:
+        st.session_state[page_key] = 0
+        st.session_state[f"{key}_last_query"] = query
+    page = st.session_state.get(page_key, 0)
+
+    with db.connection() as conn:
+        rows, total = search_members(conn, query, page, page_size)
+    if not rows:
+        st.info("No matching children.")
+        return None
+
+    labels = {r[0]: f"{r[1]} · DOB {r[2]} · {r[3] or '-'} (#{r[0]})" for r in rows}
+    member_id = st.selectbox(label, list(labels), format_func=labels.get, key=f"{key}_id")
+
+    pages = -(-total // page_size)
+    col1, col2, col3 = st.columns([1, 2, 1])
+    if col1.button("◀ Previous", key=f"{key}_prev", disabled=page == 0):
+        st.session_state[page_key] = page - 1
+        st.rerun()
+    shown = f"{total}+" if total >= COUNT_CAP else str(total)
+    col2.caption(f"Page {page + 1} of {pages} · {shown} matching children")
+    if col3.button("Next ▶", key=f"{key}_next", disabled=page + 1 >= pages):
+        st.session_state[page_key] = page + 1
+        st.rerun()
+
+    with db.connection() as conn:
+        return member_by_id(conn, member_id)
 
 
 # ============================
@@ -197,49 +326,109 @@ def register_member():
         gender = st.selectbox("Gender", ["Male", "Female", "Other"])
         residence = st.text_input("Residence / Village")
         phone = st.text_input("Guardian Phone Number")
+        schedule = st.selectbox("Schedule", schedule_registry().names())
         submit = st.form_submit_button("Register")
 
         if submit and name:
-            # ✅ Prefill all vaccines with False
-            default_vaccine_status = {}
-            for v, times in kepi_schedule.items():
-                for t in times:
-                    default_vaccine_status[f"{v} - {t}"] = False
-
-            conn = sqlite3.connect(DB_FILE)
-            c = conn.cursor()
-            c.execute(
-                "INSERT INTO members (name, dob, gender, residence, phone, vaccines) VALUES (?, ?, ?, ?, ?, ?)",
-                (name, dob.isoformat(), gender, residence, phone, json.dumps(default_vaccine_status))
-            )
-            conn.commit()
-            conn.close()
+            with db.connection() as conn:
+                c = conn.execute(
+                    "INSERT INTO members (name, dob, gender, residence, phone, schedule) VALUES (?, ?, ?, ?, ?, ?)",
+                    (name, dob.isoformat(), gender, residence, phone, schedule)
+                )
+                # ✅ One pending dose row per vaccine in the child's schedule
+                insert_child_doses(conn, schedule_registry(), c.lastrowid, schedule, dob)
+                bump_data_version(conn)
             st.success("✅ Registered Successfully!")
 
+    bulk_import_section()
+
+
+def bulk_import_section():
+    # County registries: CSV/Excel with name, dob, gender, residence, phone and
+    # an optional schedule column (blank for the default schedule)
+    st.subheader("📥 Bulk Import")
+    upload = st.file_uploader("Upload a CSV or Excel registry", type=["csv", "xlsx"])
+    if upload is None or not st.button("Import Children", key="bulk_import"):
+        return
+
+    from bulk_import import import_members
+
+    os.makedirs(EXPORT_DIR, exist_ok=True)
+    rejects_path = os.path.join(EXPORT_DIR, "import_rejects.csv")
+    status = st.empty()
+    try:
+        result = import_members(
+            DB_FILE, upload, schedule_tables(), rejects_path,
+            progress=lambda done, bad: status.info(f"⏳ {done} imported, {bad} rejected..."),
+        )
+    except ValueError as e:
+        st.error(f"❌ {e}")
+        return
+    status.success(f"✅ {result['inserted']} children imported in {result['seconds']:.1f} s")
+    if result["rejected"]:
+        st.warning(f"⚠️ {result['rejected']} rows rejected")
+        with open(rejects_path, "rb") as f:
+            st.download_button("📄 Download Rejected Rows", f, file_name="import_rejects.csv", mime="text/csv")
+
 
 # ============================
 # ============================
 # View Members
 # ============================
 def view_members():
-    st.header("👥 All Registered Members")
+    import pandas as pd
 
-    conn = sqlite3.connect(DB_FILE)
-    df = pd.read_sql_query("SELECT * FROM members", conn)
-    conn.close()
+    st.header("👥 All Registered Members")
 
-    if df.empty:
+    if not has_members():
         st.info("No registered members found.")
         return
 
-    # Show formatted table
-    st.subheader("📋 Member Table")
-    st.dataframe(df)
+    # Only the visible window is queried and sent to the browser
+    col1, col2, col3, col4 = st.columns([3, 2, 2, 1])
+    query = col1.text_input("🔎 Filter by name, residence or phone", key="members_query")
+    with db.connection() as conn:
+        places = residences(conn)
+    residence = col2.selectbox("Residence", ["All"] + places,
+                               format_func=lambda r: r or "(none)", key="members_residence")
+    residence = None if residence == "All" else residence
+    sort = col3.selectbox("Sort by", list(SORT_KEYS), format_func=str.title, key="members_sort")
+    descending = col4.checkbox("Desc", key="members_desc")
+    page_size = st.select_slider("Rows per page", [25, 50, 100, 250], value=50, key="members_page_size")
+
+    # Cursor stack: cursors[i] is where page i starts; reset on any change
+    view = (query, residence, sort, descending, page_size)
+    if st.session_state.get("members_view") != view:
+        st.session_state.members_view = view
+        st.session_state.members_cursors = [None]
+    cursors = st.session_state.members_cursors
+
+    with db.connection() as conn:
+        rows, next_cursor = member_page(conn, query, residence, sort, descending, cursors[-1], page_size)
+        total = count_matching(conn, query, residence)
 
-    # Show raw vaccine JSON for debugging
-    st.subheader("🔬 Raw Vaccine JSON Data")
-    for _, row in df.iterrows():
-        st.write(f"{row['name']} - {row['vaccines']}")
+    st.subheader("📋 Member Table")
+    page = pd.DataFrame(rows, columns=PAGE_COLUMNS)
+    st.dataframe(page, hide_index=True)
+
+    col1, col2, col3 = st.columns([1, 2, 1])
+    if col1.button("◀ Previous", key="members_prev", disabled=len(cursors) == 1):
+        cursors.pop()
+        st.rerun()
+    shown = f"{total}+" if total >= COUNT_CAP else str(total)
+    col2.caption(f"Page {len(cursors)} · {shown} matching children")
+    if col3.button("Next ▶", key="members_next", disabled=next_cursor is None):
+        cursors.append(next_cursor)
+        st.rerun()
+
+    # Raw status JSON for one child, only fetched once a child is picked
+    with st.expander("🔬 Raw Vaccine JSON Data"):
+        labels = {r[0]: f"{r[1]} (#{r[0]})" for r in rows}
+        member_id = st.selectbox("Child", list(labels), index=None, format_func=labels.get,
+                                 placeholder="Choose a child on this page", key="members_json_id")
+        if member_id is not None:
+            with db.connection() as conn:
+                st.json(dose_status(conn, member_id))
 
 
 # ============================
@@ -247,6 +436,7 @@ def view_members():
 # ============================
 def view_vaccine_info():
     st.header("📚 KEPI Vaccine Information")
+    vaccine_data = load_vaccine_data()
     for vaccine, details in vaccine_data.items():
         with st.expander(vaccine):
             st.write(f"📅 **Scheduled Age:** {details.get('Scheduled Age', 'N/A')}")
@@ -265,133 +455,154 @@ def view_vaccine_info():
 # ============================
 def track_vaccines():
     st.header("📆 Track Vaccination")
-    conn = sqlite3.connect(DB_FILE)
-    df = pd.read_sql_query("SELECT * FROM members", conn)
-    conn.close()
-    if df.empty:
+    if not has_members():
         st.warning("No children registered yet.")
         return
 
-    selected = st.selectbox("Select Child", df["name"])
-    row = df[df["name"] == selected].iloc[0]
-    dob = datetime.strptime(row["dob"], "%Y-%m-%d")
-    try:
-        vaccine_status = json.loads(row["vaccines"] or "{}")
-    except json.JSONDecodeError:
-        st.error("❌ Could not decode vaccine data. Resetting to empty.")
-        vaccine_status = {}
-
-    today = datetime.today().date()
-
-    updated = {}
-    for v, times in kepi_schedule.items():
-        for t in times:
-            due = dob + (
-                relativedelta(weeks=int(t.split()[0])) if "week" in t else
-                relativedelta(months=int(t.split()[0])) if "month" in t else
-                relativedelta(years=int(t.split()[0]))
-            )
-            key = f"{v} - {t}"
-            taken_flag = vaccine_status.get(key, False)
-            updated[key] = st.checkbox(f"{v} ({t}) - Due {due.date()}", value=bool(taken_flag))
-
-
-    if st.button("💾 Save Status"):
-        st.write("Saving for:", selected)
-        st.write("Row ID:", row["id"])
+    row = select_child("track")
+    if row is None:
+        return
 
-        # Merge new updates with existing data
-        merged_status = vaccine_status.copy()
-        merged_status.update(updated)
+    # Moving a child to another schedule keeps the doses already given
+    registry = schedule_registry()
+    names = registry.names()
+    if row["schedule"] not in names:
+        st.warning(f"⚠️ Schedule '{row['schedule']}' is no longer available.")
+    if len(names) > 1:
+        col1, col2 = st.columns([3, 1])
+        chosen = col1.selectbox("🗓️ Schedule", names, key=f"schedule_{row['id']}",
+                                index=names.index(row["schedule"]) if row["schedule"] in names else 0)
+        if col2.button("Switch schedule", key="assign_schedule", disabled=chosen == row["schedule"]):
+            with db.connection() as conn:
+                assign_schedule(conn, registry, row["id"], chosen)
+                bump_data_version(conn)
+            st.rerun()
+
+    with db.connection() as conn:
+        doses = member_doses(conn, row["id"])
+
+    # Toggled doses wait here (across children) until saved. Each keeps the
+    # row version it was read at, so a concurrent edit is detected on save.
+    pending = st.session_state.setdefault("pending_doses", {})
+    for dose_id, v, t, due, given, version in doses:
+        saved = given is not None
+        checked = st.checkbox(f"{v} ({t}) - Due {due}", value=saved, key=f"dose_{dose_id}")
+        if checked == saved:
+            pending.pop(dose_id, None)
+        elif dose_id in pending:
+            pending[dose_id]["taken"] = checked
+        else:
+            pending[dose_id] = {"child": row["name"], "dose": f"{v} - {t}", "version": version, "taken": checked}
 
-        st.write("🧬 Merged Status JSON:")
-        st.json(merged_status)  # Debug: shows what you're saving
+    if pending:
+        with st.expander(f"🧬 {len(pending)} unsaved change(s)"):
+            st.json({f"{c['child']}: {c['dose']}": c["taken"] for c in pending.values()})  # Debug: shows what you're saving
 
+    if st.button(f"💾 Save Status ({len(pending)} changes)", key="save_doses", disabled=not pending):
         try:
-            conn = sqlite3.connect(DB_FILE)
-            c = conn.cursor()
-            c.execute("UPDATE members SET vaccines=? WHERE id=?", (json.dumps(merged_status), row["id"]))
-            conn.commit()
-            conn.close()
+            with db.connection() as conn:
+                apply_dose_changes(conn, [(dose_id, c["version"], c["taken"]) for dose_id, c in pending.items()])
+                bump_data_version(conn)
+            pending.clear()
             st.success("✅ Vaccination Status Updated & Saved")
+        except DoseConflict as e:
+            # Nothing was written; drop the stale edits so they reload from the database
+            for dose_id in e.dose_ids:
+                pending.pop(dose_id, None)
+                st.session_state.pop(f"dose_{dose_id}", None)
+            st.error(f"❌ {e}. No changes were saved; please review and save again.")
         except Exception as e:
             st.error(f"❌ Failed to save data: {e}")
 
 
-
-
 # ============================
 # Reaction Logs
 # ============================
+def vaccine_names():
+    # Free-text vaccine name -> schedule vaccine (see reactions.py); follows
+    # schedule reloads
+    return vaccine_lookup(schedule_tables().union.vaccines)
+
+
+@st.cache_data(max_entries=16)
+def cached_reaction_rates(group, data_version):
+    # data_version is only part of the cache key: logging a reaction or
+    # recording a dose bumps it, so the rates are recomputed after writes
+    with db.connection() as conn:
+        return reaction_rates(conn, group)
+
+
 def reaction_logs():
+    import pandas as pd
+
     st.header("📝 Post-Vaccination Reaction Log")
-    conn = sqlite3.connect(DB_FILE)
-    members = pd.read_sql_query("SELECT * FROM members", conn)
-    conn.close()
-    if members.empty:
+    if not has_members():
         st.warning("No children available.")
         return
 
-    with st.form("reaction_form"):
-        child = st.selectbox("Select Child", members["name"])
-        vaccine = st.text_input("Vaccine Name")
-        date = st.date_input("Date of Reaction")
-        notes = st.text_area("Reaction Notes")
-        submit = st.form_submit_button("Log Reaction")
-
-        if submit:
-            mid = members[members["name"] == child].iloc[0]["id"]
-            conn = sqlite3.connect(DB_FILE)
-            c = conn.cursor()
-            c.execute("INSERT INTO reactions (member_id, vaccine, date, notes) VALUES (?, ?, ?, ?)",
-                      (mid, vaccine, date.isoformat(), notes))
-            conn.commit()
-            conn.close()
-            st.success("✅ Reaction Logged")
+    child = select_child("reaction")
+    if child is not None:
+        with st.form("reaction_form"):
+            vaccine = st.text_input("Vaccine Name")
+            date = st.date_input("Date of Reaction")
+            notes = st.text_area("Reaction Notes")
+            submit = st.form_submit_button("Log Reaction")
+
+            if submit:
+                with db.connection() as conn:
+                    log_reaction(conn, vaccine_names(), child["id"], vaccine, date.isoformat(), notes)
+                    bump_data_version(conn)
+                st.success("✅ Reaction Logged")
+
+        with db.connection() as conn:
+            history = member_reactions(conn, child["id"])
+        if history:
+            st.subheader(f"🗒️ Reactions logged for {child['name']}")
+            st.dataframe(pd.DataFrame(history, columns=["Date", "Vaccine (as entered)", "Vaccine", "Dose", "Notes"]))
+
+    # Rates against administered doses, cached until the next write
+    st.subheader("📈 Adverse-Event Rates")
+    group = st.radio("Per", list(RATE_GROUPS), horizontal=True, key="reaction_rates_group")
+    with db.connection() as conn:
+        version = read_versions(conn)[0]
+    columns, rows = cached_reaction_rates(group, version)
+    if not rows:
+        st.info("No reactions or administered doses yet.")
+        return
+    st.dataframe(pd.DataFrame(rows, columns=columns))
+    st.caption("Reactions per 1,000 administered doses. A blank vaccine or dose means the entry "
+               "matched no schedule vaccine, or no dose given before the reaction.")
 
 # ============================
 # Export to PDF
 # ============================
 def export_to_pdf():
     st.header("📄 Export Registered Children to PDF")
-    conn = sqlite3.connect(DB_FILE)
-    df = pd.read_sql_query("SELECT * FROM members", conn)
-    conn.close()
 
-    if df.empty:
+    if not has_members():
         st.info("No data to export.")
         return
 
-    pdf = FPDF()
-    pdf.add_page()
-    pdf.set_font("Arial", size=12)
-    pdf.cell(200, 10, txt="Registered Children Report", ln=True, align='C')
-
-    for index, row in df.iterrows():
-        pdf.cell(200, 10, txt=f"{row['name']} | DOB: {row['dob']} | Gender: {row['gender']} | Residence: {row['residence']}", ln=True)
-
-    buffer = BytesIO()
-    pdf.output(buffer)
-    st.download_button("📥 Download PDF", data=buffer.getvalue(), file_name="registered_children.pdf", mime="application/pdf")
+    job_button("members_pdf", {}, "⚙️ Generate PDF", key="members_pdf")
 
 # ============================
 # Trends Chart
 # ============================
 def show_trends_chart():
-    st.header("📊 Vaccination Trends")
-    conn = sqlite3.connect(DB_FILE)
-    df = pd.read_sql_query("SELECT * FROM members", conn)
-    conn.close()
+    import pandas as pd
+    import plotly.express as px
+
+    st.header("📈 Vaccination Trends")
+    with db.connection() as conn:
+        months = monthly_coverage(conn)
 
-    if df.empty:
+    if not months:
         st.info("No data to visualize.")
         return
 
-    df['dob'] = pd.to_datetime(df['dob'])
-    df['year'] = df['dob'].dt.year
-
-    fig = px.histogram(df, x='year', title="Registered Children by Birth Year")
-    st.plotly_chart(fig, use_container_width=True)
+    df = pd.DataFrame(months, columns=["month", "Due", "Given"])
+    fig = px.bar(df, x="month", y=["Due", "Given"], barmode="group", title="Doses Due and Given by Due Month")
+    st.plotly_chart(fig, width="stretch")
 
 # ============================
 # AI Vaccine Assistant
@@ -399,10 +610,9 @@ def show_trends_chart():
 def vaccine_assistant():
     st.header("🤖 AI Vaccine Assistant")
 
-    # Load vaccine data from vaccine_info.json
+    # Index over vaccine_info.json, built once per process and on file change
     try:
-        with open("vaccine_info.json", "r") as f:
-            vaccine_data = json.load(f)
+        engine = get_engine("vaccine_info.json")
     except Exception as e:
         st.error("❌ Failed to load vaccine_info.json. Please ensure the file exists and is correctly formatted.")
         return
@@ -410,192 +620,332 @@ def vaccine_assistant():
     question = st.text_input("Ask a question about any vaccine (e.g., 'Tell me about BCG' or 'What does HPV protect against?')")
 
     if question:
-        matched = None
+        result = engine.answer(question)
 
-        # Try to find the vaccine name in the question
-        for vax_name in vaccine_data:
-            if vax_name.lower() in question.lower():
-                matched = vax_name
-                break
-
-        if matched:
-            data = vaccine_data[matched]
+        if result:
+            matched, section, answer = result
             st.success(f"💉 Vaccine: **{matched}**")
-            st.write(f"📅 **Scheduled Age**: {data.get('Scheduled Age', 'N/A')}")
-
-            # Supports both string and list for "Protects Against"
-            protection = data.get("Protects Against", "N/A")
-            if isinstance(protection, list):
-                st.write("🛡 **Protects Against:**")
-                for item in protection:
-                    st.markdown(f"- {item}")
-            else:
-                st.write(f"🛡 **Protects Against:** {protection}")
-
-            st.write(f"🧬 **Type**: {data.get('Type', 'N/A')}")
-            st.write(f"💉 **Route**: {data.get('Route', 'N/A')}")
-
-            # Side effects
-            side_effects = data.get("Common Side Effects", [])
-            if side_effects:
-                st.write("💊 **Common Side Effects:**")
-                for effect in side_effects:
-                    st.markdown(f"- {effect}")
-            else:
-                st.write("💊 No side effects listed.")
-
-            # Special notes
-            notes = data.get("Special Considerations", [])
-            if notes:
-                st.write("⚠️ **Special Considerations:**")
-                for note in notes:
-                    st.markdown(f"- {note}")
-            else:
-                st.write("⚠️ No special considerations.")
+            st.markdown(answer)
+            if section != "full":
+                with st.expander("📖 Full vaccine details"):
+                    st.markdown(engine.sections[matched]["full"])
         else:
-            st.warning("🤔 Sorry, I couldn't find info for that. Please try using the exact name like 'BCG', 'Measles', or 'HPV'.")
-
-
-
+            st.warning("🤔 Sorry, I couldn't find info for that. Try a vaccine or disease name like 'BCG', 'Measles' or 'polio'.")
 
 
 # ============================
 # Dashboard
 # ============================
 def show_dashboard():
+    import pandas as pd
+
     st.title("📊 Dashboard Overview")
     st.markdown("""
     Welcome to the **Dashboard Overview** of the Child Vaccination Assistant.  
     Here you can quickly monitor vaccination activity, see upcoming or overdue doses, and get a summary of all registered children.
     """)
 
-    conn = sqlite3.connect(DB_FILE)
-    df = pd.read_sql_query("SELECT * FROM members", conn)
-    conn.close()
-    if df.empty:
-        st.info("No data to display.")
-        return
-
-    total = len(df)
-    today = datetime.today().date()
-    upcoming7 = overdue = completed = 0
-
-    for _, row in df.iterrows():
-        dob = datetime.strptime(row["dob"], "%Y-%m-%d")
-        status = json.loads(row["vaccines"] or "{}")
-        for v, times in kepi_schedule.items():
-            for t in times:
-                due = dob + (
-                    relativedelta(weeks=int(t.split()[0])) if "week" in t else
-                    relativedelta(months=int(t.split()[0])) if "month" in t else
-                    relativedelta(years=int(t.split()[0]))
-                )
-                key = f"{v} - {t}"
-                if due.date() == today:
-                    completed += 1
-                elif due.date() < today and not status.get(key):
-                    overdue += 1
-                elif today <= due.date() <= today + timedelta(days=7):
-                    upcoming7 += 1
+    # Figures come from the coverage aggregates (reports.py), not the dose rows
+    with db.connection() as conn:
+        counts = dashboard_summary(conn)
+        if not counts["registered"]:
+            st.info("No data to display.")
+            return
+        by_vaccine = coverage_by(conn, "vaccine")
+        by_residence = coverage_by(conn, "residence")
 
     col1, col2, col3, col4, col5 = st.columns(5)
-    col1.metric("👶 Registered", total)
-    col2.metric("💉 Due Today", completed)
-    col3.metric("📆 Next 7 Days", upcoming7)
-    col4.metric("✅ Completed", sum(1 for v in status.values() if v))
-    col5.metric("⚠️ Overdue", overdue)
+    col1.metric("👶 Registered", counts["registered"])
+    col2.metric("💉 Due Today", counts["due_today"])
+    col3.metric("📆 Next 7 Days", counts["next_7_days"])
+    col4.metric("✅ Completed", counts["completed"])
+    col5.metric("⚠️ Overdue", counts["overdue"])
+
+    st.subheader("💉 Coverage by Vaccine")
+    st.dataframe(pd.DataFrame(by_vaccine[1], columns=by_vaccine[0]))
+    st.subheader("🏘️ Coverage by Residence")
+    st.dataframe(pd.DataFrame(by_residence[1], columns=by_residence[0]))
+
+    # Overdue list from the in-memory cohort store; only the shown rows are
+    # looked up in SQLite
+    st.subheader("⚠️ Overdue by Dose")
+    compiled = schedule_tables().union
+    chosen = st.selectbox("Dose", ["All doses"] + list(compiled.keys))
+    with db.connection() as conn, st.spinner("Loading cohort..."):
+        columns, rows, total = cohort_store().overdue_members(
+            conn, compiled, None if chosen == "All doses" else chosen, limit=OVERDUE_SHOWN)
+    if total > len(rows):
+        st.caption(f"{total} overdue doses; showing the {len(rows)} longest overdue.")
+    st.dataframe(pd.DataFrame(rows, columns=columns))
+
+    outreach_section()
+
+
+def outreach_section():
+    import io
+    import pandas as pd
+    from datetime import date, timedelta
+    from reports import write_outreach
+
+    # Children whose next dose falls in the window, from the next-due index
+    st.subheader("📣 Outreach List")
+    today = date.today()
+    col1, col2, col3 = st.columns([2, 2, 1])
+    window = col1.date_input("Next dose due between", (today, today + timedelta(days=7)), key="outreach_window")
+    with db.connection() as conn:
+        places = residences(conn)
+    residence = col2.selectbox("Residence", ["All"] + places,
+                               format_func=lambda r: r or "(none)", key="outreach_residence")
+    residence = None if residence == "All" else residence
+    overdue = col3.checkbox("Include overdue", key="outreach_overdue")
+    if len(window) != 2:
+        st.info("Pick a start and an end date.")
+        return
+    start, end = (None if overdue else window[0]), window[1]
+
+    with db.connection() as conn:
+        total = count_between(conn, start, end, residence)
+        rows, more = due_between(conn, start, end, residence)
+    st.write(f"**{total}** children to contact" + (f" (showing the first {len(rows)})" if more else ""))
+    st.dataframe(pd.DataFrame(rows, columns=OUTREACH_COLUMNS))
+
+    # The full list is only built on request
+    params = (start, end, residence)
+    if st.button("📄 Prepare CSV", key="outreach_prepare"):
+        out = io.StringIO()
+        with db.connection() as conn:
+            write_outreach(conn, out, start, end, residence)
+        st.session_state.outreach_csv = (params, out.getvalue())
+    prepared = st.session_state.get("outreach_csv")
+    if prepared and prepared[0] == params:
+        st.download_button("📥 Download Outreach List", prepared[1],
+                           file_name=f"outreach_{window[0]}_{end}.csv", mime="text/csv")
 
 # ============================
 # Export Individual Child Record as PDF
 # ============================
 def export_vaccine_report():
-    st.header("📤 Export Individual Child Record (Full View)")
+    from pdf_reports import FPDFUnicodeEncodingException, child_record_pdf
 
-    conn = sqlite3.connect(DB_FILE)
-    df = pd.read_sql_query("SELECT * FROM members", conn)
-    conn.close()
+    st.header("📤 Export Individual Child Record (Full View)")
 
-    if df.empty:
+    if not has_members():
         st.warning("No registered members found.")
         return
 
-    # Select child by name
-    selected_name = st.selectbox("Select a Child", options=df["name"].unique())
-    child = df[df["name"] == selected_name].iloc[0]
+    child = select_child("export", label="Select a Child")
+    if child is None:
+        return
+    with db.connection() as conn:
+        vaccine_dict = dose_status(conn, child["id"])
 
     # Display all info like in View Members
     st.subheader("👶 Full Child Record")
     st.write("**Raw Data:**")
-    st.json(dict(child))
+    st.json({**child, "vaccines": vaccine_dict})
 
     # === PDF Export ===
-    pdf = FPDF()
-    pdf.add_page()
-    pdf.set_font("Arial", size=12)
-    pdf.cell(190, 10, txt="Child Vaccination Full Record", ln=True, align='C')
-    pdf.ln(10)
-
-    # Include all fields
-    pdf.cell(0, 10, f"ID: {child['id']}", ln=True)
-    pdf.cell(0, 10, f"Name: {child['name']}", ln=True)
-    pdf.cell(0, 10, f"Date of Birth: {child['dob']}", ln=True)
-    pdf.cell(0, 10, f"Gender: {child['gender']}", ln=True)
-    pdf.cell(0, 10, f"Residence: {child['residence']}", ln=True)
-    pdf.cell(0, 10, f"Phone: {child['phone']}", ln=True)
-    pdf.ln(5)
-
-# Vaccine JSON
-    pdf.set_font("Arial", size=11)
-    pdf.cell(0, 10, "Vaccine Status:", ln=True)
-
     try:
-        raw_vaccine_data = child["vaccines"]
-        if not raw_vaccine_data or raw_vaccine_data.strip() in ["", "null"]:
-            raise ValueError("Empty or null vaccine data")
-
-        vaccine_dict = json.loads(raw_vaccine_data)
-        
-        if isinstance(vaccine_dict, dict) and vaccine_dict:
-            for k, v in vaccine_dict.items():
-                status = "Completed" if str(v).lower() in ("true", "1", "yes") else "Not Completed"
-                pdf.multi_cell(0, 10, f"{status} {k}")
-        else:
-            pdf.cell(0, 10, "No vaccine records found.", ln=True)
+        st.download_button(
+            "📥 Download Full PDF Report",
+            data=child_record_pdf(child, vaccine_dict),
+            file_name=f"{child['name'].replace(' ', '_')}_full_record.pdf",
+            mime="application/pdf"
+        )
+    except FPDFUnicodeEncodingException:
+        st.error("❌ This record needs a Unicode font for the PDF; set PDF_FONT to a .ttf file such as DejaVuSans.ttf.")
+
+    bulk_export_section()
+    analytics_export_section()
+    recent_jobs_section()
 
-    except (json.JSONDecodeError, TypeError, ValueError) as e:
-        pdf.set_text_color(255, 0, 0)
-        pdf.cell(0, 10, "⚠️ Error parsing vaccine data.", ln=True)
-        pdf.set_text_color(0, 0, 0)
 
+def bulk_export_section():
+    st.subheader("📦 Bulk Export by Residence")
+    residences = [r[0] for r in db.query(
+        "SELECT DISTINCT residence FROM members WHERE residence IS NOT NULL AND residence != '' ORDER BY residence"
+    )]
+    if not residences:
+        st.info("No residences recorded yet.")
+        return
+    residence = st.selectbox("Residence", residences)
+    job_button("records_zip", {"residence": residence}, "🗜️ Generate ZIP of child records", key="records_zip")
 
-    # Download
-    buffer = BytesIO()
-    pdf.output(buffer)
-    buffer.seek(0)
 
-    st.download_button(
-        "📥 Download Full PDF Report",
-        data=buffer.getvalue(),
-        file_name=f"{child['name'].replace(' ', '_')}_full_record.pdf",
-        mime="application/pdf"
-    )
+def recent_jobs_section():
+    # Results stay available after the page is left or the browser closed
+    with db.connection() as conn:
+        recent = jobs.recent(conn, st.session_state.get("user_email"), limit=10)
+    if not recent:
+        return
+    with st.expander("🗂️ My Recent Jobs"):
+        for job in recent:
+            started = time.strftime("%Y-%m-%d %H:%M", time.localtime(job["created_at"]))
+            st.markdown(f"**{JOB_LABELS.get(job['kind'], job['kind'])}** · {started} · {job['status']}")
+            if job["status"] == "done":
+                job_download_link(job, key=f"recent_job_download_{job['id']}")
+
+# ============================
+# Analytics Export (Parquet / Arrow / CSV)
+# ============================
+def analytics_export_section():
+    from exports import DATASETS, available_formats, dose_keys
+
+    st.subheader("📊 Analytics Export")
+    col1, col2 = st.columns(2)
+    dataset = col1.selectbox("Dataset", DATASETS, format_func=str.title)
+    fmt = col2.selectbox("Format", available_formats(), format_func=str.upper)
+    params = {"dataset": dataset, "fmt": fmt, "keys": list(dose_keys(schedule_tables().union))}
+    job_button("analytics_export", params, "⚙️ Generate Export", key="analytics_export")
 
-# Route Pages
-# ============================
-if menu == "🏠 Dashboard":
-    show_dashboard()
-elif menu == "➕ Register Child":
-    register_member()
-elif menu == "📚 Vaccine Info":
-    view_vaccine_info()
-elif menu == "📆 Vaccination Status":
-    track_vaccines()
-elif menu == "📝 Reaction Logs":
-    reaction_logs()
-elif menu == "🤖 Vaccine Assistant":
-    vaccine_assistant()
-elif menu == "👥 View Members":
-    view_members()
-elif menu == "📤 Export Report":
-    export_vaccine_report()
 
+# ============================
+# Background Jobs (see jobs.py)
+# ============================
+JOB_LABELS = {
+    "members_pdf": "📄 Registered children PDF",
+    "records_zip": "📦 Child records ZIP",
+    "analytics_export": "📊 Analytics export",
+    "rebuild_aggregates": "♻️ Rebuild of coverage tables",
+}
+
+
+def job_button(kind, params, label, key):
+    # Queues the job on click (or reuses an identical one) and shows the
+    # status of this session's job for the same parameters
+    submitted = st.session_state.setdefault("jobs", {})
+    token = f"{kind}:{json.dumps(params, sort_keys=True)}"
+    if st.button(label, key=key):
+        with db.connection() as conn:
+            submitted[token], _ = jobs.submit(conn, kind, params, st.session_state.get("user_email"))
+    if token in submitted:
+        job_status(submitted[token])
+
+
+@st.fragment(run_every=2)
+def job_status(job_id):
+    # Only this fragment reruns while the job is polled
+    with db.connection() as conn:
+        job = jobs.get(conn, job_id)
+    if job is None:
+        st.warning("This job's result has expired.")
+        return
+    status = job["status"]
+    if status == "queued":
+        st.info("⏳ Queued...")
+    elif status == "running":
+        total = job["total"]
+        text = job["message"] or (f"{job['done']} of {total}" if total else f"{job['done']} done")
+        st.progress(min(job["done"] / total, 1.0) if total else 0.0, text=text)
+    elif status == "done":
+        summary = ", ".join(f"{v} {k}" for k, v in (job["summary"] or {}).items())
+        st.success(f"✅ Done{': ' + summary if summary else ''}")
+        job_download_link(job, key=f"job_download_{job_id}")
+    elif status == "failed":
+        st.error(f"❌ {job['error']}")
+    else:
+        st.warning("🚫 Cancelled")
+    if status in ("queued", "running") and st.button("✖️ Cancel", key=f"cancel_job_{job_id}"):
+        with db.connection() as conn:
+            jobs.cancel(conn, job_id)
+
+
+def job_download_link(job, key):
+    # Results hold member data: only the user who submitted the job gets the
+    # button, and the file is read inside this session when it is clicked
+    path = jobs.result_path(job, st.session_state.get("user_email"))
+    if path is None:
+        if job["result"]:
+            st.caption("The result file has expired.")
+        return
+    def read():
+        with open(path, "rb") as f:
+            return f.read()
+
+    name = os.path.basename(path)
+    st.download_button(f"📥 Download {name} ({os.path.getsize(path) / 1e6:.1f} MB)",
+                       data=read, file_name=name, key=key, on_click="ignore")
+
+# Performance (admin)
+# ============================
+def performance_page():
+    import pandas as pd
+
+    st.header("🛠️ Performance")
+    snapshot = metrics.snapshot()
+    st.caption(f"Timings of this server process over the last {snapshot['uptime_seconds']:.0f} s. "
+               f"Percentiles cover each series' last {PROFILE_WINDOW} calls.")
+    if snapshot["series"]:
+        df = pd.DataFrame(snapshot["series"])
+        kinds = st.multiselect("Kinds", sorted(df["kind"].unique()), default=sorted(df["kind"].unique()))
+        st.dataframe(df[df["kind"].isin(kinds)].sort_values("p95_ms", ascending=False), hide_index=True)
+    else:
+        st.info("No timings recorded yet.")
+    store = cohort_store()
+    if len(store):
+        st.caption(f"🧮 Cohort store: {len(store)} children in {store.nbytes / 1e6:.1f} MB")
+    memo = schedule_registry().memo_info()
+    st.caption(f"🗓️ Due-date memo: {memo.currsize} (schedule, DOB) entries, "
+               f"{memo.hits} hits / {memo.misses} misses")
+
+    st.subheader("🧰 Maintenance")
+    job_button("rebuild_aggregates", {}, "♻️ Rebuild coverage and next-due tables", key="rebuild_aggregates")
+
+    col1, col2, col3 = st.columns(3)
+    col1.download_button("📥 JSON", json.dumps(snapshot, indent=2), file_name="metrics.json", mime="application/json")
+    col2.download_button("📥 Prometheus", metrics.prometheus(), file_name="metrics.prom", mime="text/plain")
+    if col3.button("♻️ Reset timings"):
+        metrics.reset()
+        st.rerun()
+
+    # One rerun of another page under cProfile, for this session only
+    st.subheader("🔬 Profile a Page Load")
+    if st.button("Profile the next page load"):
+        st.session_state.profile_next_page = True
+        st.info("Now open the page to profile, then come back here.")
+    capture = st.session_state.get("profile_capture")
+    if capture:
+        st.caption(f"{capture['page']} · {capture['at']}")
+        st.code(capture["report"])
+        st.download_button("📥 Download .prof", capture["stats"], file_name="page.prof",
+                           mime="application/octet-stream")
+
+# ============================
+# Route Pages (timed per page; see profiling.py)
+# ============================
+METRICS_DIR = os.environ.get("METRICS_DIR")
+
+profile_this_page = st.session_state.pop("profile_next_page", False)
+with cprofile(profile_this_page) as profiler, timed("page", menu):
+    if menu == "🏠 Dashboard":
+        show_dashboard()
+    elif menu == "➕ Register Child":
+        register_member()
+    elif menu == "📚 Vaccine Info":
+        view_vaccine_info()
+    elif menu == "📆 Vaccination Status":
+        track_vaccines()
+    elif menu == "📈 Vaccination Trends":
+        show_trends_chart()
+    elif menu == "📝 Reaction Logs":
+        reaction_logs()
+    elif menu == "🤖 Vaccine Assistant":
+        vaccine_assistant()
+    elif menu == "👥 View Members":
+        view_members()
+    elif menu == "📤 Export Report":
+        export_vaccine_report()
+    elif menu == "🛠️ Performance":
+        performance_page()
+
+if profiler:
+    st.session_state.profile_capture = {
+        "page": menu,
+        "at": time.strftime("%Y-%m-%d %H:%M:%S"),
+        "report": profile_report(profiler),
+        "stats": profile_bytes(profiler),
+    }
+# Scrape target for Prometheus / dashboards, e.g. METRICS_DIR=static/metrics
+# serves app/static/metrics/metrics.prom
+if METRICS_DIR:
+    maybe_dump(METRICS_DIR)
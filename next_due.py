@@ -0,0 +1,238 @@
+# Next-due index
+#
+# One row per child with an outstanding dose: the earliest due date among the
+# doses not yet given (ties go to the dose inserted first, i.e. schedule
+# order), which dose that is, and the child's residence. Triggers on doses
+# and members keep it current, so registration, tracker saves, migrations
+# and residence edits maintain it without extra code. Outreach questions
+# ("next dose due between D1 and D2, in residence X", "anything overdue")
+# become range scans on (due_date) or (residence, due_date) instead of walks
+# over every dose. Bulk writers pause the insert trigger and call refresh()
+# for the id range they added.
+#
+#   python next_due.py --rebuild    # backfill from the doses table
+#   python next_due.py --check      # compare with a full recomputation
+
+import argparse
+from contextlib import contextmanager
+from datetime import date, timedelta
+
+from profiling import timed
+
+NEXT_DUE_TABLE = [
+    '''
+    CREATE TABLE IF NOT EXISTS next_due (
+        member_id INTEGER PRIMARY KEY,
+        due_date TEXT NOT NULL,
+        vaccine TEXT NOT NULL,
+        dose_label TEXT NOT NULL,
+        residence TEXT NOT NULL DEFAULT ''
+    )
+    ''',
+    "CREATE INDEX IF NOT EXISTS idx_next_due_date ON next_due (due_date)",
+    "CREATE INDEX IF NOT EXISTS idx_next_due_residence ON next_due (residence, due_date)",
+]
+
+OUTREACH_COLUMNS = ("id", "name", "phone", "residence", "due_date", "vaccine", "dose_label")
+
+# The child's earliest outstanding dose, recomputed from its ~20 dose rows
+_RECOMPUTE = '''
+    DELETE FROM next_due WHERE member_id = {id};
+    INSERT INTO next_due (member_id, due_date, vaccine, dose_label, residence)
+    SELECT d.member_id, d.due_date, d.vaccine, d.dose_label,
+           COALESCE((SELECT residence FROM members WHERE id = d.member_id), '')
+    FROM doses d WHERE d.member_id = {id} AND d.given_date IS NULL
+    ORDER BY d.due_date, d.id LIMIT 1;
+'''
+
+NEXT_DUE_TRIGGERS = [
+    # A new pending dose only matters if it is due before the current one
+    '''
+    CREATE TRIGGER IF NOT EXISTS next_due_ai AFTER INSERT ON doses WHEN new.given_date IS NULL BEGIN
+        INSERT INTO next_due (member_id, due_date, vaccine, dose_label, residence)
+        VALUES (new.member_id, new.due_date, new.vaccine, new.dose_label,
+                COALESCE((SELECT residence FROM members WHERE id = new.member_id), ''))
+        ON CONFLICT(member_id) DO UPDATE SET
+            due_date = excluded.due_date, vaccine = excluded.vaccine, dose_label = excluded.dose_label
+        WHERE excluded.due_date < next_due.due_date;
+    END
+    ''',
+    f'''
+    CREATE TRIGGER IF NOT EXISTS next_due_au AFTER UPDATE OF due_date, given_date ON doses BEGIN
+        {_RECOMPUTE.format(id="new.member_id")}
+    END
+    ''',
+    f'''
+    CREATE TRIGGER IF NOT EXISTS next_due_ad AFTER DELETE ON doses BEGIN
+        {_RECOMPUTE.format(id="old.member_id")}
+    END
+    ''',
+    '''
+    CREATE TRIGGER IF NOT EXISTS next_due_member_au AFTER UPDATE OF residence ON members BEGIN
+        UPDATE next_due SET residence = COALESCE(new.residence, '') WHERE member_id = new.id;
+    END
+    ''',
+    '''
+    CREATE TRIGGER IF NOT EXISTS next_due_member_ad AFTER DELETE ON members BEGIN
+        DELETE FROM next_due WHERE member_id = old.id;
+    END
+    ''',
+]
+
+
+def create_next_due_table(conn):
+    # Returns True when the table was just created (and backfilled)
+    exists = conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'next_due'").fetchone()
+    for ddl in NEXT_DUE_TABLE + NEXT_DUE_TRIGGERS:
+        conn.execute(ddl)
+    if exists:
+        return False
+    rebuild(conn)
+    return True
+
+
+def refresh(conn, lo=None, hi=None):
+    # Recomputes the rows of children with lo < id <= hi (all when no range)
+    if lo is None:
+        where, params = "1", ()
+        conn.execute("DELETE FROM next_due")
+    else:
+        where, params = "m.id > ? AND m.id <= ?", (lo, hi)
+        conn.execute("DELETE FROM next_due WHERE member_id > ? AND member_id <= ?", params)
+    conn.execute(f'''
+        INSERT INTO next_due (member_id, due_date, vaccine, dose_label, residence)
+        SELECT m.id, d.due_date, d.vaccine, d.dose_label, COALESCE(m.residence, '')
+        FROM members m
+        JOIN doses d ON d.id = (
+            SELECT id FROM doses WHERE member_id = m.id AND given_date IS NULL
+            ORDER BY due_date, id LIMIT 1
+        )
+        WHERE {where}
+    ''', params)
+
+
+def rebuild(conn):
+    refresh(conn)
+
+
+@contextmanager
+def paused_insert_trigger(conn):
+    # For bulk dose inserts: the caller runs refresh() over the new ids
+    # instead. Like aggregates.paused_row_trigger, it must run inside the
+    # caller's transaction.
+    conn.execute("DROP TRIGGER IF EXISTS next_due_ai")
+    yield
+    conn.execute(NEXT_DUE_TRIGGERS[0])
+
+
+# ============================
+# Reads
+# ============================
+def _window(start, end, residence):
+    clauses, params = [], []
+    if residence is not None:
+        clauses.append("n.residence = ?")
+        params.append(residence)
+    if start is not None:
+        clauses.append("n.due_date >= ?")
+        params.append(start.isoformat())
+    if end is not None:
+        clauses.append("n.due_date <= ?")
+        params.append(end.isoformat())
+    return clauses, params
+
+
+@timed("query")
+def due_between(conn, start=None, end=None, residence=None, after=None, limit=500):
+    # Children whose next dose falls in [start, end] (either end open), in
+    # (due date, id) order; returns (rows in OUTREACH_COLUMNS order, cursor
+    # for the next page or None). A child with an overdue dose is listed by
+    # that dose only, so overdue children never reappear in later windows.
+    clauses, params = _window(start, end, residence)
+    if after is not None:
+        # The plain >= lets SQLite seek the index; the row value is exact
+        clauses.append("n.due_date >= ? AND (n.due_date, n.member_id) > (?, ?)")
+        params += [after[0], after[0], after[1]]
+    rows = conn.execute(f'''
+        SELECT m.id, m.name, m.phone, m.residence, n.due_date, n.vaccine, n.dose_label
+        FROM next_due n JOIN members m ON m.id = n.member_id
+        WHERE {" AND ".join(clauses) or "1"}
+        ORDER BY n.due_date, n.member_id
+        LIMIT ?
+    ''', params + [limit + 1]).fetchall()
+    if len(rows) > limit:
+        rows = rows[:limit]
+        return rows, (rows[-1][4], rows[-1][0])
+    return rows, None
+
+
+@timed("query")
+def count_between(conn, start=None, end=None, residence=None):
+    clauses, params = _window(start, end, residence)
+    return conn.execute(
+        f"SELECT COUNT(*) FROM next_due n WHERE {' AND '.join(clauses) or '1'}", params
+    ).fetchone()[0]
+
+
+def overdue_children(conn, today=None, residence=None, after=None, limit=500):
+    # Children with at least one dose due before today
+    today = today or date.today()
+    return due_between(conn, None, today - timedelta(days=1), residence, after, limit)
+
+
+def iter_between(conn, start=None, end=None, residence=None, chunk_size=10_000):
+    # Every matching row, one keyset page at a time, for CSV exports
+    after = None
+    while True:
+        rows, after = due_between(conn, start, end, residence, after, chunk_size)
+        yield from rows
+        if after is None:
+            return
+
+
+# ============================
+# Consistency Check
+# ============================
+def check_consistency(conn):
+    # (member_id, stored row, expected row) for every mismatch
+    expected = {r[0]: r[1:] for r in conn.execute('''
+        SELECT m.id, d.due_date, d.vaccine, d.dose_label, COALESCE(m.residence, '')
+        FROM members m
+        JOIN doses d ON d.id = (
+            SELECT id FROM doses WHERE member_id = m.id AND given_date IS NULL ORDER BY due_date, id LIMIT 1
+        )
+    ''')}
+    stored = {r[0]: r[1:] for r in conn.execute(
+        "SELECT member_id, due_date, vaccine, dose_label, residence FROM next_due"
+    )}
+    return [(k, stored.get(k), expected.get(k))
+            for k in expected.keys() | stored.keys() if stored.get(k) != expected.get(k)]
+
+
+def main():
+    from db import connect, init_schema
+    from schedule import load_schedule
+
+    parser = argparse.ArgumentParser(description="Maintain the next-due index.")
+    parser.add_argument("--db", default="members.db")
+    parser.add_argument("--schedule", default="kepi_schedule.json")
+    parser.add_argument("--rebuild", action="store_true")
+    parser.add_argument("--check", action="store_true")
+    args = parser.parse_args()
+
+    conn = connect(args.db)
+    init_schema(conn, lambda: load_schedule(args.schedule).compiled())
+    if args.rebuild:
+        rebuild(conn)
+        print(f"✅ Rebuilt: {conn.execute('SELECT COUNT(*) FROM next_due').fetchone()[0]} children with a dose due")
+    conn.commit()
+    if args.check:
+        mismatches = check_consistency(conn)
+        for member_id, stored, expected in mismatches[:20]:
+            print(f"❌ child {member_id}: stored {stored}, expected {expected}")
+        print("✅ Next-due index matches the doses table" if not mismatches else f"{len(mismatches)} mismatches")
+    conn.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,283 @@
+# Child record PDFs, one at a time or in bulk
+#
+# child_record_pdf() is the layout used by the "Export Report" page. The bulk
+# export streams members out of SQLite in id-ordered chunks, renders each
+# chunk in a worker process and writes the PDFs straight into a ZIP on disk.
+# At most a few chunks are in flight at once, so memory stays bounded no
+# matter how many children a residence has.
+#
+# The core Arial font only covers latin-1, so records with names such as
+# "Wanjiũ" are drawn with a Unicode TrueType font instead (PDF_FONT, else
+# DejaVu Sans when installed). Embedding it is ~25x slower, so it is only used
+# for the documents that need it. Without one, the bulk export skips those
+# records and lists them in skipped.txt inside the ZIP.
+#
+#   python pdf_reports.py records.zip --residence Kibera
+
+import argparse
+import functools
+import multiprocessing
+import os
+import re
+import sqlite3
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+from io import BytesIO
+
+from fpdf import FPDF
+from fpdf.errors import FPDFUnicodeEncodingException
+
+from doses import dose_status_many
+from profiling import timed
+
+MEMBER_COLUMNS = ("id", "name", "dob", "gender", "residence", "phone", "schedule")
+
+UNICODE_FAMILY = "DejaVu"
+FONT_PATHS = (
+    "/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf",
+    "/usr/share/fonts/dejavu/DejaVuSans.ttf",
+    "/usr/share/fonts/TTF/DejaVuSans.ttf",
+    "/Library/Fonts/DejaVuSans.ttf",
+    "C:/Windows/Fonts/DejaVuSans.ttf",
+)
+
+
+# ============================
+# Fonts
+# ============================
+@functools.lru_cache(maxsize=1)
+def unicode_font():
+    # Path of the Unicode TrueType font, or None when there is none
+    for path in (os.environ.get("PDF_FONT"),) + FONT_PATHS:
+        if path and os.path.isfile(path):
+            return path
+    return None
+
+
+def _latin1(text):
+    try:
+        str(text).encode("latin-1")
+        return True
+    except UnicodeEncodeError:
+        return False
+
+
+def _font_family(pdf, texts):
+    # The family to draw texts with: core Arial when it can, else the Unicode
+    # font registered on pdf. With no Unicode font Arial is returned anyway
+    # and fpdf raises FPDFUnicodeEncodingException on the first text it
+    # cannot encode.
+    if all(_latin1(t) for t in texts) or unicode_font() is None:
+        return "Arial"
+    pdf.add_font(UNICODE_FAMILY, fname=unicode_font())
+    return UNICODE_FAMILY
+
+
+# ============================
+# Layout
+# ============================
+@timed("render")
+def child_record_pdf(child, vaccine_status):
+    pdf = FPDF()
+    pdf.add_page()
+    family = _font_family(pdf, [*child.values(), *(vaccine_status or {})])
+    pdf.set_font(family, size=12)
+    pdf.cell(190, 10, txt="Child Vaccination Full Record", ln=True, align='C')
+    pdf.ln(10)
+
+    # Include all fields
+    pdf.cell(0, 10, f"ID: {child['id']}", ln=True)
+    pdf.cell(0, 10, f"Name: {child['name']}", ln=True)
+    pdf.cell(0, 10, f"Date of Birth: {child['dob']}", ln=True)
+    pdf.cell(0, 10, f"Gender: {child['gender']}", ln=True)
+    pdf.cell(0, 10, f"Residence: {child['residence']}", ln=True)
+    pdf.cell(0, 10, f"Phone: {child['phone']}", ln=True)
+    pdf.cell(0, 10, f"Schedule: {child['schedule']}", ln=True)
+    pdf.ln(5)
+
+    pdf.set_font(family, size=11)
+    pdf.cell(0, 10, "Vaccine Status:", ln=True)
+
+    if vaccine_status:
+        for k, v in vaccine_status.items():
+            status = "Completed" if v else "Not Completed"
+            pdf.cell(0, 10, f"{status} {k}", ln=True)
+    else:
+        pdf.cell(0, 10, "No vaccine records found.", ln=True)
+
+    buffer = BytesIO()
+    pdf.output(buffer)
+    return buffer.getvalue()
+
+
+@timed("render")
+def members_list_pdf(rows):
+    # rows: (name, dob, gender, residence) tuples, one line per child. With
+    # no Unicode font, characters Arial lacks are printed as "?" rather than
+    # failing the whole list.
+    rows = list(rows)
+    pdf = FPDF()
+    pdf.add_page()
+    family = _font_family(pdf, [v for row in rows for v in row])
+    pdf.set_font(family, size=12)
+    pdf.cell(200, 10, txt="Registered Children Report", ln=True, align='C')
+
+    for name, dob, gender, residence in rows:
+        line = f"{name} | DOB: {dob} | Gender: {gender} | Residence: {residence}"
+        if family != UNICODE_FAMILY:
+            line = line.encode("latin-1", "replace").decode("latin-1")
+        pdf.cell(200, 10, txt=line, ln=True)
+
+    buffer = BytesIO()
+    pdf.output(buffer)
+    return buffer.getvalue()
+
+
+def record_filename(child):
+    safe = re.sub(r"[^A-Za-z0-9_-]+", "_", str(child["name"])).strip("_") or "child"
+    return f"{child['id']}_{safe}_full_record.pdf"
+
+
+def _render_chunk(chunk):
+    # Runs in a worker process: [(child, status), ...] -> ([(filename, bytes),
+    # ...], [(id, name), ...] of the records that could not be drawn)
+    documents, skipped = [], []
+    for child, status in chunk:
+        try:
+            documents.append((record_filename(child), child_record_pdf(child, status)))
+        except FPDFUnicodeEncodingException:
+            skipped.append((child["id"], child["name"]))
+    return documents, skipped
+
+
+# ============================
+# Bulk Export
+# ============================
+def iter_member_chunks(conn, residence=None, chunk_size=200, id_range=None):
+    # Keyset pagination on id, with each chunk's dose status fetched in one
+    # query; id_range=(lo, hi) limits it to lo < id <= hi (one shard)
+    last_id, hi = id_range if id_range else (0, None)
+    where = ""
+    if residence is not None:
+        where += " AND residence = ?"
+    if hi is not None:
+        where += " AND id <= ?"
+    extra = tuple(v for v in (residence, hi) if v is not None)
+    while True:
+        rows = conn.execute(
+            f"SELECT {', '.join(MEMBER_COLUMNS)} FROM members WHERE id > ?{where} ORDER BY id LIMIT ?",
+            (last_id,) + extra + (chunk_size,),
+        ).fetchall()
+        if not rows:
+            return
+        children = [dict(zip(MEMBER_COLUMNS, r)) for r in rows]
+        statuses = dose_status_many(conn, [c["id"] for c in children])
+        yield [(c, statuses.get(c["id"], {})) for c in children]
+        last_id = rows[-1][0]
+
+
+def count_members(conn, residence=None):
+    if residence is None:
+        return conn.execute("SELECT COUNT(*) FROM members").fetchone()[0]
+    return conn.execute("SELECT COUNT(*) FROM members WHERE residence = ?", (residence,)).fetchone()[0]
+
+
+# Workers are spawned, not forked, so a caller with other threads never hands
+# them locks held mid-operation. Spawned workers re-import the caller's
+# __main__, which under Streamlit is the app script: the app's background
+# jobs therefore run this module as a script (main() below) instead.
+POOL_CONTEXT = multiprocessing.get_context("spawn")
+
+
+def bulk_export(db_path, zip_path, residence=None, chunk_size=200, workers=None, progress=None):
+    # Writes one PDF per child into zip_path; progress(done, total) is called
+    # after every chunk. Returns (documents written, [(id, name), ...] of the
+    # records skipped).
+    workers = workers or os.cpu_count() or 1
+    conn = sqlite3.connect(db_path)
+    total = count_members(conn, residence)
+    written, skipped = 0, []
+    tmp_path = f"{zip_path}.part"
+
+    try:
+        with zipfile.ZipFile(tmp_path, "w", compression=zipfile.ZIP_STORED) as zf, \
+                ProcessPoolExecutor(max_workers=workers, mp_context=POOL_CONTEXT) as pool:
+            pending = []
+            for chunk in iter_member_chunks(conn, residence, chunk_size):
+                pending.append(pool.submit(_render_chunk, chunk))
+                # Keep a bounded number of chunks in flight, write in order
+                while len(pending) >= 2 * workers:
+                    written += _write_chunk(zf, pending.pop(0).result(), skipped)
+                    if progress:
+                        progress(written + len(skipped), total)
+            for future in pending:
+                written += _write_chunk(zf, future.result(), skipped)
+                if progress:
+                    progress(written + len(skipped), total)
+            _write_skipped(zf, skipped)
+        os.replace(tmp_path, zip_path)
+    finally:
+        conn.close()
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+    return written, skipped
+
+
+def _write_chunk(zf, rendered, skipped):
+    documents, chunk_skipped = rendered
+    for filename, data in documents:
+        zf.writestr(filename, data)
+    skipped.extend(chunk_skipped)
+    return len(documents)
+
+
+def _write_skipped(zf, skipped):
+    if skipped:
+        lines = [f"{member_id}\t{name}" for member_id, name in skipped]
+        zf.writestr("skipped.txt", "Records not rendered: names need a Unicode font (set PDF_FONT)\n"
+                    + "\n".join(lines) + "\n")
+
+
+def export_shard(db_path, zip_path, id_range, residence=None, chunk_size=200):
+    # One shard rendered and zipped entirely inside the calling process, for
+    # headless runs that split the member table across cores (see reports.py).
+    # Returns (documents written, [(id, name), ...] skipped).
+    conn = sqlite3.connect(db_path)
+    written, skipped = 0, []
+    tmp_path = f"{zip_path}.part"
+    try:
+        with zipfile.ZipFile(tmp_path, "w", compression=zipfile.ZIP_STORED) as zf:
+            for chunk in iter_member_chunks(conn, residence, chunk_size, id_range):
+                written += _write_chunk(zf, _render_chunk(chunk), skipped)
+            _write_skipped(zf, skipped)
+        os.replace(tmp_path, zip_path)
+    finally:
+        conn.close()
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+    return written, skipped
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Render every child's record PDF into a ZIP file.")
+    parser.add_argument("zip_path")
+    parser.add_argument("--db", default="members.db")
+    parser.add_argument("--residence")
+    parser.add_argument("--workers", type=int)
+    parser.add_argument("--progress", action="store_true",
+                        help="print '<done> <total>' after every chunk and 'skipped <id>' per skipped record")
+    args = parser.parse_args()
+
+    report = (lambda done, total: print(done, total, flush=True)) if args.progress else None
+    written, skipped = bulk_export(args.db, args.zip_path, args.residence, workers=args.workers, progress=report)
+    if args.progress:
+        for member_id, _ in skipped:
+            print("skipped", member_id, flush=True)
+        return
+    print(f"✅ {written} records written to {args.zip_path}")
+    for member_id, name in skipped:
+        print(f"⚠️ Skipped #{member_id} {name}: needs a Unicode font (set PDF_FONT)")
+
+
+if __name__ == "__main__":
+    main()
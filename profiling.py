@@ -0,0 +1,210 @@
+# Hot-path instrumentation
+#
+# timed(kind, name) works as a decorator or a context manager and records the
+# elapsed time in a process-wide registry, one series per (kind, name):
+#
+#   page         one Streamlit page, per rerun
+#   query        a database read or write helper
+#   deserialize  JSON / row-to-frame decoding
+#   schedule     due-date computation
+#   render       PDF and other document rendering
+#
+# Every series keeps cumulative Prometheus histogram buckets plus a rolling
+# window of recent samples for percentiles, so a regression under load shows
+# up within the last WINDOW calls. cprofile() captures one rerun with
+# cProfile on request. Set PROFILING=0 to turn recording off.
+
+import cProfile
+import io
+import json
+import marshal
+import os
+import pstats
+import threading
+import time
+from collections import deque
+from contextlib import ContextDecorator, contextmanager
+
+ENABLED = os.environ.get("PROFILING", "1") != "0"
+WINDOW = 1000
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+METRIC = "vaccination_app_latency_seconds"
+
+
+# ============================
+# Registry
+# ============================
+class Series:
+    __slots__ = ("count", "total", "buckets", "recent")
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.buckets = [0] * (len(BUCKETS) + 1)   # last one is +Inf
+        self.recent = deque(maxlen=WINDOW)
+
+    def observe(self, seconds):
+        self.count += 1
+        self.total += seconds
+        for i, bound in enumerate(BUCKETS):
+            if seconds <= bound:
+                self.buckets[i] += 1
+                break
+        else:
+            self.buckets[-1] += 1
+        self.recent.append(seconds)
+
+
+def _percentile(ordered, q):
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+class Registry:
+    def __init__(self):
+        self.started = time.time()
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, kind, name, seconds):
+        with self._lock:
+            series = self._series.get((kind, name))
+            if series is None:
+                series = self._series[(kind, name)] = Series()
+            series.observe(seconds)
+
+    def reset(self):
+        with self._lock:
+            self._series.clear()
+            self.started = time.time()
+
+    def snapshot(self):
+        # Plain dict for the admin page and the JSON dump; latencies in ms,
+        # percentiles over the rolling window
+        with self._lock:
+            items = [(k, s.count, s.total, sorted(s.recent)) for k, s in self._series.items()]
+        series = []
+        for (kind, name), count, total, recent in sorted(items):
+            series.append({
+                "kind": kind, "name": name, "count": count,
+                "mean_ms": round(1000 * total / count, 3),
+                "p50_ms": round(1000 * _percentile(recent, 0.50), 3),
+                "p95_ms": round(1000 * _percentile(recent, 0.95), 3),
+                "p99_ms": round(1000 * _percentile(recent, 0.99), 3),
+                "max_ms": round(1000 * recent[-1], 3),
+                "window": len(recent),
+            })
+        return {"uptime_seconds": round(time.time() - self.started, 1), "series": series}
+
+    def prometheus(self):
+        # Prometheus text exposition format, one histogram labelled by kind/name
+        with self._lock:
+            items = sorted((k, s.count, s.total, list(s.buckets)) for k, s in self._series.items())
+        lines = [
+            f"# HELP {METRIC} Latency of pages, queries, decoding, schedule math and rendering.",
+            f"# TYPE {METRIC} histogram",
+        ]
+        for (kind, name), count, total, buckets in items:
+            labels = f'kind="{_escape(kind)}",name="{_escape(name)}"'
+            cumulative = 0
+            for bound, n in zip(BUCKETS + ("+Inf",), buckets):
+                cumulative += n
+                lines.append(f'{METRIC}_bucket{{{labels},le="{bound}"}} {cumulative}')
+            lines.append(f"{METRIC}_sum{{{labels}}} {total:.6f}")
+            lines.append(f"{METRIC}_count{{{labels}}} {count}")
+        return "\n".join(lines) + "\n"
+
+
+def _escape(value):
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+metrics = Registry()
+
+
+# ============================
+# Timers
+# ============================
+class timed(ContextDecorator):
+    # @timed("query") names the series after the function;
+    # `with timed("page", menu):` times a block
+    def __init__(self, kind, name=None):
+        self.kind = kind
+        self.name = name
+        self._start = None
+
+    def __call__(self, fn):
+        if self.name is None:
+            self.name = f"{fn.__module__}.{fn.__qualname__}"
+        return super().__call__(fn)
+
+    def _recreate_cm(self):
+        # A fresh timer per call, so concurrent and nested calls don't share
+        # a start time
+        return timed(self.kind, self.name)
+
+    def __enter__(self):
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        if ENABLED:
+            metrics.observe(self.kind, self.name, time.perf_counter() - self._start)
+        return False
+
+
+# ============================
+# cProfile Capture
+# ============================
+@contextmanager
+def cprofile(enabled=True):
+    # Yields the running profiler, or None when not enabled
+    if not enabled:
+        yield None
+        return
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        yield profiler
+    finally:
+        profiler.disable()
+
+
+def profile_report(profiler, sort="cumulative", limit=40):
+    out = io.StringIO()
+    pstats.Stats(profiler, stream=out).strip_dirs().sort_stats(sort).print_stats(limit)
+    return out.getvalue()
+
+
+def profile_bytes(profiler):
+    # Same format as cProfile's -o output, for snakeviz / pstats
+    profiler.create_stats()
+    return marshal.dumps(profiler.stats)
+
+
+# ============================
+# Dumps
+# ============================
+_last_dump = 0.0
+
+
+def write_dump(directory):
+    # metrics.json and metrics.prom, replaced atomically
+    os.makedirs(directory, exist_ok=True)
+    for filename, text in (("metrics.json", json.dumps(metrics.snapshot(), indent=2)),
+                           ("metrics.prom", metrics.prometheus())):
+        path = os.path.join(directory, filename)
+        with open(f"{path}.part", "w", encoding="utf-8") as f:
+            f.write(text)
+        os.replace(f"{path}.part", path)
+
+
+def maybe_dump(directory, interval=15):
+    # write_dump() at most once per interval seconds
+    global _last_dump
+    now = time.monotonic()
+    if now - _last_dump < interval:
+        return False
+    _last_dump = now
+    write_dump(directory)
+    return True
+
@@ -0,0 +1,189 @@
+# Reaction log analytics
+#
+# Reactions are logged with free-text vaccine names ("opv", "Polio", "PCV10"),
+# so each row also stores the matching schedule vaccine (vaccine_key, '' when
+# nothing matches) and the dose it followed: the child's latest dose of that
+# vaccine given on or before the reaction date. Adverse-event rates divide
+# reaction counts by administered doses; both sides are SQL aggregates, and
+# the denominators come from the coverage tables (aggregates.py) rather than
+# the dose rows.
+
+import re
+
+from profiling import timed
+
+REACTION_COLUMNS = [
+    ("vaccine_key", "TEXT"),
+    ("dose_label", "TEXT"),
+]
+
+# The first covers the per-vaccine / per-dose counts, the second a child's
+# history and the join to members for residence counts
+REACTION_INDEXES = [
+    "CREATE INDEX IF NOT EXISTS idx_reactions_vaccine ON reactions (vaccine_key, dose_label, date)",
+    "CREATE INDEX IF NOT EXISTS idx_reactions_member ON reactions (member_id, date)",
+]
+
+# Common names for schedule vaccines, compared after _squash()
+ALIASES = {
+    "polio": "OPV", "oralpolio": "OPV", "bopv": "OPV",
+    "inactivatedpolio": "IPV",
+    "rota": "Rotavirus", "rotarix": "Rotavirus",
+    "pcv": "Pneumo_conj", "pcv10": "Pneumo_conj", "pcv13": "Pneumo_conj", "pneumococcal": "Pneumo_conj",
+    "penta": "DTwPHibHepB", "pentavalent": "DTwPHibHepB", "dpt": "DTwPHibHepB", "dtp": "DTwPHibHepB",
+    "yf": "Yellow Fever",
+    "mr": "Measles", "measlesrubella": "Measles", "mmr": "Measles",
+}
+
+RATE_GROUPS = {
+    "vaccine": ("vaccine",),
+    "dose": ("vaccine", "dose_label"),
+    "residence": ("residence",),
+}
+
+# The dose a reaction follows: the child's latest dose of the vaccine given on
+# or before the reaction date
+_DOSE_FOR = '''
+    SELECT d.dose_label FROM doses d
+    WHERE d.member_id = {member} AND d.vaccine = {vaccine}
+      AND d.given_date IS NOT NULL AND d.given_date <= {date}
+    ORDER BY d.given_date DESC LIMIT 1
+'''
+
+
+def _squash(text):
+    return re.sub(r"[^a-z0-9]", "", (text or "").lower())
+
+
+def vaccine_lookup(vaccines):
+    # {squashed name: schedule vaccine} for the schedule's vaccines and aliases
+    vaccines = list(dict.fromkeys(vaccines))
+    lookup = {_squash(alias): name for alias, name in ALIASES.items() if name in vaccines}
+    lookup.update({_squash(v): v for v in vaccines})
+    return lookup
+
+
+def normalize_vaccine(text, lookup):
+    # Schedule vaccine for a free-text name, or '' when unknown
+    return lookup.get(_squash(text), "")
+
+
+def create_reaction_indexes(conn, compiled):
+    # Adds the normalized columns to older databases and fills them in for
+    # rows logged before they existed. compiled may be a zero-argument
+    # callable, only invoked when rows need normalizing.
+    existing = {row[1] for row in conn.execute("PRAGMA table_info(reactions)")}
+    for name, kind in REACTION_COLUMNS:
+        if name not in existing:
+            conn.execute(f"ALTER TABLE reactions ADD COLUMN {name} {kind}")
+    for ddl in REACTION_INDEXES:
+        conn.execute(ddl)
+
+    # Older versions stored numpy int64 ids as 8-byte little-endian blobs,
+    # which never join to members or doses; those rows are matched again
+    blobs = conn.execute("SELECT id, member_id FROM reactions WHERE typeof(member_id) = 'blob'").fetchall()
+    conn.executemany("UPDATE reactions SET member_id = ?, vaccine_key = NULL WHERE id = ?",
+                     [(int.from_bytes(member_id, "little"), row_id) for row_id, member_id in blobs])
+
+    if not conn.execute("SELECT 1 FROM reactions WHERE vaccine_key IS NULL LIMIT 1").fetchone():
+        return 0
+    if callable(compiled):
+        compiled = compiled()
+    return normalize_reactions(conn, vaccine_lookup(compiled.vaccines))
+
+
+def normalize_reactions(conn, lookup, renormalize=False):
+    # Sets vaccine_key and dose_label on rows that have none (every row with
+    # renormalize, e.g. after a schedule change) in a single pass, with the
+    # spelling -> vaccine map in a temp table; returns the number of rows
+    # updated. The vaccine index is rebuilt afterwards rather than updated
+    # row by row.
+    where = "1" if renormalize else "reactions.vaccine_key IS NULL"
+    names = conn.execute(f"SELECT DISTINCT vaccine FROM reactions WHERE {where}").fetchall()
+    conn.execute("CREATE TEMP TABLE IF NOT EXISTS reaction_names (name TEXT PRIMARY KEY, vaccine_key TEXT)")
+    conn.execute("DELETE FROM temp.reaction_names")
+    conn.executemany("INSERT INTO temp.reaction_names VALUES (?, ?)",
+                     [(name, normalize_vaccine(name, lookup)) for name, in names])
+    conn.execute("DROP INDEX IF EXISTS idx_reactions_vaccine")
+    dose = _DOSE_FOR.format(member="reactions.member_id", vaccine="n.vaccine_key", date="reactions.date")
+    updated = conn.execute(f'''
+        UPDATE reactions
+        SET vaccine_key = n.vaccine_key,
+            dose_label = CASE WHEN n.vaccine_key != '' THEN ({dose}) END
+        FROM temp.reaction_names n
+        WHERE n.name IS reactions.vaccine AND {where}
+    ''').rowcount
+    conn.execute(REACTION_INDEXES[0])
+    conn.execute("DROP TABLE temp.reaction_names")
+    return updated
+
+
+# ============================
+# Writes
+# ============================
+@timed("query")
+def log_reaction(conn, lookup, member_id, vaccine, date, notes):
+    key = normalize_vaccine(vaccine, lookup)
+    dose = _DOSE_FOR.format(member="?", vaccine="?", date="?")
+    return conn.execute(f'''
+        INSERT INTO reactions (member_id, vaccine, date, notes, vaccine_key, dose_label)
+        VALUES (?, ?, ?, ?, ?, ({dose}))
+    ''', (int(member_id), vaccine, date, notes, key, int(member_id), key, date)).lastrowid
+
+
+# ============================
+# Reads
+# ============================
+@timed("query")
+def member_reactions(conn, member_id):
+    # (date, vaccine as entered, schedule vaccine, dose, notes), newest first
+    return conn.execute('''
+        SELECT date, vaccine, vaccine_key, dose_label, notes FROM reactions
+        WHERE member_id = ? ORDER BY date DESC, id DESC
+    ''', (int(member_id),)).fetchall()
+
+
+def _reaction_counts(conn, group):
+    if group == "residence":
+        sql = '''
+            SELECT COALESCE(m.residence, ''), COUNT(*)
+            FROM reactions r JOIN members m ON m.id = r.member_id
+            GROUP BY 1
+        '''
+    elif group == "dose":
+        # Grouped on the bare columns so the vaccine index covers it
+        sql = "SELECT vaccine_key, dose_label, COUNT(*) FROM reactions GROUP BY vaccine_key, dose_label"
+    else:
+        sql = "SELECT vaccine_key, COUNT(*) FROM reactions GROUP BY vaccine_key"
+    return {tuple(k or "" for k in r[:-1]): r[-1] for r in conn.execute(sql)}
+
+
+def _administered(conn, group):
+    if group == "residence":
+        sql = "SELECT residence, SUM(given) FROM coverage_residence GROUP BY 1"
+    elif group == "dose":
+        sql = "SELECT vaccine, dose_label, SUM(given) FROM coverage_vaccine GROUP BY 1, 2"
+    else:
+        sql = "SELECT vaccine, SUM(given) FROM coverage_vaccine GROUP BY 1"
+    return {tuple(r[:-1]): r[-1] for r in conn.execute(sql)}
+
+
+@timed("query")
+def reaction_rates(conn, group="vaccine"):
+    # Administered doses, reactions and reactions per 1,000 doses per vaccine,
+    # vaccine dose or residence; returns (columns, rows). Reactions that match
+    # no schedule vaccine (or no given dose) are listed with a blank key and
+    # no rate.
+    if group not in RATE_GROUPS:
+        raise ValueError(f"Unknown group: {group!r}")
+    reactions = _reaction_counts(conn, group)
+    administered = _administered(conn, group)
+    rows = []
+    for key in sorted(administered.keys() | reactions.keys()):
+        given = administered.get(key) or 0
+        count = reactions.get(key, 0)
+        if not given and not count:
+            continue
+        rate = round(1000 * count / given, 2) if given else None
+        rows.append((*key, given, count, rate))
+    return list(RATE_GROUPS[group]) + ["administered", "reactions", "per_1000"], rows
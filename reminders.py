@@ -0,0 +1,277 @@
+# SMS reminder job
+#
+# Finds every child with a dose due in the next N days (the same doses.due_date
+# values the dashboard counts) and texts the guardian once per child and due
+# date. Messages go out through an asyncio worker pool behind a token-bucket
+# rate limiter, with exponential backoff on 429/5xx/network errors. Each
+# dose is claimed in the reminders table ('sending') right before its message
+# goes out and marked 'sent' or 'failed' right after, so neither a restart nor
+# an overlapping run texts a guardian twice. Runs headless:
+#
+#   python reminders.py --days 3 --rate 10
+#   python reminders.py --base-url http://127.0.0.1:8099   # local fake Twilio
+
+import argparse
+import asyncio
+import os
+import random
+import time
+from datetime import date, datetime, timedelta
+
+from db import connect
+
+REMINDER_SCHEMA = [
+    '''
+    CREATE TABLE IF NOT EXISTS reminders (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        dose_id INTEGER NOT NULL UNIQUE,
+        member_id INTEGER NOT NULL,
+        phone TEXT,
+        status TEXT NOT NULL,
+        attempts INTEGER NOT NULL DEFAULT 0,
+        message_sid TEXT,
+        error TEXT,
+        updated_at TEXT
+    )
+    ''',
+    "CREATE INDEX IF NOT EXISTS idx_reminders_member ON reminders (member_id)",
+]
+
+# New doses and failed ones can be claimed; a 'sending' claim is only taken
+# over once it is older than STALE_CLAIM (its run died before recording)
+CLAIM_REMINDER = '''
+    INSERT INTO reminders (dose_id, member_id, phone, status, updated_at)
+    VALUES (?, ?, ?, 'sending', ?)
+    ON CONFLICT(dose_id) DO UPDATE SET
+        phone = excluded.phone,
+        status = 'sending',
+        updated_at = excluded.updated_at
+    WHERE reminders.status = 'failed' OR (reminders.status = 'sending' AND reminders.updated_at < ?)
+    RETURNING dose_id
+'''
+
+FINISH_REMINDER = '''
+    UPDATE reminders SET status = ?, attempts = attempts + ?, message_sid = ?, error = ?, updated_at = ?
+    WHERE dose_id = ?
+'''
+
+STALE_CLAIM = timedelta(hours=1)
+
+MESSAGE = ("Hello, {name} is due for {vaccines} on {due_date}. "
+           "Please visit your nearest clinic. - Child Vaccination Assistant")
+
+
+def create_reminders_table(conn):
+    for ddl in REMINDER_SCHEMA:
+        conn.execute(ddl)
+
+
+def to_e164(phone, country_code="254"):
+    # "0712 345 678" -> "+254712345678"; numbers in E.164 or with the country
+    # code are kept. Anything else (e.g. a local number without its leading
+    # 0) is ambiguous: None, and the reminder fails instead of guessing.
+    text = str(phone).strip()
+    digits = "".join(ch for ch in text if ch.isdigit())
+    if not digits:
+        return None
+    if text.startswith("+") or digits.startswith(country_code):
+        return f"+{digits}"
+    if digits.startswith("0"):
+        return f"+{country_code}{digits[1:]}"
+    return None
+
+
+def iter_due_reminders(conn, days, today=None, batch_size=1000):
+    # One row per (child, due date) with every pending dose that day; doses
+    # already reminded successfully are excluded
+    today = today or date.today()
+    cur = conn.execute('''
+        SELECT d.member_id, m.name, m.phone, d.due_date,
+               group_concat(d.vaccine || ' (' || d.dose_label || ')', ', '),
+               group_concat(d.id)
+        FROM doses d JOIN members m ON m.id = d.member_id
+        WHERE d.due_date BETWEEN ? AND ?
+          AND d.given_date IS NULL
+          AND m.phone IS NOT NULL AND m.phone != ''
+          AND NOT EXISTS (SELECT 1 FROM reminders r WHERE r.dose_id = d.id AND r.status = 'sent')
+        GROUP BY d.member_id, d.due_date
+    ''', (today.isoformat(), (today + timedelta(days=days)).isoformat()))
+    while True:
+        rows = cur.fetchmany(batch_size)
+        if not rows:
+            return
+        for member_id, name, phone, due_date, vaccines, dose_ids in rows:
+            yield {
+                "member_id": member_id,
+                "phone": phone,
+                "dose_ids": [int(i) for i in dose_ids.split(",")],
+                "body": MESSAGE.format(name=name, vaccines=vaccines, due_date=due_date),
+            }
+
+
+# ============================
+# Rate Limiting & Delivery
+# ============================
+class TokenBucket:
+    def __init__(self, rate, capacity=None):
+        self.rate = rate
+        self.capacity = capacity or max(1, rate)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+def is_retryable(error):
+    from twilio.base.exceptions import TwilioRestException
+    import aiohttp
+
+    if isinstance(error, TwilioRestException):
+        return error.status == 429 or error.status >= 500
+    return isinstance(error, (aiohttp.ClientError, asyncio.TimeoutError, ConnectionError))
+
+
+async def deliver(send, reminder, bucket, max_retries=4, base_delay=0.5):
+    # Returns (status, message_sid, error, attempts)
+    to = to_e164(reminder["phone"])
+    if to is None:
+        return "failed", None, f"invalid phone number {reminder['phone']!r}", 0
+    for attempt in range(1, max_retries + 2):
+        await bucket.acquire()
+        try:
+            return "sent", await send(to, reminder["body"]), None, attempt
+        except Exception as e:
+            if not is_retryable(e) or attempt > max_retries:
+                return "failed", None, str(e)[:500], attempt
+            await asyncio.sleep(base_delay * 2 ** (attempt - 1) * (0.5 + random.random()))
+
+
+def twilio_sender(client, from_number):
+    async def send(to, body):
+        message = await client.messages.create_async(to=to, from_=from_number, body=body)
+        return message.sid
+    return send
+
+
+def twilio_client(account_sid, auth_token, base_url=None):
+    # Must be called inside the running event loop (aiohttp session)
+    from twilio.http.async_http_client import AsyncTwilioHttpClient
+    from twilio.rest import Client
+
+    client = Client(account_sid, auth_token, http_client=AsyncTwilioHttpClient())
+    if base_url:
+        client.api.base_url = base_url
+    return client
+
+
+# ============================
+# Job
+# ============================
+def claim(conn, reminder, now=None):
+    # Claims every dose of one message, or none of them (another run holds
+    # some); returns whether the message may be sent
+    now = now or datetime.now()
+    stale = (now - STALE_CLAIM).isoformat(timespec="seconds")
+    now = now.isoformat(timespec="seconds")
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        claimed = [conn.execute(CLAIM_REMINDER, (dose_id, reminder["member_id"], reminder["phone"], now, stale))
+                   .fetchall() for dose_id in reminder["dose_ids"]]
+        if all(claimed):
+            conn.execute("COMMIT")
+            return True
+        conn.execute("ROLLBACK")
+        return False
+    except BaseException:
+        conn.execute("ROLLBACK")
+        raise
+
+
+def finish(conn, reminder, status, sid, error, attempts):
+    now = datetime.now().isoformat(timespec="seconds")
+    conn.execute("BEGIN IMMEDIATE")
+    conn.executemany(FINISH_REMINDER, [(status, attempts, sid, error, now, dose_id)
+                                       for dose_id in reminder["dose_ids"]])
+    conn.execute("COMMIT")
+
+
+async def run_reminders(db_path, days=3, send=None, rate=10.0, workers=20, max_retries=4,
+                        base_delay=0.5, today=None):
+    reader = connect(db_path)
+    writer = connect(db_path)
+    writer.isolation_level = None  # claims and results commit one message at a time
+    create_reminders_table(writer)
+
+    queue = asyncio.Queue(maxsize=workers * 4)
+    bucket = TokenBucket(rate)
+    summary = {"sent": 0, "failed": 0, "skipped": 0}
+
+    async def work():
+        while True:
+            reminder = await queue.get()
+            if reminder is None:
+                return
+            if not claim(writer, reminder):
+                summary["skipped"] += 1
+                continue
+            status, sid, error, attempts = await deliver(send, reminder, bucket, max_retries, base_delay)
+            finish(writer, reminder, status, sid, error, attempts)
+            summary[status] += 1
+
+    workers_tasks = [asyncio.create_task(work()) for _ in range(workers)]
+    try:
+        for reminder in iter_due_reminders(reader, days, today):
+            await queue.put(reminder)
+        for _ in workers_tasks:
+            await queue.put(None)
+        await asyncio.gather(*workers_tasks)
+    finally:
+        for task in workers_tasks:
+            task.cancel()
+        reader.close()
+        writer.close()
+    return summary
+
+
+async def _main(args):
+    client = twilio_client(args.account_sid, args.auth_token, args.base_url)
+    try:
+        return await run_reminders(
+            args.db, days=args.days, send=twilio_sender(client, args.from_number),
+            rate=args.rate, workers=args.workers, max_retries=args.retries,
+        )
+    finally:
+        await client.http_client.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Send SMS reminders for doses due in the next N days.")
+    parser.add_argument("--db", default="members.db")
+    parser.add_argument("--days", type=int, default=3)
+    parser.add_argument("--rate", type=float, default=10.0, help="messages per second")
+    parser.add_argument("--workers", type=int, default=20)
+    parser.add_argument("--retries", type=int, default=4)
+    parser.add_argument("--base-url", help="override the Twilio API URL, e.g. a local fake endpoint")
+    parser.add_argument("--account-sid", default=os.environ.get("TWILIO_SID", "your_twilio_account_sid"))
+    parser.add_argument("--auth-token", default=os.environ.get("TWILIO_AUTH_TOKEN", "your_twilio_auth_token"))
+    parser.add_argument("--from-number", default=os.environ.get("TWILIO_FROM", "+1234567890"))
+    args = parser.parse_args()
+
+    t0 = time.perf_counter()
+    summary = asyncio.run(_main(args))
+    print(f"✅ {summary['sent']} sent, {summary['failed']} failed, {summary['skipped']} claimed by another run "
+          f"in {time.perf_counter() - t0:.1f} s")
+
+
+if __name__ == "__main__":
+    main()
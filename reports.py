@@ -0,0 +1,162 @@
+# Report computations shared by the app and the command line
+#
+# Everything here takes a connection (or a database path, for work spread
+# over processes) and returns plain data or writes files, so the Streamlit
+# pages only render and cli.py can run the same reports from cron. Long jobs
+# split the member table into id-range shards of roughly equal size and run
+# one shard per worker process; each worker opens its own connection.
+
+import csv
+import os
+import shutil
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import closing
+from datetime import date
+
+from aggregates import coverage_by, coverage_counts
+from db import connect
+from doses import dose_status, overdue_members
+from next_due import OUTREACH_COLUMNS, iter_between
+from reactions import RATE_GROUPS, reaction_rates
+from search import member_by_id
+
+OVERDUE_COLUMNS = ("id", "name", "residence", "phone", "vaccine", "dose_label", "due_date")
+
+
+# ============================
+# Dashboard & Coverage
+# ============================
+def dashboard_summary(conn, today=None):
+    registered = conn.execute("SELECT COUNT(*) FROM members").fetchone()[0]
+    return {"registered": registered, **coverage_counts(conn, today)}
+
+
+def coverage_report(conn, today=None):
+    report = {"as_of": (today or date.today()).isoformat(), "summary": dashboard_summary(conn, today)}
+    for group in ("vaccine", "residence"):
+        columns, rows = coverage_by(conn, group, today)
+        report[f"by_{group}"] = [dict(zip(columns, r)) for r in rows]
+    return report
+
+
+def reaction_report(conn, groups=None):
+    # Adverse-event rates per vaccine, dose and/or residence
+    report = {}
+    for group in groups or RATE_GROUPS:
+        columns, rows = reaction_rates(conn, group)
+        report[f"by_{group}"] = [dict(zip(columns, r)) for r in rows]
+    return report
+
+
+def write_outreach(conn, f, start=None, end=None, residence=None):
+    # Outreach list (children whose next dose falls in the window) as CSV
+    # into an open text file; returns the row count
+    writer = csv.writer(f)
+    writer.writerow(OUTREACH_COLUMNS)
+    count = 0
+    for row in iter_between(conn, start, end, residence):
+        writer.writerow(row)
+        count += 1
+    return count
+
+
+def child_report(conn, member_id):
+    # (child dict, {"<vaccine> - <age>": bool}) or None
+    child = member_by_id(conn, member_id)
+    if child is None:
+        return None
+    return child, dose_status(conn, member_id)
+
+
+# ============================
+# Sharding
+# ============================
+def shard_bounds(conn, shards):
+    # [(lo, hi), ...] covering lo < id <= hi with about the same number of
+    # members in each shard
+    total = conn.execute("SELECT COUNT(*) FROM members").fetchone()[0]
+    if not total:
+        return []
+    shards = max(1, min(shards, total))
+    cuts = [0]
+    for i in range(1, shards):
+        cuts.append(conn.execute(
+            "SELECT id FROM members ORDER BY id LIMIT 1 OFFSET ?", (i * total // shards - 1,)
+        ).fetchone()[0])
+    cuts.append(conn.execute("SELECT MAX(id) FROM members").fetchone()[0])
+    return list(zip(cuts, cuts[1:]))
+
+
+def run_sharded(fn, db_path, jobs, workers=None):
+    # Calls fn(db_path, *job) for every job in worker processes; results come
+    # back in job order
+    workers = min(workers or os.cpu_count() or 1, len(jobs))
+    if workers <= 1:
+        return [fn(db_path, *job) for job in jobs]
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(fn, db_path, *job) for job in jobs]
+        return [f.result() for f in futures]
+
+
+# ============================
+# Overdue Lists
+# ============================
+def _overdue_shard(db_path, part_path, id_range, vaccine, dose_label, today):
+    with closing(connect(db_path)) as conn:
+        _, rows = overdue_members(conn, vaccine, dose_label, today, id_range)
+    with open(part_path, "w", newline="") as f:
+        csv.writer(f).writerows(rows)
+    return len(rows)
+
+
+def overdue_csv(db_path, out_path, vaccine=None, dose_label=None, today=None, shards=None, workers=None):
+    # Writes every overdue dose (optionally for one vaccine / dose) to a CSV
+    # ordered by child id; returns the number of rows
+    workers = workers or os.cpu_count() or 1
+    with closing(connect(db_path)) as conn:
+        bounds = shard_bounds(conn, shards or workers)
+    parts = [f"{out_path}.{i}.part" for i in range(len(bounds))]
+    tmp_path = f"{out_path}.part"
+    try:
+        counts = run_sharded(
+            _overdue_shard, db_path,
+            [(part, bound, vaccine, dose_label, today) for part, bound in zip(parts, bounds)], workers,
+        )
+        with open(tmp_path, "w", newline="") as out:
+            csv.writer(out).writerow(OVERDUE_COLUMNS)
+            for part in parts:
+                with open(part, newline="") as f:
+                    shutil.copyfileobj(f, out)
+        os.replace(tmp_path, out_path)
+    finally:
+        for path in parts + [tmp_path]:
+            if os.path.exists(path):
+                os.remove(path)
+    return sum(counts)
+
+
+# ============================
+# Bulk PDFs
+# ============================
+def _pdf_shard(db_path, zip_path, id_range, residence):
+    from pdf_reports import export_shard  # fpdf: only loaded by PDF jobs
+    return export_shard(db_path, zip_path, id_range, residence)
+
+
+def export_pdfs(db_path, out_dir, residence=None, shards=None, workers=None):
+    # One ZIP of child record PDFs per shard; returns [(zip path, records,
+    # [(id, name), ...] skipped)] for the shards that had any children
+    workers = workers or os.cpu_count() or 1
+    with closing(connect(db_path)) as conn:
+        bounds = shard_bounds(conn, shards or workers)
+    os.makedirs(out_dir, exist_ok=True)
+    paths = [os.path.join(out_dir, f"records_{i + 1:03d}.zip") for i in range(len(bounds))]
+    counts = run_sharded(_pdf_shard, db_path, [(p, b, residence) for p, b in zip(paths, bounds)], workers)
+
+    written = []
+    for path, (count, skipped) in zip(paths, counts):
+        if count or skipped:
+            written.append((path, count, skipped))
+        else:
+            os.remove(path)
+    return written
@@ -0,0 +1,241 @@
+# KEPI schedule model
+#
+# kepi_schedule.json is parsed once into immutable Dose objects with numeric
+# offsets (calendar months + days), so age strings such as "10 years 6 months"
+# are never re-parsed on the hot path. get_schedule() returns the cached
+# Schedule and reloads it when the file's mtime changes, so schedule updates
+# take effect without restarting the app.
+#
+# ScheduleRegistry serves several programmes side by side (the national
+# schedule, catch-up schedules, regional policies): kepi_schedule.json plus
+# every schedules/<name>.json, each assigned to children by name through
+# members.schedule.
+
+import calendar
+import functools
+import json
+import os
+import re
+import threading
+from datetime import date, datetime, timedelta
+
+from profiling import timed
+
+_UNIT_RE = re.compile(r"(\d+)\s*(day|week|month|year)s?", re.IGNORECASE)
+
+
+def parse_offset(text):
+    # "10 years 6 months" -> (126, 0); "6 weeks" -> (0, 42)
+    months = days = 0
+    matched = False
+    for amount, unit in _UNIT_RE.findall(text):
+        matched = True
+        amount = int(amount)
+        unit = unit.lower()
+        if unit == "year":
+            months += 12 * amount
+        elif unit == "month":
+            months += amount
+        elif unit == "week":
+            days += 7 * amount
+        else:
+            days += amount
+    if not matched:
+        raise ValueError(f"Unrecognised schedule age: {text!r}")
+    return months, days
+
+
+def add_offset(dob, months, days):
+    # Same rules as dateutil.relativedelta: add months, clip the day to the
+    # target month's length, then add days
+    year, month = divmod(dob.month - 1 + months, 12)
+    year += dob.year
+    month += 1
+    day = min(dob.day, calendar.monthrange(year, month)[1])
+    return date(year, month, day) + timedelta(days=days)
+
+
+def _as_date(value):
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, date):
+        return value
+    return date.fromisoformat(str(value))
+
+
+# ============================
+# Dose & Schedule
+# ============================
+class Dose:
+    __slots__ = ("vaccine", "label", "months", "days", "index")
+
+    def __init__(self, vaccine, label, months, days, index):
+        for name, value in zip(self.__slots__, (vaccine, label, months, days, index)):
+            object.__setattr__(self, name, value)
+
+    def __setattr__(self, name, value):
+        raise AttributeError("Dose is immutable")
+
+    def __delattr__(self, name):
+        raise AttributeError("Dose is immutable")
+
+    @property
+    def key(self):
+        return f"{self.vaccine} - {self.label}"
+
+    def due_date(self, dob):
+        return add_offset(_as_date(dob), self.months, self.days)
+
+    def __eq__(self, other):
+        return isinstance(other, Dose) and (self.vaccine, self.label) == (other.vaccine, other.label)
+
+    def __hash__(self):
+        return hash((self.vaccine, self.label))
+
+    def __repr__(self):
+        return f"Dose({self.vaccine!r}, {self.label!r}, months={self.months}, days={self.days})"
+
+
+class Schedule:
+    __slots__ = ("path", "mtime", "doses", "by_key", "_next", "_compiled")
+
+    def __init__(self, raw, path=None, mtime=None):
+        self.path = path
+        self.mtime = mtime
+        doses = []
+        for vaccine, labels in raw.items():
+            for label in labels:
+                doses.append(Dose(vaccine, label, *parse_offset(label), len(doses)))
+        self.doses = tuple(doses)
+        self.by_key = {d.key: d for d in self.doses}
+
+        # Next dose of the same vaccine, ordered by age
+        self._next = {}
+        for vaccine in raw:
+            series = sorted((d for d in self.doses if d.vaccine == vaccine), key=lambda d: (d.months, d.days))
+            for current, following in zip(series, series[1:] + [None]):
+                self._next[current] = following
+        self._compiled = None
+
+    def as_dict(self):
+        raw = {}
+        for d in self.doses:
+            raw.setdefault(d.vaccine, []).append(d.label)
+        return raw
+
+    def due_dates(self, dob):
+        # {dose: due date} for one child
+        dob = _as_date(dob)
+        return {d: add_offset(dob, d.months, d.days) for d in self.doses}
+
+    def dose_window(self, dose, dob=None):
+        # (opens, closes): the dose's age offset up to the next dose of the
+        # same vaccine (None for the last one), as (months, days) offsets or,
+        # given a date of birth, as dates
+        if isinstance(dose, str):
+            dose = self.by_key[dose]
+        following = self._next.get(dose)
+        if dob is None:
+            return (dose.months, dose.days), (following.months, following.days) if following else None
+        return dose.due_date(dob), following.due_date(dob) if following else None
+
+    def compiled(self):
+        # Offset arrays for vectorized due dates (see due_dates.py); numpy is
+        # only imported the first time this is needed
+        if self._compiled is None:
+            from due_dates import compile_schedule
+            self._compiled = compile_schedule(self.as_dict())
+        return self._compiled
+
+
+# ============================
+# Loading
+# ============================
+_cache = {}
+_lock = threading.Lock()
+
+
+@timed("deserialize")
+def load_schedule(path):
+    with open(path, "r") as f:
+        return Schedule(json.load(f), path=path, mtime=os.path.getmtime(path))
+
+
+def get_schedule(path="kepi_schedule.json"):
+    # Cached per path; reloaded when the file changes on disk
+    mtime = os.path.getmtime(path)
+    cached = _cache.get(path)
+    if cached is not None and cached.mtime == mtime:
+        return cached
+    with _lock:
+        cached = _cache.get(path)
+        if cached is None or cached.mtime != mtime:
+            cached = _cache[path] = load_schedule(path)
+        return cached
+
+
+# ============================
+# Registry
+# ============================
+DEFAULT_SCHEDULE = "kepi"
+SCHEDULE_DIR = "schedules"
+DUE_DATE_MEMO = 65_536  # (schedule, DOB) pairs
+
+
+class ScheduleRegistry:
+    def __init__(self, default_path="kepi_schedule.json", directory=SCHEDULE_DIR, memo_size=DUE_DATE_MEMO):
+        self.default_path = default_path
+        self.directory = directory
+        self._tables = (None, None)
+        self._lock = threading.Lock()
+        # Keyed by the loaded Schedule itself (hashed by identity): a reloaded
+        # file is a new snapshot, so its dates never mix with the old ones,
+        # which age out of the LRU
+        self._due_dates = functools.lru_cache(maxsize=memo_size)(self._compute_due_dates)
+
+    def paths(self):
+        # {name: path}; the directory is listed on every call so a new
+        # schedule file is picked up like an edited one
+        paths = {DEFAULT_SCHEDULE: self.default_path}
+        if os.path.isdir(self.directory):
+            for entry in sorted(os.listdir(self.directory)):
+                name, ext = os.path.splitext(entry)
+                if ext == ".json":
+                    paths.setdefault(name, os.path.join(self.directory, entry))
+        return paths
+
+    def names(self):
+        return list(self.paths())
+
+    def get(self, name=None):
+        path = self.paths().get(name or DEFAULT_SCHEDULE)
+        if path is None:
+            raise ValueError(f"Unknown schedule: {name!r}")
+        return get_schedule(path)
+
+    def schedules(self):
+        return {name: get_schedule(path) for name, path in self.paths().items()}
+
+    def tables(self):
+        # Union offset table and per-schedule dose masks (due_dates.py),
+        # compiled again only when a schedule file is added or changed
+        schedules = self.schedules()
+        stamp = tuple((name, s.path, s.mtime) for name, s in schedules.items())
+        with self._lock:
+            if self._tables[0] != stamp:
+                from due_dates import compile_schedules
+                self._tables = (stamp, compile_schedules({name: s.as_dict() for name, s in schedules.items()}))
+            return self._tables[1]
+
+    def due_dates(self, name, dob):
+        # ((vaccine, label, due ISO date), ...) for one child, memoized per
+        # (schedule, DOB); cohorts go through due_dates.mixed_due_date_matrix
+        schedule = self.get(name)
+        return self._due_dates(schedule, _as_date(dob))
+
+    def memo_info(self):
+        return self._due_dates.cache_info()
+
+    @staticmethod
+    def _compute_due_dates(schedule, dob):
+        return tuple((d.vaccine, d.label, d.due_date(dob).isoformat()) for d in schedule.doses)
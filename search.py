@@ -0,0 +1,204 @@
+# Indexed child lookup
+#
+# A trigram FTS5 index over name, residence and phone (kept in sync with
+# members by triggers) answers substring searches without scanning the table.
+# Queries shorter than a trigram fall back to indexed prefix matches. Results
+# are paginated and identify children by id, never by name.
+
+import sqlite3
+from contextlib import contextmanager
+
+from profiling import timed
+
+FTS_SCHEMA = [
+    '''
+    CREATE VIRTUAL TABLE members_fts USING fts5(
+        name, residence, phone,
+        content='members', content_rowid='id', tokenize='trigram'
+    )
+    ''',
+    '''
+    CREATE TRIGGER IF NOT EXISTS members_fts_ai AFTER INSERT ON members BEGIN
+        INSERT INTO members_fts (rowid, name, residence, phone)
+        VALUES (new.id, new.name, new.residence, new.phone);
+    END
+    ''',
+    '''
+    CREATE TRIGGER IF NOT EXISTS members_fts_ad AFTER DELETE ON members BEGIN
+        INSERT INTO members_fts (members_fts, rowid, name, residence, phone)
+        VALUES ('delete', old.id, old.name, old.residence, old.phone);
+    END
+    ''',
+    '''
+    CREATE TRIGGER IF NOT EXISTS members_fts_au AFTER UPDATE ON members BEGIN
+        INSERT INTO members_fts (members_fts, rowid, name, residence, phone)
+        VALUES ('delete', old.id, old.name, old.residence, old.phone);
+        INSERT INTO members_fts (rowid, name, residence, phone)
+        VALUES (new.id, new.name, new.residence, new.phone);
+    END
+    ''',
+]
+
+PREFIX_INDEXES = [
+    "CREATE INDEX IF NOT EXISTS idx_members_name ON members (name COLLATE NOCASE)",
+    "CREATE INDEX IF NOT EXISTS idx_members_phone ON members (phone COLLATE NOCASE)",
+    # Sort keys of the member table view (see member_page)
+    "CREATE INDEX IF NOT EXISTS idx_members_dob ON members (dob)",
+    "CREATE INDEX IF NOT EXISTS idx_members_residence ON members (COALESCE(residence, ''))",
+]
+
+# Sortable columns of the member table view -> SQL key (matching an index)
+SORT_KEYS = {
+    "name": "m.name COLLATE NOCASE",
+    "dob": "m.dob",
+    "residence": "COALESCE(m.residence, '')",
+    "id": "m.id",
+}
+PAGE_COLUMNS = ("id", "name", "dob", "gender", "residence", "phone")
+
+MIN_TRIGRAM = 3
+COUNT_CAP = 1000  # broad searches report "1000+" instead of counting every match
+COLUMNS = "m.id, m.name, m.dob, m.residence, m.phone"
+
+
+def create_search_index(conn):
+    for ddl in PREFIX_INDEXES:
+        conn.execute(ddl)
+    exists = conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'members_fts'"
+    ).fetchone()
+    if exists:
+        return True
+    try:
+        for ddl in FTS_SCHEMA:
+            conn.execute(ddl)
+    except sqlite3.OperationalError:
+        # SQLite built without FTS5 or older than 3.34 (no trigram tokenizer)
+        return False
+    conn.execute("INSERT INTO members_fts (members_fts) VALUES ('rebuild')")
+    return True
+
+
+def has_fts(conn):
+    return conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'members_fts'"
+    ).fetchone() is not None
+
+
+@contextmanager
+def deferred_fts(conn):
+    # For bulk inserts: the per-row insert trigger is dropped and the new
+    # members are indexed with one INSERT ... SELECT afterwards (about 5x
+    # faster). Must run inside the caller's transaction so the trigger drop is
+    # rolled back together with the rows on error.
+    if not has_fts(conn):
+        yield
+        return
+    last_id = conn.execute("SELECT COALESCE(MAX(id), 0) FROM members").fetchone()[0]
+    conn.execute("DROP TRIGGER IF EXISTS members_fts_ai")
+    yield
+    conn.execute(
+        "INSERT INTO members_fts (rowid, name, residence, phone) "
+        "SELECT id, name, residence, phone FROM members WHERE id > ?", (last_id,)
+    )
+    conn.execute(FTS_SCHEMA[1])
+
+
+# ============================
+# Queries
+# ============================
+def _plan(conn, query):
+    # (where, params, order) chosen so every shape of query is index-driven:
+    # short text walks the name index in order, short digits the phone index,
+    # and longer text probes the trigram index and returns rows in id order.
+    query = (query or "").strip()
+    name_order = "ORDER BY m.name COLLATE NOCASE, m.id"
+    if not query:
+        return "", (), name_order
+    if len(query) >= MIN_TRIGRAM and has_fts(conn):
+        phrase = '"' + query.replace('"', '""') + '"'
+        return "WHERE m.id IN (SELECT rowid FROM members_fts WHERE members_fts MATCH ?)", (phrase,), "ORDER BY m.id"
+    escaped = query.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+    if len(query) >= MIN_TRIGRAM:
+        pattern = f"%{escaped}%"
+        return ("WHERE m.name LIKE ? ESCAPE '\\' OR m.residence LIKE ? ESCAPE '\\' OR m.phone LIKE ? ESCAPE '\\'",
+                (pattern, pattern, pattern), "ORDER BY m.id")
+    if query.isdigit():
+        return "WHERE m.phone LIKE ? ESCAPE '\\'", (f"{escaped}%",), "ORDER BY m.phone COLLATE NOCASE, m.id"
+    return "WHERE m.name LIKE ? ESCAPE '\\'", (f"{escaped}%",), name_order
+
+
+@timed("query")
+def search_members(conn, query, page=0, page_size=25):
+    # Returns (rows, total) with rows as (id, name, dob, residence, phone);
+    # total is capped at COUNT_CAP
+    where, params, order = _plan(conn, query)
+    total = conn.execute(
+        f"SELECT COUNT(*) FROM (SELECT 1 FROM members m {where} LIMIT {COUNT_CAP})", params
+    ).fetchone()[0]
+    rows = conn.execute(
+        f"SELECT {COLUMNS} FROM members m {where} {order} LIMIT ? OFFSET ?",
+        params + (page_size, page * page_size),
+    ).fetchall()
+    return rows, total
+
+
+@timed("query")
+def member_by_id(conn, member_id):
+    cur = conn.execute("SELECT * FROM members WHERE id = ?", (int(member_id),))
+    row = cur.fetchone()
+    if row is None:
+        return None
+    return dict(zip([c[0] for c in cur.description], row))
+
+
+# ============================
+# Member Table View
+# ============================
+def _filters(conn, query, residence):
+    where, params, _ = _plan(conn, query)
+    clauses = [f"({where[len('WHERE '):]})"] if where else []
+    if residence is not None:
+        clauses.append("COALESCE(m.residence, '') = ?")
+        params += (residence,)
+    return clauses, params
+
+
+@timed("query")
+def member_page(conn, query="", residence=None, sort="name", descending=False, after=None, page_size=25):
+    # One window of the member table, sorted and filtered in SQL. Pagination
+    # is keyset-based: after is the cursor returned with the previous page,
+    # a (sort value, id) pair, so every page is an index seek no matter how
+    # deep. Returns (rows, next cursor or None).
+    key = SORT_KEYS[sort]
+    clauses, params = _filters(conn, query, residence)
+    op, direction = ("<", "DESC") if descending else (">", "ASC")
+    if after is not None:
+        # The plain comparison lets SQLite seek the index; the row value breaks ties
+        clauses.append(f"{key} {op}= ? AND ({key}, m.id) {op} (?, ?)")
+        params += (after[0], after[0], after[1])
+    where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+    rows = conn.execute(
+        f"SELECT {', '.join('m.' + c for c in PAGE_COLUMNS)}, {key} FROM members m {where} "
+        f"ORDER BY {key} {direction}, m.id {direction} LIMIT ?",
+        params + (page_size + 1,),
+    ).fetchall()
+    cursor = (rows[page_size - 1][-1], rows[page_size - 1][0]) if len(rows) > page_size else None
+    return [r[:-1] for r in rows[:page_size]], cursor
+
+
+@timed("query")
+def count_matching(conn, query="", residence=None):
+    # Capped at COUNT_CAP, like search_members
+    clauses, params = _filters(conn, query, residence)
+    where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+    return conn.execute(
+        f"SELECT COUNT(*) FROM (SELECT 1 FROM members m {where} LIMIT {COUNT_CAP})", params
+    ).fetchone()[0]
+
+
+@timed("query")
+def residences(conn):
+    return [r[0] for r in conn.execute(
+        "SELECT DISTINCT COALESCE(residence, '') FROM members ORDER BY COALESCE(residence, '')"
+    )]
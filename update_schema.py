@@ -1,6 +1,9 @@
 import sqlite3
 
-conn = sqlite3.connect("members.db")
+from db import connect, init_schema
+from schedule import load_schedule
+
+conn = connect("members.db")
 c = conn.cursor()
 
 # Add missing 'residence' column if it doesn't exist
@@ -10,5 +13,9 @@ try:
 except sqlite3.OperationalError as e:
     print("⚠️ Column already exists or another error:", e)
 
+# Move per-child vaccine JSON into the normalized doses table
+migrated = init_schema(conn, load_schedule("kepi_schedule.json").compiled())
+print(f"✅ Migrated {migrated} members into 'doses'.")
+
 conn.commit()
 conn.close()